@@ -42,7 +42,69 @@ class APIConfig(BaseConfig):
 
     # Cache Settings
     CACHE_MAX_SIZE: int = 1000
+    CACHE_MAX_BYTES: int = field(
+        default_factory=lambda: int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    )
     CACHE_TTL_HOURS: int = 24
+    # Stale-while-revalidate: between CACHE_TTL_HOURS (soft) and
+    # CACHE_HARD_TTL_HOURS an expired answer is still served while one
+    # background refresh regenerates it; past the hard TTL it is a miss
+    # (set the hard TTL to the soft one to turn this off)
+    CACHE_HARD_TTL_HOURS: int = field(
+        default_factory=lambda: int(os.getenv("CACHE_HARD_TTL_HOURS", "30"))
+    )
+    CACHE_REFRESH_WORKERS: int = 2  # Concurrent background refreshes per worker
+    CACHE_LOCK_STRIPES: int = 16
+    # memory (per worker), sqlite (shared by the workers on one host) or
+    # redis (shared by every node); see api/services/cache_backends.py
+    CACHE_BACKEND: str = field(default_factory=lambda: os.getenv("CACHE_BACKEND", "memory"))
+    CACHE_SQLITE_PATH: str = field(
+        default_factory=lambda: os.getenv("CACHE_SQLITE_PATH", "./query_cache.db")
+    )
+    CACHE_SQLITE_TOUCH_SECONDS: int = 60  # A hit refreshes an entry's LRU time at most this often
+    CACHE_SQLITE_COUNTER_FLUSH_SECONDS: int = 10  # Hit/miss counts are written at most this often
+    CACHE_REDIS_URL: str = field(
+        default_factory=lambda: os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+    )
+    CACHE_REDIS_PREFIX: str = field(default_factory=lambda: os.getenv("CACHE_REDIS_PREFIX", "rag:qc:"))
+    CACHE_REDIS_TIMEOUT: float = 0.5  # Seconds; a slow cache must not stall queries
+    # Compressed disk tier under the memory backend, so restarts and deploys
+    # keep their cached answers (point CACHE_DISK_PATH at a persistent volume)
+    CACHE_DISK_ENABLED: bool = field(
+        default_factory=lambda: os.getenv("CACHE_DISK_ENABLED", "true").lower() == "true"
+    )
+    CACHE_DISK_PATH: str = field(
+        default_factory=lambda: os.getenv("CACHE_DISK_PATH", "./query_cache_disk.db")
+    )
+    CACHE_DISK_MAX_SIZE: int = 20000
+    CACHE_DISK_MAX_BYTES: int = field(
+        default_factory=lambda: int(os.getenv("CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+    )
+    CACHE_DISK_QUEUE_SIZE: int = 1000  # Pending write-behind entries before writes are dropped
+    # Serve paraphrased questions the answer of the most similar cached
+    # question (cosine similarity of query embeddings, same filter and mode)
+    SEMANTIC_CACHE_ENABLED: bool = field(
+        default_factory=lambda: os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    )
+    SEMANTIC_CACHE_THRESHOLD: float = field(
+        default_factory=lambda: float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.93"))
+    )
+    SEMANTIC_CACHE_MAX_SIZE: int = 5000  # Indexed questions per worker
+    # Characters per token event when /query/stream replays a cached answer
+    # (0 sends the whole answer as one event)
+    STREAM_REPLAY_CHUNK_CHARS: int = field(
+        default_factory=lambda: int(os.getenv("STREAM_REPLAY_CHUNK_CHARS", "24"))
+    )
+    # Cache prewarming from query history (prewarm.py, POST /admin/cache/prewarm):
+    # the top questions of the last PREWARM_DAYS, scored by frequency with
+    # each ask decaying by half every PREWARM_HALF_LIFE_HOURS
+    PREWARM_LIMIT: int = 50
+    PREWARM_DAYS: int = 7
+    PREWARM_HALF_LIFE_HOURS: float = 48.0
+    PREWARM_CONCURRENCY: int = 4  # Questions answered at once
+    PREWARM_TOKEN_BUDGET: int = field(
+        default_factory=lambda: int(os.getenv("PREWARM_TOKEN_BUDGET", "200000"))
+    )
 
     # Google OAuth settings
     @property
@@ -2,7 +2,7 @@
 Database setup with SQLAlchemy.
 """
 from datetime import datetime
-from sqlalchemy import create_engine, Column, String, DateTime, Boolean, Text, Integer, text
+from sqlalchemy import create_engine, Column, String, DateTime, Boolean, Text, Integer, Float, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import uuid
@@ -48,9 +48,21 @@ class QueryHistory(Base):
     answer = Column(Text, nullable=False)
     citations_json = Column(Text, nullable=True)   # JSON array of Citation objects
     sources_used = Column(Text, nullable=True)      # JSON array of source names
+    table_json = Column(Text, nullable=True)        # Parsed repertorization table
     cached = Column(Boolean, default=False)
-    processing_time_ms = Column(String, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # Integer so latency can be aggregated; databases created before this
+    # keep their old text column unused (see create_tables)
+    processing_time_ms = Column("processing_ms", Integer, nullable=True)
+    # LLM usage; NULL for cache hits and queries answered without the LLM
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+    cached_tokens = Column(Integer, nullable=True)     # Prompt tokens served from the provider's cache
+    tokens_estimated = Column(Boolean, nullable=True)  # Counted locally, not reported by the provider
+    ttft_ms = Column(Float, nullable=True)             # Streaming only
+    generation_ms = Column(Float, nullable=True)
+    llm_key = Column(String, nullable=True)            # Redacted key that served the request
+    model = Column(String, nullable=True, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
 
 
 class SavedRubric(Base):
@@ -111,6 +123,20 @@ class Payment(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+class PrewarmRun(Base):
+    """A cache prewarming run and the questions it left warm."""
+    __tablename__ = "prewarm_runs"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    trigger = Column(String, nullable=False)           # "cli" or "admin"
+    status = Column(String, nullable=False, default="running")  # running, done or failed
+    questions_json = Column(Text, nullable=True)       # Normalized questions the run warmed
+    report_json = Column(Text, nullable=True)          # Counts, tokens and timing of the run
+    tokens_used = Column(Integer, nullable=True)
+    started_at = Column(DateTime, default=datetime.utcnow, index=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
 def create_tables():
     """Create all database tables, run migrations for existing DBs."""
     Base.metadata.create_all(bind=engine)
@@ -120,6 +146,20 @@ def create_tables():
         "ALTER TABLE users ADD COLUMN settings_json TEXT DEFAULT NULL",
         "ALTER TABLE users ADD COLUMN oauth_provider TEXT DEFAULT NULL",
         "ALTER TABLE query_history ADD COLUMN citations_json TEXT DEFAULT NULL",
+        "ALTER TABLE query_history ADD COLUMN table_json TEXT DEFAULT NULL",
+        "ALTER TABLE query_history ADD COLUMN prompt_tokens INTEGER DEFAULT NULL",
+        "ALTER TABLE query_history ADD COLUMN completion_tokens INTEGER DEFAULT NULL",
+        "ALTER TABLE query_history ADD COLUMN cached_tokens INTEGER DEFAULT NULL",
+        "ALTER TABLE query_history ADD COLUMN tokens_estimated BOOLEAN DEFAULT NULL",
+        "ALTER TABLE query_history ADD COLUMN ttft_ms FLOAT DEFAULT NULL",
+        "ALTER TABLE query_history ADD COLUMN generation_ms FLOAT DEFAULT NULL",
+        "ALTER TABLE query_history ADD COLUMN llm_key TEXT DEFAULT NULL",
+        "ALTER TABLE query_history ADD COLUMN model TEXT DEFAULT NULL",
+        "ALTER TABLE query_history ADD COLUMN processing_ms INTEGER DEFAULT NULL",
+        "UPDATE query_history SET processing_ms = CAST(processing_time_ms AS INTEGER) "
+        "WHERE processing_ms IS NULL AND processing_time_ms IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS ix_query_history_model ON query_history (model)",
+        "CREATE INDEX IF NOT EXISTS ix_query_history_created_at ON query_history (created_at)",
     ]
     with engine.connect() as conn:
         for stmt in migrations:
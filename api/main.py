@@ -21,6 +21,7 @@ from api.routers import (
     payments_router,
 )
 from api.services.rag_service import get_rag_service
+from api.services.cache_service import query_cache
 
 # Configure logging
 logging.basicConfig(
@@ -58,6 +59,7 @@ async def lifespan(app: FastAPI):
 
     # Shutdown
     logger.info("Shutting down ClinIQ API...")
+    query_cache.close()
 
 
 # Create FastAPI application
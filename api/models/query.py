@@ -2,7 +2,7 @@
 Query Pydantic models.
 """
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, Dict, List, Literal, Optional
 from pydantic import BaseModel, Field
 
 
@@ -11,6 +11,7 @@ class Citation(BaseModel):
     source: str
     page: Optional[int] = None
     excerpt: str
+    chunk_id: Optional[str] = None  # Book, page and chunk index of the cited chunk
 
 
 class QueryRequest(BaseModel):
@@ -18,6 +19,8 @@ class QueryRequest(BaseModel):
     question: str = Field(..., min_length=2, max_length=500)
     source_filter: Optional[List[str]] = None
     top_k: int = Field(default=3, ge=1, le=20)
+    # "analysis": table computed locally, LLM writes only the Analysis
+    mode: Optional[Literal["full", "analysis"]] = None
 
 
 class QueryResponse(BaseModel):
@@ -30,6 +33,8 @@ class QueryResponse(BaseModel):
     processing_time_ms: int
     cached: bool
     created_at: datetime
+    table: Optional[Dict[str, Any]] = None  # Parsed repertorization table
+    metadata: Optional[Dict[str, Any]] = None  # Context/token accounting for the request
 
 
 class SourcesResponse(BaseModel):
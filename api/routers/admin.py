@@ -2,14 +2,21 @@
 Admin endpoints for app settings and user management.
 """
 import json
+import threading
+from datetime import datetime, timedelta
 from pathlib import Path
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
 from pydantic import BaseModel
+from sqlalchemy import Integer, cast, func
 from sqlalchemy.orm import Session
 
-from api.database import get_db, User
+from api.database import get_db, SessionLocal, PrewarmRun, QueryHistory, User
 from api.dependencies import get_current_user, get_admin_user
+from api.services.cache_service import query_cache
+from api.services.rag_service import get_rag_service, RAGService
+from api.services import prewarm
+from src.index_version import bump_book_version
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
@@ -187,3 +194,201 @@ async def set_user_settings(
     user.settings_json = json.dumps(existing)
     db.commit()
     return {"user_id": user_id, "feature_flags": existing}
+
+
+# ── LLM provider health (admin only) ─────────────────────────────────────────
+
+@router.get("/llm-keys")
+async def llm_key_stats(
+    admin=Depends(get_admin_user),
+    rag_service: RAGService = Depends(get_rag_service),
+):
+    """Per-key health of the OpenRouter keys, hedging and stream guard counters."""
+    manager = rag_service.chain.openrouter_manager
+    return {
+        "model": rag_service.chain.model_name,
+        "keys": manager.get_stats() if manager else [],
+        "hedging": rag_service.chain.hedge_stats.get_stats(),
+        "stream_guard": rag_service.chain.guard_stats.get_stats(),
+    }
+
+
+# ── Query cache (admin only) ─────────────────────────────────────────────────
+
+class CacheInvalidation(BaseModel):
+    """Books and/or chunk IDs whose cached answers should be dropped."""
+    books: List[str] = []
+    chunk_ids: List[str] = []
+
+
+@router.post("/cache/invalidate")
+async def invalidate_cache(
+    request: CacheInvalidation,
+    admin=Depends(get_admin_user),
+):
+    """
+    Drop cached answers that cite the given books or chunks.
+
+    Use after re-ingesting or removing a book; answers citing other books
+    stay cached. Books are also given a new version, so answers held in
+    other workers' memory are dropped on their next lookup; chunk
+    invalidation reaches this worker and the shared backends only.
+    """
+    if not request.books and not request.chunk_ids:
+        raise HTTPException(status_code=400, detail="Provide books and/or chunk_ids")
+
+    removed = 0
+    if request.books:
+        for book in request.books:
+            bump_book_version(book)
+        removed += query_cache.invalidate_books(request.books)
+    if request.chunk_ids:
+        removed += query_cache.invalidate_chunks(request.chunk_ids)
+    return {"books": request.books, "chunk_ids": request.chunk_ids, "removed": removed}
+
+
+class PrewarmRequest(BaseModel):
+    """Limits of a prewarm run; unset fields use the PREWARM_* config."""
+    limit: Optional[int] = None
+    days: Optional[int] = None
+    concurrency: Optional[int] = None
+    token_budget: Optional[int] = None
+
+
+# One prewarm run at a time per worker
+_prewarm_lock = threading.Lock()
+
+
+def _run_prewarm(run_id: str, request: PrewarmRequest, rag_service: RAGService):
+    db = SessionLocal()
+    try:
+        run = db.query(PrewarmRun).filter(PrewarmRun.id == run_id).first()
+        prewarm.prewarm(
+            db, rag_service, "admin",
+            limit=request.limit,
+            days=request.days,
+            concurrency=request.concurrency,
+            token_budget=request.token_budget,
+            run=run,
+        )
+    finally:
+        db.close()
+        _prewarm_lock.release()
+
+
+@router.post("/cache/prewarm", status_code=202)
+async def start_prewarm(
+    request: PrewarmRequest,
+    background_tasks: BackgroundTasks,
+    admin=Depends(get_admin_user),
+    rag_service: RAGService = Depends(get_rag_service),
+    db: Session = Depends(get_db),
+):
+    """
+    Warm the answer cache with the most asked recent questions.
+
+    Questions from query history are ranked by frequency and recency and
+    the top ones not already cached are answered in the background, a
+    few at a time and within a token budget. Poll GET /admin/cache/prewarm
+    for the report and, a day later, its coverage.
+    """
+    if not _prewarm_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A prewarm run is already in progress")
+    try:
+        run = prewarm.start_run(db, "admin")
+    except Exception:
+        _prewarm_lock.release()
+        raise
+    background_tasks.add_task(_run_prewarm, run.id, request, rag_service)
+    return {"id": run.id, "status": run.status}
+
+
+@router.get("/cache/prewarm")
+async def prewarm_runs(
+    limit: int = Query(10, ge=1, le=100),
+    hours: int = Query(24, ge=1, le=168, description="Coverage window after each run"),
+    admin=Depends(get_admin_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Recent prewarm runs with their reports and coverage.
+
+    Coverage is the share of the queries in the `hours` after a run that
+    were cache hits on the questions it warmed.
+    """
+    return {"runs": [prewarm.run_summary(db, run, hours) for run in prewarm.recent_runs(db, limit)]}
+
+
+# ── LLM usage and latency (admin only) ───────────────────────────────────────
+
+USAGE_GROUPS = {
+    "day": func.date(QueryHistory.created_at),
+    "model": QueryHistory.model,
+    "user": QueryHistory.user_id,
+}
+
+
+@router.get("/usage")
+async def usage_stats(
+    days: int = Query(30, ge=1, le=365),
+    group_by: str = Query("day,model,user", description="Comma-separated subset of day, model, user"),
+    admin=Depends(get_admin_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Token usage and latency of stored queries, aggregated per group.
+
+    Cache hits are counted but carry no tokens or latency, so averages
+    cover LLM-answered queries only.
+    """
+    groups = [name.strip() for name in group_by.split(",") if name.strip()]
+    unknown = [name for name in groups if name not in USAGE_GROUPS]
+    if unknown or not groups:
+        raise HTTPException(status_code=400, detail=f"group_by must be a subset of {', '.join(USAGE_GROUPS)}")
+
+    columns = [USAGE_GROUPS[name].label(name) for name in groups]
+    since = datetime.utcnow() - timedelta(days=days)
+    rows = (
+        db.query(
+            *columns,
+            func.count(QueryHistory.id).label("queries"),
+            func.sum(cast(QueryHistory.cached, Integer)).label("cache_hits"),
+            func.sum(QueryHistory.prompt_tokens).label("prompt_tokens"),
+            func.sum(QueryHistory.completion_tokens).label("completion_tokens"),
+            func.sum(QueryHistory.cached_tokens).label("cached_tokens"),
+            func.avg(QueryHistory.ttft_ms).label("avg_ttft_ms"),
+            func.avg(QueryHistory.generation_ms).label("avg_generation_ms"),
+            func.max(QueryHistory.generation_ms).label("max_generation_ms"),
+        )
+        .filter(QueryHistory.created_at >= since)
+        .group_by(*columns)
+        .order_by(*columns)
+        .all()
+    )
+
+    emails = {}
+    if "user" in groups:
+        user_ids = {row.user for row in rows}
+        emails = dict(db.query(User.id, User.email).filter(User.id.in_(user_ids)).all())
+
+    items = []
+    for row in rows:
+        item = {name: getattr(row, name) for name in groups}
+        if "day" in item and item["day"] is not None:
+            item["day"] = str(item["day"])
+        if "user" in item:
+            item["email"] = emails.get(item["user"])
+        prompt_tokens = row.prompt_tokens or 0
+        item.update({
+            "queries": row.queries,
+            "cache_hits": row.cache_hits or 0,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": row.completion_tokens or 0,
+            "cached_tokens": row.cached_tokens or 0,
+            "cached_percent": round((row.cached_tokens or 0) / prompt_tokens * 100, 2) if prompt_tokens else 0,
+            "avg_ttft_ms": round(row.avg_ttft_ms, 1) if row.avg_ttft_ms is not None else None,
+            "avg_generation_ms": round(row.avg_generation_ms, 1) if row.avg_generation_ms is not None else None,
+            "max_generation_ms": round(row.max_generation_ms, 1) if row.max_generation_ms is not None else None,
+        })
+        items.append(item)
+    return {"days": days, "group_by": groups, "rows": items}
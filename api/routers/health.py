@@ -41,7 +41,8 @@ async def health_check():
         "components": {
             "rag": rag_details,
             "cache": {
-                "status": "healthy",
+                "status": "unhealthy" if "error" in cache_stats else "healthy",
+                "backend": cache_stats["backend"],
                 "size": cache_stats["size"],
                 "hit_rate": f"{cache_stats['hit_rate_percent']}%",
             },
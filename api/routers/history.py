@@ -27,8 +27,9 @@ class HistoryItemOut(BaseModel):
     answer: str
     citations: List[CitationOut] = []
     sources_used: List[str] = []
+    table: Optional[dict] = None
     cached: bool
-    processing_time_ms: Optional[str] = None
+    processing_time_ms: Optional[int] = None
     created_at: datetime
 
 class HistoryItemIn(BaseModel):
@@ -37,8 +38,9 @@ class HistoryItemIn(BaseModel):
     answer: str
     citations: List[dict] = []
     sources_used: List[str] = []
+    table: Optional[dict] = None
     cached: bool = False
-    processing_time_ms: Optional[str] = None
+    processing_time_ms: Optional[int] = None
 
 
 def _to_out(item: QueryHistory) -> HistoryItemOut:
@@ -54,12 +56,19 @@ def _to_out(item: QueryHistory) -> HistoryItemOut:
             sources = json.loads(item.sources_used)
         except Exception:
             pass
+    table = None
+    if item.table_json:
+        try:
+            table = json.loads(item.table_json)
+        except Exception:
+            pass
     return HistoryItemOut(
         id=item.id,
         question=item.question,
         answer=item.answer,
         citations=citations,
         sources_used=sources,
+        table=table,
         cached=item.cached or False,
         processing_time_ms=item.processing_time_ms,
         created_at=item.created_at,
@@ -101,6 +110,7 @@ def save_history_item(
         answer=body.answer,
         citations_json=json.dumps(body.citations) if body.citations else None,
         sources_used=json.dumps(body.sources_used) if body.sources_used else None,
+        table_json=json.dumps(body.table) if body.table else None,
         cached=body.cached,
         processing_time_ms=body.processing_time_ms,
     )
@@ -4,10 +4,12 @@ Query endpoints for RAG operations.
 import json
 import logging
 from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.orm import Session
 
 from api.models.query import (
@@ -19,14 +21,30 @@ from api.models.query import (
 )
 from api.services.rag_service import get_rag_service, RAGService
 from api.services.cache_service import query_cache
+from api.services.coalescing import query_flights, stream_flights
+from api.services.response_body import hit_body
 from api.dependencies import get_current_user
 from api.database import get_db, QueryHistory
+from api.config import api_config
 
 router = APIRouter(prefix="/query", tags=["Query"])
 
 
-def _save_history(db: Session, user_id: str, result: dict, cached: bool) -> str | None:
-    """Persist a completed query to the database. Returns the saved record's id."""
+def _save_history(
+    db: Session,
+    user_id: str,
+    result: dict,
+    cached: bool,
+    llm_key: Optional[str] = None,
+) -> str | None:
+    """
+    Persist a completed query to the database. Returns the saved record's id.
+
+    llm_key is the redacted key that answered (see RAGService.query()'s
+    served_by); it is recorded here only, never in responses or the cache.
+    """
+    # A cache hit replays a stored answer, so it carries no LLM usage of its own
+    usage = {} if cached else (result.get("metadata") or {}).get("usage") or {}
     try:
         item = QueryHistory(
             user_id=user_id,
@@ -34,8 +52,17 @@ def _save_history(db: Session, user_id: str, result: dict, cached: bool) -> str
             answer=result["answer"],
             citations_json=json.dumps(result.get("citations", [])),
             sources_used=json.dumps(result.get("sources_used", [])),
+            table_json=json.dumps(result["table"]) if result.get("table") else None,
             cached=cached,
-            processing_time_ms=str(result.get("processing_time_ms", 0)),
+            processing_time_ms=result.get("processing_time_ms", 0),
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+            cached_tokens=usage.get("cached_tokens"),
+            tokens_estimated=usage.get("estimated", False) if usage else None,
+            ttft_ms=usage.get("ttft_ms"),
+            generation_ms=usage.get("total_ms"),
+            llm_key=None if cached else llm_key,
+            model=usage.get("model"),
         )
         db.add(item)
         db.commit()
@@ -47,6 +74,91 @@ def _save_history(db: Session, user_id: str, result: dict, cached: bool) -> str
         return None
 
 
+async def _cached_answer(
+    request: QueryRequest,
+    mode: str,
+    rag_service: RAGService,
+) -> Tuple[Optional[dict], Optional[List[float]]]:
+    """
+    Look a question up in the cache: the exact question, then (if enabled) a paraphrase.
+
+    A stale hit (past the soft TTL) is returned as is, and a background
+    refresh of it is started.
+
+    Returns:
+        (cached response or None, the question's embedding if it was computed)
+    """
+    cached_response = await run_in_threadpool(query_cache.get, request.question, request.source_filter, mode)
+    embedding = None
+    if cached_response is None and query_cache.semantic is not None:
+        try:
+            embedding = await run_in_threadpool(rag_service.embed_query, request.question)
+            cached_response = await run_in_threadpool(query_cache.get_similar, embedding, request.source_filter, mode)
+        except ValueError:
+            pass  # Invalid question; the query itself reports it
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed: {e}")
+
+    if cached_response and query_cache.is_stale(cached_response):
+        # Serve the stale answer now; one background refresh replaces it
+        cached_question = cached_response.get("question") or request.question
+        query_cache.revalidate(
+            cached_question,
+            lambda: rag_service.query(
+                question=cached_question,
+                source_filter=request.source_filter,
+                top_k=request.top_k,
+                mode=mode,
+            ),
+            request.source_filter,
+            mode,
+        )
+    return cached_response, embedding
+
+
+def _cache_completed_stream(
+    events: Iterator[str],
+    request: QueryRequest,
+    mode: str,
+    embedding: Optional[List[float]],
+) -> Iterator[str]:
+    """
+    Pass a stream's events through and cache its answer if the stream runs to the end.
+
+    An answer the stream guard cut short is not cached, so a false stop
+    is not replayed to later askers.
+    """
+    answer = ""
+    citations = []
+    sources_used = []
+    done = None
+    for chunk in events:
+        yield chunk
+        data = json.loads(chunk)
+        if data.get("type") == "citations":
+            citations = data.get("citations", [])
+            sources_used = data.get("sources_used", [])
+        elif data.get("type") == "token":
+            answer += data.get("content", "")
+        elif data.get("type") == "done":
+            done = data
+    if done is None:
+        return
+    guard = ((done.get("metadata") or {}).get("usage") or {}).get("guard") or {}
+    if guard.get("stopped"):
+        return
+    query_cache.set(request.question, {
+        "id": done["id"],
+        "question": request.question,
+        "answer": answer or done.get("answer", ""),
+        "citations": citations,
+        "sources_used": done.get("sources_used", sources_used),
+        "processing_time_ms": done.get("processing_time_ms", 0),
+        "table": done.get("table"),
+        "metadata": done.get("metadata"),
+    }, request.source_filter, mode, embedding=embedding)
+
+
 @router.post("", response_model=QueryResponse)
 async def query_remedy(
     request: QueryRequest,
@@ -60,15 +172,28 @@ async def query_remedy(
     - **question**: The symptom or condition query (2-500 characters)
     - **source_filter**: Optional list of source books to search
     - **top_k**: Number of documents to retrieve (1-20, default 5)
+    - **mode**: "full" (LLM writes table and analysis) or "analysis"
+      (table computed locally, LLM writes only the analysis)
 
     Returns AI-generated remedy recommendations with citations.
-    Results are cached for 24 hours to improve response times.
+    Results are cached for 24 hours to improve response times, and
+    concurrent identical questions share one generation.
     """
+    mode = request.mode or api_config.ANSWER_MODE
+
     # Check cache first
-    cached_response = query_cache.get(request.question, request.source_filter)
+    cached_response, embedding = await _cached_answer(request, mode, rag_service)
 
     if cached_response:
-        response = QueryResponse(
+        _save_history(db, current_user.id, cached_response | {"question": request.question}, cached=True)
+        body = cached_response.get("cache_body")
+        if body:
+            # Rendered when cached; only the per-request fields are serialized here
+            return Response(
+                content=hit_body(body, request.question, cached_response.get("metadata"), datetime.utcnow()),
+                media_type="application/json",
+            )
+        return QueryResponse(
             id=cached_response["id"],
             question=request.question,
             answer=cached_response["answer"],
@@ -77,22 +202,34 @@ async def query_remedy(
             processing_time_ms=cached_response["processing_time_ms"],
             cached=True,
             created_at=datetime.utcnow(),
+            table=cached_response.get("table"),
+            metadata=cached_response.get("metadata"),
         )
-        _save_history(db, current_user.id, cached_response | {"question": request.question}, cached=True)
-        return response
 
-    try:
-        # Execute RAG query
+    def run_query() -> Tuple[dict, Optional[str]]:
+        served_by = {}
         result = rag_service.query(
             question=request.question,
             source_filter=request.source_filter,
             top_k=request.top_k,
+            mode=mode,
+            embedding=embedding,
+            served_by=served_by,
         )
+        query_cache.set(request.question, result, request.source_filter, mode, embedding=embedding)
+        return result, served_by.get("key")
 
-        # Cache the result
-        query_cache.set(request.question, result, request.source_filter)
+    try:
+        # Execute RAG query off the event loop; concurrent duplicates wait for the first
+        key = query_cache.cache_key(request.question, request.source_filter, mode)
+        (result, llm_key), shared = await query_flights.run(key, lambda: run_in_threadpool(run_query))
+        if shared:
+            metadata = dict(result.get("metadata") or {})
+            metadata["cache"] = {"match": "coalesced"}
+            result = result | {"question": request.question, "metadata": metadata}
 
-        _save_history(db, current_user.id, result, cached=False)
+        # A follower's answer cost no LLM call of its own
+        _save_history(db, current_user.id, result, cached=shared, llm_key=llm_key)
 
         return QueryResponse(
             id=result["id"],
@@ -101,8 +238,10 @@ async def query_remedy(
             citations=[Citation(**c) for c in result["citations"]],
             sources_used=result["sources_used"],
             processing_time_ms=result["processing_time_ms"],
-            cached=False,
+            cached=shared,
             created_at=datetime.utcnow(),
+            table=result.get("table"),
+            metadata=result.get("metadata"),
         )
 
     except ValueError as e:
@@ -130,22 +269,48 @@ async def query_remedy_stream(
     Returns an SSE stream with events:
     - `citations` — source citations (sent first)
     - `token` — individual LLM response tokens
-    - `done` — final event with query ID and processing time
+    - `table_header` — remedy columns, once the table header is complete
+    - `table_row` — one parsed symptom row (or the Total row)
+    - `analysis` — one line of the Analysis paragraph
+    - `done` — final event with query ID, processing time and parsed table
+
+    A cached answer is replayed as the same event sequence, in token
+    events of STREAM_REPLAY_CHUNK_CHARS characters, with `cached: true`
+    in the done event; a stream that completes fills the cache.
+    Concurrent identical questions share one generation: later requests
+    replay the events so far and then follow the stream live.
     """
     try:
         clean_question = request.question
         user_id = current_user.id
+        mode = request.mode or api_config.ANSWER_MODE
+        cached_response, embedding = await _cached_answer(request, mode, rag_service)
+        key = query_cache.cache_key(request.question, request.source_filter, mode)
+        served_by = {}
 
         def event_generator():
             full_text = ""
             citations_data = []
             sources_data = []
             done_data = {}
-            for chunk in rag_service.query_stream(
-                question=clean_question,
-                source_filter=request.source_filter,
-                top_k=request.top_k,
-            ):
+            if cached_response:
+                events = rag_service.replay_stream(cached_response, api_config.STREAM_REPLAY_CHUNK_CHARS)
+                shared = False
+            else:
+                events, shared = stream_flights.subscribe(key, lambda: _cache_completed_stream(
+                    rag_service.query_stream(
+                        question=clean_question,
+                        source_filter=request.source_filter,
+                        top_k=request.top_k,
+                        mode=mode,
+                        embedding=embedding,
+                        served_by=served_by,
+                    ),
+                    request,
+                    mode,
+                    embedding,
+                ))
+            for chunk in events:
                 yield f"data: {chunk}\n\n"
                 try:
                     data = json.loads(chunk)
@@ -166,7 +331,9 @@ async def query_remedy_stream(
                     "citations": citations_data,
                     "sources_used": done_data.get("sources_used", sources_data),
                     "processing_time_ms": done_data.get("processing_time_ms", 0),
-                }, cached=done_data.get("cached", False))
+                    "table": done_data.get("table"),
+                    "metadata": done_data.get("metadata"),
+                }, cached=done_data.get("cached", False) or shared, llm_key=served_by.get("key"))
                 if saved_id:
                     yield f"data: {json.dumps({'type': 'history_id', 'id': saved_id})}\n\n"
 
@@ -234,13 +401,19 @@ async def get_stats(
 @router.get("/cache-stats")
 async def get_cache_stats(
     current_user=Depends(get_current_user),
+    rag_service: RAGService = Depends(get_rag_service),
 ):
     """
     Get cache statistics.
 
-    Shows cache size, hit rate, and configuration.
+    Shows cache size, hit rate, and configuration, the share of prompt
+    tokens served from the LLM provider's prompt cache, and how many
+    requests joined an identical in-flight query.
     """
-    return query_cache.get_stats()
+    stats = query_cache.get_stats()
+    stats["prompt_cache"] = rag_service.chain.cache_stats.get_stats()
+    stats["coalescing"] = {"query": query_flights.stats(), "stream": stream_flights.stats()}
+    return stats
 
 
 @router.post("/cache-clear", status_code=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,839 @@
+"""
+Storage backends for the query cache.
+
+The in-process backend is private to one worker. The SQLite (WAL, one
+shared file) and Redis backends are shared by every worker and node that
+points at them, so hits and invalidation reach all of them. The tiered
+backend puts the in-process LRU over a compressed SQLite file on local
+disk, so a restarted worker starts with the answers cached before it;
+put CACHE_DISK_PATH on a persistent volume for it to survive a redeploy.
+
+The Redis backend needs `pip install redis`;
+benchmarks/fake_redis_server.py is a local stand-in for trying it.
+"""
+import heapq
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - optional dependency
+    redis = None
+
+from api.config import api_config
+
+logger = logging.getLogger(__name__)
+
+
+def serialize(response: Dict[str, Any]) -> bytes:
+    return json.dumps(response, default=str).encode()
+
+
+def deserialize(value: bytes) -> Dict[str, Any]:
+    # Compressed values are zlib streams; plain ones are JSON objects
+    if value[:1] != b"{":
+        value = zlib.decompress(value)
+    return json.loads(value)
+
+
+class CacheBackend(ABC):
+    """
+    Key-value store for cached responses with per-entry TTL.
+
+    Each entry may carry tags (e.g. "book:Phatak"); a reverse index from
+    tag to keys lets delete_tagged drop every entry with a given tag.
+    """
+
+    name = "base"
+    shared = False  # Whether other workers see the same entries
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the live entry for a key (counting a hit or miss), or None."""
+
+    @abstractmethod
+    def peek(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the live entry for a key without counting a hit or miss or refreshing its recency."""
+
+    @abstractmethod
+    def set(self, key: str, response: Dict[str, Any], ttl: float, tags: Iterable[str] = ()):
+        """Store a response for ttl seconds under the given tags."""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Remove one entry."""
+
+    @abstractmethod
+    def delete_tagged(self, tags: Iterable[str]) -> int:
+        """Remove every entry carrying any of the tags; returns how many were removed."""
+
+    @abstractmethod
+    def clear(self):
+        """Remove every entry."""
+
+    def purge_expired(self) -> int:
+        """Drop expired entries now; returns how many were removed."""
+        return 0
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """Entry count and hit/miss counters, plus backend-specific fields."""
+
+    def close(self):
+        pass
+
+
+class _Entry:
+    """A cached response with its expiry time, serialized size and tags."""
+
+    __slots__ = ("response", "expires_at", "size", "tags")
+
+    def __init__(self, response: Dict[str, Any], expires_at: float, size: int, tags: Tuple[str, ...] = ()):
+        self.response = response
+        self.expires_at = expires_at
+        self.size = size
+        self.tags = tags
+
+
+class _Stripe:
+    """
+    One lock-protected shard of the in-process cache.
+
+    Entries live in an OrderedDict kept in LRU order (oldest first), so a
+    hit and an eviction are both O(1). A min-heap of (expires_at, key)
+    lets expired entries be dropped from the top without a full scan;
+    heap items left behind by an overwrite or eviction are skipped. The
+    tag index maps each tag to the keys of live entries carrying it.
+    """
+
+    def __init__(self, max_size: int, max_bytes: int):
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.expiry_heap: List[Tuple[float, str]] = []
+        self.tags: Dict[str, Set[str]] = {}
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def add(self, key: str, entry: _Entry):
+        self.entries[key] = entry
+        self.bytes += entry.size
+        for tag in entry.tags:
+            self.tags.setdefault(tag, set()).add(key)
+        heapq.heappush(self.expiry_heap, (entry.expires_at, key))
+
+    def _untag(self, key: str, entry: _Entry):
+        self.bytes -= entry.size
+        for tag in entry.tags:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+    def remove(self, key: str) -> Optional[_Entry]:
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self._untag(key, entry)
+        return entry
+
+    def purge_expired(self, now: float):
+        heap = self.expiry_heap
+        while heap and heap[0][0] <= now:
+            expires_at, key = heapq.heappop(heap)
+            entry = self.entries.get(key)
+            if entry is not None and entry.expires_at == expires_at:
+                self.remove(key)
+                self.expirations += 1
+        # Drop stale heap items once they outnumber live entries
+        if len(heap) > 2 * len(self.entries) + 64:
+            self.expiry_heap = [(e.expires_at, k) for k, e in self.entries.items()]
+            heapq.heapify(self.expiry_heap)
+
+    def evict_to_fit(self, incoming: int):
+        while self.entries and (
+            len(self.entries) >= self.max_size or self.bytes + incoming > self.max_bytes
+        ):
+            key, entry = self.entries.popitem(last=False)
+            self._untag(key, entry)
+            self.evictions += 1
+            logger.debug(f"Evicted oldest cache entry: {key[:8]}...")
+
+
+class MemoryBackend(CacheBackend):
+    """
+    In-process LRU, private to one worker.
+
+    Keys hash to one of several independently locked stripes, each holding
+    an equal share of the entry count and byte budget. An entry's cost is
+    the size of its serialized JSON.
+
+    Expiry is proactive: every get() and set() first drops the expired
+    entries of its stripe (from the top of the expiry heap, so this is
+    O(1) while nothing has expired). Expired answers therefore free their
+    memory and tags as soon as traffic reaches the stripe, rather than
+    lingering until looked up by key or pushed out by eviction.
+    """
+
+    name = "memory"
+
+    def __init__(
+        self,
+        max_size: int = None,
+        max_bytes: int = None,
+        stripes: int = None,
+    ):
+        self.max_size = max_size or api_config.CACHE_MAX_SIZE
+        self.max_bytes = max_bytes or api_config.CACHE_MAX_BYTES
+        count = max(1, min(stripes or api_config.CACHE_LOCK_STRIPES, self.max_size))
+        # Round up so the stripes together hold at least max_size entries
+        self._stripes = [
+            _Stripe(-(-self.max_size // count), -(-self.max_bytes // count))
+            for _ in range(count)
+        ]
+
+    def _stripe(self, key: str) -> _Stripe:
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        stripe = self._stripe(key)
+        with stripe.lock:
+            # Drops this key too if it has expired
+            stripe.purge_expired(time.time())
+            entry = stripe.entries.get(key)
+            if entry is None:
+                stripe.misses += 1
+                return None
+            stripe.entries.move_to_end(key)
+            stripe.hits += 1
+            return entry.response
+
+    def peek(self, key: str) -> Optional[Dict[str, Any]]:
+        stripe = self._stripe(key)
+        with stripe.lock:
+            entry = stripe.entries.get(key)
+            if entry is None or entry.expires_at <= time.time():
+                return None
+            return entry.response
+
+    def set(self, key: str, response: Dict[str, Any], ttl: float, tags: Iterable[str] = ()):
+        stripe = self._stripe(key)
+        size = len(serialize(response))
+        if size > stripe.max_bytes:
+            logger.warning(f"Response of {size} bytes exceeds the cache budget, not cached")
+            return
+        now = time.time()
+        entry = _Entry(response, now + ttl, size, tuple(tags))
+        with stripe.lock:
+            stripe.purge_expired(now)
+            stripe.remove(key)
+            stripe.evict_to_fit(size)
+            stripe.add(key, entry)
+
+    def delete(self, key: str):
+        stripe = self._stripe(key)
+        with stripe.lock:
+            stripe.remove(key)
+
+    def delete_tagged(self, tags: Iterable[str]) -> int:
+        tags = list(tags)
+        removed = 0
+        for stripe in self._stripes:
+            with stripe.lock:
+                keys = set().union(*(stripe.tags.get(tag, ()) for tag in tags))
+                for key in keys:
+                    if stripe.remove(key) is not None:
+                        removed += 1
+        return removed
+
+    def clear(self):
+        for stripe in self._stripes:
+            with stripe.lock:
+                stripe.entries.clear()
+                stripe.expiry_heap.clear()
+                stripe.tags.clear()
+                stripe.bytes = 0
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        removed = 0
+        for stripe in self._stripes:
+            with stripe.lock:
+                before = len(stripe.entries)
+                stripe.purge_expired(now)
+                removed += before - len(stripe.entries)
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        self.purge_expired()
+        totals = {"size": 0, "bytes": 0, "hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "tags": 0}
+        for stripe in self._stripes:
+            with stripe.lock:
+                totals["size"] += len(stripe.entries)
+                totals["bytes"] += stripe.bytes
+                totals["hits"] += stripe.hits
+                totals["misses"] += stripe.misses
+                totals["evictions"] += stripe.evictions
+                totals["expirations"] += stripe.expirations
+                totals["tags"] += len(stripe.tags)
+        totals.update({
+            "max_size": self.max_size,
+            "max_bytes": self.max_bytes,
+            "stripes": len(self._stripes),
+        })
+        return totals
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    Cache in one SQLite file shared by every worker on the host.
+
+    WAL mode lets readers run alongside the single writer. Each thread
+    keeps its own connection. LRU order is the last access time; entries
+    beyond max_size or max_bytes are evicted oldest first on set. With
+    compress, values are stored zlib-compressed and the byte budget
+    counts compressed bytes. The file and its tables are created on first
+    use rather than on construction.
+
+    A hit is a plain read: the access time is only rewritten when it is
+    older than touch_seconds, and hit/miss counts are kept per worker and
+    added to the shared counters every counter_flush_seconds (and on any
+    write, stats() and close()).
+    """
+
+    name = "sqlite"
+    shared = True
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS query_cache (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            expires_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS ix_query_cache_expires_at ON query_cache (expires_at);
+        CREATE INDEX IF NOT EXISTS ix_query_cache_accessed_at ON query_cache (accessed_at);
+        CREATE TABLE IF NOT EXISTS query_cache_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS query_cache_tags (
+            tag TEXT NOT NULL,
+            key TEXT NOT NULL,
+            PRIMARY KEY (tag, key)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS ix_query_cache_tags_key ON query_cache_tags (key);
+        -- Evictions, expiry, deletes and clears all drop the entry's tags
+        CREATE TRIGGER IF NOT EXISTS query_cache_untag AFTER DELETE ON query_cache
+        BEGIN
+            DELETE FROM query_cache_tags WHERE key = old.key;
+        END;
+        """
+
+    def __init__(
+        self,
+        path: str = None,
+        max_size: int = None,
+        max_bytes: int = None,
+        compress: bool = False,
+        touch_seconds: float = None,
+        counter_flush_seconds: float = None,
+    ):
+        self.path = path or api_config.CACHE_SQLITE_PATH
+        self.max_size = max_size or api_config.CACHE_MAX_SIZE
+        self.max_bytes = max_bytes or api_config.CACHE_MAX_BYTES
+        self.compress = compress
+        self.touch_seconds = api_config.CACHE_SQLITE_TOUCH_SECONDS if touch_seconds is None else touch_seconds
+        self.counter_flush_seconds = (
+            api_config.CACHE_SQLITE_COUNTER_FLUSH_SECONDS if counter_flush_seconds is None else counter_flush_seconds
+        )
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+        self._counts_lock = threading.Lock()
+        self._counts: Dict[str, int] = {}  # Hits and misses not yet written
+        self._counts_flushed_at = time.monotonic()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(self.SCHEMA)
+                    self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    def _incr(self, conn: sqlite3.Connection, name: str, amount: int = 1):
+        conn.execute(
+            "INSERT INTO query_cache_counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount),
+        )
+
+    def _count(self, name: str):
+        """Count a hit or miss in memory, writing the totals once they are due."""
+        with self._counts_lock:
+            self._counts[name] = self._counts.get(name, 0) + 1
+            due = time.monotonic() - self._counts_flushed_at >= self.counter_flush_seconds
+        if due:
+            self._flush_counts(self._conn())
+
+    def _flush_counts(self, conn: sqlite3.Connection):
+        """Add the unwritten hit and miss counts to the shared counters."""
+        with self._counts_lock:
+            counts, self._counts = self._counts, {}
+            self._counts_flushed_at = time.monotonic()
+        try:
+            for name, amount in counts.items():
+                self._incr(conn, name, amount)
+        except Exception:
+            # Keep the counts for the next flush
+            with self._counts_lock:
+                for name, amount in counts.items():
+                    self._counts[name] = self._counts.get(name, 0) + amount
+            raise
+
+    def lookup(self, key: str, with_tags: bool = False) -> Optional[Tuple[Dict[str, Any], float, Tuple[str, ...]]]:
+        """
+        Return (response, expires_at, tags) for a live entry without counting a hit or miss.
+
+        Tags are only read when with_tags is set (otherwise empty), for
+        copying the entry into another backend.
+        """
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value, expires_at, accessed_at FROM query_cache WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        if now - row[2] >= self.touch_seconds:
+            # LRU order only needs to be roughly right; most hits stay read-only
+            conn.execute("UPDATE query_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        tags: Tuple[str, ...] = ()
+        if with_tags:
+            tags = tuple(tag for (tag,) in conn.execute("SELECT tag FROM query_cache_tags WHERE key = ?", (key,)))
+        return deserialize(row[0]), row[1], tags
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        found = self.lookup(key)
+        self._count("misses" if found is None else "hits")
+        return None if found is None else found[0]
+
+    def peek(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT value FROM query_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return None if row is None else deserialize(row[0])
+
+    def set(self, key: str, response: Dict[str, Any], ttl: float, tags: Iterable[str] = ()):
+        self.set_many([(key, response, time.time() + ttl, tuple(tags))])
+
+    def set_many(self, items: List[Tuple[str, Dict[str, Any], float, Tuple[str, ...]]]):
+        """Store (key, response, expires_at, tags) items in one transaction."""
+        now = time.time()
+        rows = []
+        tag_rows = []
+        for key, response, expires_at, tags in items:
+            value = serialize(response)
+            if self.compress:
+                value = zlib.compress(value, 6)
+            if len(value) > self.max_bytes:
+                logger.warning(f"Response of {len(value)} bytes exceeds the cache budget, not cached")
+                continue
+            rows.append((key, value, len(value), expires_at, now))
+            tag_rows.extend((tag, key) for tag in tags)
+        if not rows:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # REPLACE does not fire delete triggers, so drop old tags first
+            conn.executemany("DELETE FROM query_cache_tags WHERE key = ?", [row[:1] for row in rows])
+            conn.executemany(
+                "INSERT OR REPLACE INTO query_cache (key, value, size, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.executemany("INSERT OR IGNORE INTO query_cache_tags (tag, key) VALUES (?, ?)", tag_rows)
+            expired = conn.execute("DELETE FROM query_cache WHERE expires_at <= ?", (now,)).rowcount
+            if expired:
+                self._incr(conn, "expirations", expired)
+            self._evict(conn)
+            # Already in a write transaction, so the counts ride along
+            self._flush_counts(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _evict(self, conn: sqlite3.Connection):
+        count, nbytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM query_cache").fetchone()
+        evicted = 0
+        if count > self.max_size:
+            evicted += conn.execute(
+                "DELETE FROM query_cache WHERE key IN "
+                "(SELECT key FROM query_cache ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_size,),
+            ).rowcount
+        if nbytes > self.max_bytes:
+            # Oldest entries until the bytes freed cover the excess
+            evicted += conn.execute(
+                "DELETE FROM query_cache WHERE key IN ("
+                " SELECT key FROM ("
+                "  SELECT key, size, SUM(size) OVER (ORDER BY accessed_at, key) AS freed FROM query_cache"
+                " ) WHERE freed - size < ?)",
+                (nbytes - self.max_bytes,),
+            ).rowcount
+        if evicted:
+            self._incr(conn, "evictions", evicted)
+
+    def delete(self, key: str):
+        self._conn().execute("DELETE FROM query_cache WHERE key = ?", (key,))
+
+    def delete_tagged(self, tags: Iterable[str]) -> int:
+        tags = list(tags)
+        if not tags:
+            return 0
+        placeholders = ", ".join("?" * len(tags))
+        return self._conn().execute(
+            f"DELETE FROM query_cache WHERE key IN (SELECT key FROM query_cache_tags WHERE tag IN ({placeholders}))",
+            tags,
+        ).rowcount
+
+    def clear(self):
+        self._conn().execute("DELETE FROM query_cache")
+
+    def purge_expired(self) -> int:
+        conn = self._conn()
+        removed = conn.execute("DELETE FROM query_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+        if removed:
+            self._incr(conn, "expirations", removed)
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        self._flush_counts(conn)
+        self.purge_expired()
+        size, nbytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM query_cache").fetchone()
+        counters = dict(conn.execute("SELECT name, value FROM query_cache_counters").fetchall())
+        return {
+            "size": size,
+            "bytes": nbytes,
+            "max_size": self.max_size,
+            "max_bytes": self.max_bytes,
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+            "expirations": counters.get("expirations", 0),
+            "path": self.path,
+            "compressed": self.compress,
+        }
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None and self._counts:
+            conn = self._conn()
+        if conn is not None:
+            try:
+                self._flush_counts(conn)
+            except sqlite3.Error as e:
+                logger.warning(f"Could not write cache hit/miss counts: {e}")
+            conn.close()
+            self._local.conn = None
+
+
+class RedisBackend(CacheBackend):
+    """
+    Cache in Redis (or any server speaking the Redis protocol).
+
+    Entries are stored under a key prefix with a native TTL, and
+    eviction is left to the server's maxmemory policy. Hit and miss
+    counters are shared counters on the server. Each tag is a set of
+    cache keys that expires with the newest entry added to it; keys of
+    entries the server has since evicted are skipped harmlessly.
+    """
+
+    name = "redis"
+    shared = True
+
+    def __init__(self, url: str = None, prefix: str = None, client: Any = None):
+        if client is None:
+            if redis is None:
+                raise ImportError("CACHE_BACKEND=redis requires the redis package (pip install redis)")
+            client = redis.Redis.from_url(
+                url or api_config.CACHE_REDIS_URL,
+                protocol=2,
+                socket_timeout=api_config.CACHE_REDIS_TIMEOUT,
+                socket_connect_timeout=api_config.CACHE_REDIS_TIMEOUT,
+            )
+        self.client = client
+        self.prefix = prefix or api_config.CACHE_REDIS_PREFIX
+        self._entries = f"{self.prefix}e:"
+        self._counters = f"{self.prefix}c:"
+        self._tags = f"{self.prefix}t:"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.client.get(self._entries + key)
+        self.client.incr(self._counters + ("misses" if value is None else "hits"))
+        return None if value is None else deserialize(value)
+
+    def peek(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.client.get(self._entries + key)
+        return None if value is None else deserialize(value)
+
+    def set(self, key: str, response: Dict[str, Any], ttl: float, tags: Iterable[str] = ()):
+        ttl_ms = max(1, int(ttl * 1000))
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(self._entries + key, serialize(response), px=ttl_ms)
+        for tag in tags:
+            pipe.sadd(self._tags + tag, key)
+            pipe.pexpire(self._tags + tag, ttl_ms)
+        pipe.execute()
+
+    def delete(self, key: str):
+        self.client.delete(self._entries + key)
+
+    def delete_tagged(self, tags: Iterable[str]) -> int:
+        tag_keys = [self._tags + tag for tag in tags]
+        keys = set()
+        for tag_key in tag_keys:
+            keys.update(self.client.smembers(tag_key))
+        entry_keys = [self._entries + key.decode() for key in keys]
+        removed = 0
+        for start in range(0, len(entry_keys), 500):
+            removed += self.client.delete(*entry_keys[start:start + 500])
+        if tag_keys:
+            self.client.delete(*tag_keys)
+        return removed
+
+    def _keys(self) -> List[bytes]:
+        return list(self.client.scan_iter(match=self._entries + "*", count=500))
+
+    def clear(self):
+        keys = self._keys() + list(self.client.scan_iter(match=self._tags + "*", count=500))
+        for start in range(0, len(keys), 500):
+            self.client.delete(*keys[start:start + 500])
+
+    def stats(self) -> Dict[str, Any]:
+        hits, misses = self.client.mget(self._counters + "hits", self._counters + "misses")
+        return {
+            "size": len(self._keys()),
+            "hits": int(hits or 0),
+            "misses": int(misses or 0),
+            "prefix": self.prefix,
+        }
+
+    def close(self):
+        self.client.close()
+
+
+class TieredBackend(CacheBackend):
+    """
+    In-process LRU over a compressed SQLite file on local disk.
+
+    A memory miss reads through to disk and promotes the entry with its
+    remaining TTL. Sets go to memory at once and reach disk from a
+    background writer (write-behind), so a query never waits on disk. If
+    the writer falls behind by queue_size entries, further writes are
+    dropped from the disk tier only. Deletes and clears apply to both
+    tiers immediately, and cancel queued writes for the keys they remove.
+    """
+
+    name = "memory+disk"
+    WRITE_BATCH = 64  # Queued writes committed per disk transaction
+    CLOSE_TIMEOUT = 5.0  # Seconds close() waits to queue the stop signal, then for the writer
+
+    def __init__(
+        self,
+        memory: Optional[MemoryBackend] = None,
+        disk: Optional[SQLiteBackend] = None,
+        queue_size: int = None,
+    ):
+        self.memory = memory or MemoryBackend()
+        self.disk = disk or SQLiteBackend(
+            path=api_config.CACHE_DISK_PATH,
+            max_size=api_config.CACHE_DISK_MAX_SIZE,
+            max_bytes=api_config.CACHE_DISK_MAX_BYTES,
+            compress=True,
+        )
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self.dropped_writes = 0
+        # key -> (sequence number, tags) of its newest queued write
+        self._pending: Dict[str, Tuple[int, Tuple[str, ...]]] = {}
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # Orders disk writes against deletes
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size or api_config.CACHE_DISK_QUEUE_SIZE)
+        self._writer = threading.Thread(target=self._write_behind, name="cache-disk-writer", daemon=True)
+        self._writer.start()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        response = self.memory.get(key)
+        if response is not None:
+            return response
+        try:
+            found = self.disk.lookup(key, with_tags=True)
+        except sqlite3.Error as e:
+            logger.warning(f"Disk cache read failed: {e}")
+            found = None
+        with self._lock:
+            if found is None:
+                self.disk_misses += 1
+                return None
+            self.disk_hits += 1
+        response, expires_at, tags = found
+        # Keep the tags, so tag invalidation also reaches the promoted copy
+        self.memory.set(key, response, expires_at - time.time(), tags)
+        return response
+
+    def peek(self, key: str) -> Optional[Dict[str, Any]]:
+        response = self.memory.peek(key)
+        if response is not None:
+            return response
+        try:
+            return self.disk.peek(key)
+        except sqlite3.Error as e:
+            logger.warning(f"Disk cache read failed: {e}")
+            return None
+
+    def set(self, key: str, response: Dict[str, Any], ttl: float, tags: Iterable[str] = ()):
+        tags = tuple(tags)
+        self.memory.set(key, response, ttl, tags)
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            try:
+                self._queue.put_nowait((key, response, time.time() + ttl, tags, seq))
+            except queue.Full:
+                self.dropped_writes += 1
+                return
+            self._pending[key] = (seq, tags)
+
+    def _write_behind(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.WRITE_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self._write_lock:
+                    with self._lock:
+                        # Skip writes superseded, deleted or cleared since they were queued
+                        live = [
+                            item for item in batch
+                            if item and self._pending.get(item[0], (None,))[0] == item[4]
+                        ]
+                        for item in live:
+                            del self._pending[item[0]]
+                    if live:
+                        self.disk.set_many([item[:4] for item in live])
+            except Exception as e:
+                logger.warning(f"Disk cache write failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if None in batch:
+                return
+
+    def flush(self):
+        """Block until every queued write has reached disk."""
+        self._queue.join()
+
+    def delete(self, key: str):
+        self.memory.delete(key)
+        with self._write_lock:
+            with self._lock:
+                self._pending.pop(key, None)
+            self.disk.delete(key)
+
+    def delete_tagged(self, tags: Iterable[str]) -> int:
+        tags = set(tags)
+        removed = self.memory.delete_tagged(tags)
+        with self._write_lock:
+            with self._lock:
+                for key in [key for key, (_, key_tags) in self._pending.items() if tags.intersection(key_tags)]:
+                    del self._pending[key]
+            # Memory mostly holds a subset of disk, so the larger count approximates distinct answers
+            removed = max(removed, self.disk.delete_tagged(tags))
+        return removed
+
+    def clear(self):
+        self.memory.clear()
+        with self._write_lock:
+            with self._lock:
+                self._pending.clear()
+            self.disk.clear()
+
+    def purge_expired(self) -> int:
+        return self.memory.purge_expired() + self.disk.purge_expired()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.memory.stats()
+        disk = self.disk.stats()
+        with self._lock:
+            stats.update({
+                "memory_hits": stats["hits"],
+                "hits": stats["hits"] + self.disk_hits,
+                "misses": self.disk_misses,
+                "disk": {
+                    "size": disk["size"],
+                    "bytes": disk["bytes"],
+                    "max_size": disk["max_size"],
+                    "max_bytes": disk["max_bytes"],
+                    "hits": self.disk_hits,
+                    "evictions": disk["evictions"],
+                    "pending_writes": self._queue.qsize(),
+                    "dropped_writes": self.dropped_writes,
+                    "path": disk["path"],
+                },
+            })
+        return stats
+
+    def close(self):
+        # Never let a stuck or dead writer hang shutdown; queued writes are then lost
+        if self._writer.is_alive():
+            try:
+                self._queue.put(None, timeout=self.CLOSE_TIMEOUT)
+            except queue.Full:
+                logger.warning("Disk cache writer is not draining its queue; pending writes are dropped")
+            else:
+                self._writer.join(timeout=self.CLOSE_TIMEOUT)
+                if self._writer.is_alive():
+                    logger.warning("Disk cache writer did not finish within the close timeout")
+        self.disk.close()
+
+
+def create_cache_backend(name: Optional[str] = None) -> CacheBackend:
+    """
+    Build the backend named by CACHE_BACKEND (memory, sqlite or redis).
+
+    The memory backend gets a disk tier underneath when CACHE_DISK_ENABLED.
+    """
+    name = (name or api_config.CACHE_BACKEND).lower()
+    if name == "memory":
+        return TieredBackend() if api_config.CACHE_DISK_ENABLED else MemoryBackend()
+    if name == "sqlite":
+        return SQLiteBackend()
+    if name == "redis":
+        return RedisBackend()
+    raise ValueError(f"Unknown CACHE_BACKEND: {name} (expected memory, sqlite or redis)")
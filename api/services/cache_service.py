@@ -1,73 +1,130 @@
 """
 Caching service for repeated queries.
+
+Answers live for CACHE_TTL_HOURS and may then be served stale, marked
+with metadata.cache.stale, until CACHE_HARD_TTL_HOURS while a background
+refresh (CACHE_REFRESH_WORKERS at a time, one per question) regenerates
+them; /query/cache-stats reports these under stale_while_revalidate.
+
+Keys include the index version ingest.py writes to
+vectorstore/index_version, so a full re-ingest retires every answer.
+Re-ingesting one book (ingest.py --book) or removing one (--remove-book)
+bumps only that book's version, retiring the answers citing it; the
+admin cache/invalidate endpoint drops answers by book or chunk ID.
 """
-import time
 import json
 import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from hashlib import sha256
-from typing import Dict, Any, Optional, List
-from threading import Lock
+from typing import Callable, Dict, Any, Iterable, Optional, List
 
 from api.config import api_config
+from api.services.cache_backends import CacheBackend, MemoryBackend, create_cache_backend
+from api.services.response_body import render_body
+from api.services.semantic_cache import SemanticIndex
+from src.index_version import read_book_versions, read_index_version
 
 logger = logging.getLogger(__name__)
 
+# Tags recording what a cached answer depended on (see CacheBackend)
+BOOK_TAG = "book:"
+CHUNK_TAG = "chunk:"
+
+
+def normalize_query(query: str) -> str:
+    """Normalize query for better cache hit rates."""
+    # Lowercase, strip whitespace, collapse multiple spaces
+    return " ".join(query.lower().strip().split())
+
 
 class QueryCache:
     """
-    In-memory LRU cache for query results.
+    Cache for query results over a pluggable storage backend.
 
     Features:
     - Query normalization for better hit rates
-    - TTL-based expiration
-    - LRU eviction when max size is reached
-    - Thread-safe operations
+    - TTL-based expiration with stale-while-revalidate: past the soft TTL
+      an answer is still served (marked stale) until the hard TTL, while
+      one background refresh per key regenerates it
+    - Keys namespaced by the vector index version, so a re-ingest retires
+      every earlier answer, including those kept on disk or in Redis
+    - Each answer records the books and chunks its citations came from,
+      indexed by tag so one book's answers can be invalidated alone; the
+      book versions recorded with it retire it after that book is
+      re-ingested, in every worker
+    - Optional semantic tier: a paraphrased question is served the answer
+      of the most similar cached question with the same source filter and
+      mode, above SEMANTIC_CACHE_THRESHOLD
+    - Storage in-process (striped O(1) LRU with a byte budget), in a
+      shared SQLite file or in Redis, chosen by CACHE_BACKEND; the shared
+      backends give every worker the same hits and invalidation
+    - Each answer is stored with its /query response body pre-rendered
+      (cache_body), so a hit skips model validation and serialization
+    - Backend errors are logged and treated as misses, never failing a query
     """
 
     def __init__(
         self,
         max_size: int = None,
         ttl_hours: int = None,
+        max_bytes: int = None,
+        stripes: int = None,
+        backend: Optional[CacheBackend] = None,
+        semantic: Optional[SemanticIndex] = None,
+        hard_ttl_hours: int = None,
     ):
-        self._cache: Dict[str, Dict[str, Any]] = {}
-        self._access_order: List[str] = []  # For LRU tracking
-        self._max_size = max_size or api_config.CACHE_MAX_SIZE
         self._ttl = (ttl_hours or api_config.CACHE_TTL_HOURS) * 3600
-        self._lock = Lock()
-        self._hits = 0
-        self._misses = 0
+        self._hard_ttl = max(self._ttl, (hard_ttl_hours or api_config.CACHE_HARD_TTL_HOURS) * 3600)
+        if backend is None:
+            if max_size or max_bytes or stripes:
+                backend = MemoryBackend(max_size, max_bytes, stripes)
+            else:
+                backend = create_cache_backend()
+        self.backend = backend
+        if semantic is None and api_config.SEMANTIC_CACHE_ENABLED:
+            semantic = SemanticIndex()
+        self.semantic = semantic
+        self._refresher = ThreadPoolExecutor(
+            max_workers=api_config.CACHE_REFRESH_WORKERS, thread_name_prefix="cache-refresh"
+        )
+        self._refreshing: set = set()
+        self._swr_lock = threading.Lock()
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.refresh_skipped = 0
+        self._refresh_ms: deque = deque(maxlen=256)
+        logger.info(f"Query cache backend: {backend.name}")
 
     def _normalize_query(self, query: str) -> str:
-        """Normalize query for better cache hit rates."""
-        # Lowercase, strip whitespace, collapse multiple spaces
-        normalized = " ".join(query.lower().strip().split())
-        return normalized
+        return normalize_query(query)
 
-    def _make_key(self, query: str, source_filter: Optional[List[str]] = None) -> str:
-        """Create a cache key from query and filters."""
+    def _make_key(self, query: str, source_filter: Optional[List[str]] = None, mode: str = "full") -> str:
+        """Create a cache key from index version, query, filters and answer mode."""
         normalized = self._normalize_query(query)
         filter_str = json.dumps(sorted(source_filter or []))
         combined = f"{normalized}:{filter_str}"
-        return sha256(combined.encode()).hexdigest()
-
-    def _update_access_order(self, key: str):
-        """Update LRU access order."""
-        if key in self._access_order:
-            self._access_order.remove(key)
-        self._access_order.append(key)
-
-    def _evict_oldest(self):
-        """Evict oldest entry if cache is full."""
-        if len(self._cache) >= self._max_size and self._access_order:
-            oldest_key = self._access_order.pop(0)
-            if oldest_key in self._cache:
-                del self._cache[oldest_key]
-                logger.debug(f"Evicted oldest cache entry: {oldest_key[:8]}...")
+        if mode != "full":
+            combined += f":{mode}"
+        return f"{read_index_version()}:{sha256(combined.encode()).hexdigest()}"
+
+    def cache_key(self, query: str, source_filter: Optional[List[str]] = None, mode: str = "full") -> str:
+        """Key a query is cached under; also identifies identical in-flight queries."""
+        return self._make_key(query, source_filter, mode)
+
+    @staticmethod
+    def _scope(source_filter: Optional[List[str]], mode: str) -> tuple:
+        """Semantic lookups only match questions asked with the same index, filter and mode."""
+        return read_index_version(), json.dumps(sorted(source_filter or [])), mode
 
     def get(
         self,
         query: str,
         source_filter: Optional[List[str]] = None,
+        mode: str = "full",
     ) -> Optional[Dict[str, Any]]:
         """
         Get cached response for a query.
@@ -75,40 +132,136 @@ class QueryCache:
         Args:
             query: The search query
             source_filter: Optional list of sources to filter by
+            mode: Answer mode the response was generated in
 
         Returns:
             Cached response dict or None if not found/expired
         """
-        key = self._make_key(query, source_filter)
+        response = self._lookup(self._make_key(query, source_filter, mode))
+        if response is None:
+            return None
 
-        with self._lock:
-            if key not in self._cache:
-                self._misses += 1
-                return None
+        logger.info(f"Cache hit for query: {query[:50]}...")
+        return response
 
-            entry = self._cache[key]
+    def peek(
+        self,
+        query: str,
+        source_filter: Optional[List[str]] = None,
+        mode: str = "full",
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Like get(), but not counted in the hit/miss or stale-hit stats.
 
-            # Check if expired
-            if time.time() - entry["timestamp"] > self._ttl:
-                del self._cache[key]
-                if key in self._access_order:
-                    self._access_order.remove(key)
-                self._misses += 1
-                logger.debug(f"Cache entry expired: {key[:8]}...")
-                return None
+        For maintenance such as prewarming, whose lookups would otherwise
+        skew the hit rate of real queries.
+        """
+        return self._lookup(self._make_key(query, source_filter, mode), count=False)
 
-            # Update access order for LRU
-            self._update_access_order(key)
-            self._hits += 1
+    def get_similar(
+        self,
+        embedding: List[float],
+        source_filter: Optional[List[str]] = None,
+        mode: str = "full",
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Get the cached response of the most similar earlier question.
+
+        Args:
+            embedding: Embedding of the (sanitized) question
+            source_filter: Optional list of sources to filter by
+            mode: Answer mode the response must have been generated in
+
+        Returns:
+            Cached response dict, with metadata["cache"] describing the
+            match, or None below the similarity threshold
+        """
+        if self.semantic is None:
+            return None
+        key, similarity = self.semantic.nearest(self._scope(source_filter, mode), embedding)
+        if key is None:
+            return None
+        response = self._lookup(key)
+        if response is None:
+            self.semantic.discard(key)
+            return None
+
+        self.semantic.record_hit()
+        logger.info(f"Semantic cache hit ({similarity:.3f}) for cached question: {response.get('question', '')[:50]}...")
+        metadata = dict(response.get("metadata") or {})
+        metadata["cache"] = {
+            **metadata.get("cache", {}),
+            "match": "semantic",
+            "similarity": round(similarity, 4),
+            "question": response.get("question"),
+        }
+        return {**response, "metadata": metadata}
+
+    def _lookup(self, key: str, count: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Live response for a cache key, or None if missing or outdated.
+
+        A response past the soft TTL is returned with metadata["cache"]
+        marking it stale; the caller should revalidate() it. Without count
+        the lookup is left out of the hit, miss and stale-hit counters.
+        """
+        try:
+            response = self.backend.get(key) if count else self.backend.peek(key)
+        except Exception as e:
+            logger.warning(f"Cache backend {self.backend.name} get failed: {e}")
+            return None
+        if response is None:
+            return None
 
-            logger.info(f"Cache hit for query: {query[:50]}...")
-            return entry["response"]
+        deps = response.get("cache_deps") or {}
+        book_versions = read_book_versions()
+        stale = [
+            book for book, version in (deps.get("books") or {}).items()
+            if book_versions.get(book) != version
+        ]
+        if stale:
+            logger.info(f"Cached answer depends on re-ingested {', '.join(stale)}, dropping it")
+            self._delete(key)
+            return None
+
+        stored_at = response.get("cache_stored_at")
+        response = {k: v for k, v in response.items() if k not in ("cache_deps", "cache_stored_at")}
+        if stored_at is not None and time.time() - stored_at > self._ttl:
+            if count:
+                with self._swr_lock:
+                    self.stale_hits += 1
+            metadata = dict(response.get("metadata") or {})
+            metadata["cache"] = {
+                **metadata.get("cache", {}),
+                "stale": True,
+                "age_seconds": int(time.time() - stored_at),
+            }
+            response["metadata"] = metadata
+        return response
+
+    @staticmethod
+    def is_stale(response: Dict[str, Any]) -> bool:
+        """Whether a response from get() or get_similar() is past the soft TTL."""
+        return bool(((response.get("metadata") or {}).get("cache") or {}).get("stale"))
+
+    @staticmethod
+    def _dependencies(response: Dict[str, Any]) -> Dict[str, Any]:
+        """Books (with their current versions) and chunk IDs behind a response's citations."""
+        citations = response.get("citations") or []
+        book_versions = read_book_versions()
+        books = sorted({c["source"] for c in citations if c.get("source")})
+        return {
+            "books": {book: book_versions.get(book) for book in books},
+            "chunks": sorted({c["chunk_id"] for c in citations if c.get("chunk_id")}),
+        }
 
     def set(
         self,
         query: str,
         response: Dict[str, Any],
         source_filter: Optional[List[str]] = None,
+        mode: str = "full",
+        embedding: Optional[List[float]] = None,
     ):
         """
         Cache a query response.
@@ -117,58 +270,199 @@ class QueryCache:
             query: The search query
             response: The response to cache
             source_filter: Optional list of sources used
+            mode: Answer mode the response was generated in
+            embedding: The question's embedding, to index it for semantic lookups
+        """
+        key = self._make_key(query, source_filter, mode)
+        deps = self._dependencies(response)
+        tags = [BOOK_TAG + book for book in deps["books"]] + [CHUNK_TAG + chunk for chunk in deps["chunks"]]
+        entry = {**response, "cache_deps": deps, "cache_stored_at": time.time()}
+        try:
+            entry["cache_body"] = render_body(response)
+        except Exception as e:
+            logger.warning(f"Could not pre-render cached response body: {e}")
+        try:
+            self.backend.set(key, entry, self._hard_ttl, tags)
+        except Exception as e:
+            logger.warning(f"Cache backend {self.backend.name} set failed: {e}")
+            return
+        if self.semantic is not None and embedding is not None:
+            self.semantic.add(self._scope(source_filter, mode), key, embedding)
+
+        logger.info(f"Cached response for query: {query[:50]}...")
+
+    def revalidate(
+        self,
+        query: str,
+        regenerate: Callable[[], Dict[str, Any]],
+        source_filter: Optional[List[str]] = None,
+        mode: str = "full",
+    ) -> bool:
+        """
+        Regenerate a stale answer in the background.
+
+        At most one refresh per key runs at a time in this worker, so a
+        burst of requests for a stale answer costs one LLM call.
+
+        Args:
+            query: The cached question
+            regenerate: Produces the fresh response (runs on a refresh thread)
+            source_filter: Optional list of sources used
+            mode: Answer mode the response was generated in
+
+        Returns:
+            True if a refresh was started, False if one is already running
         """
-        key = self._make_key(query, source_filter)
+        key = self._make_key(query, source_filter, mode)
+        with self._swr_lock:
+            if key in self._refreshing:
+                self.refresh_skipped += 1
+                return False
+            self._refreshing.add(key)
+        try:
+            self._refresher.submit(self._refresh, key, query, regenerate, source_filter, mode)
+        except RuntimeError:
+            # Shutting down
+            with self._swr_lock:
+                self._refreshing.discard(key)
+            return False
+        return True
 
-        with self._lock:
-            # Evict if needed
-            if key not in self._cache:
-                self._evict_oldest()
+    def _refresh(
+        self,
+        key: str,
+        query: str,
+        regenerate: Callable[[], Dict[str, Any]],
+        source_filter: Optional[List[str]],
+        mode: str,
+    ):
+        start = time.perf_counter()
+        failed = False
+        try:
+            self.set(query, regenerate(), source_filter, mode)
+        except Exception as e:
+            failed = True
+            logger.warning(f"Background refresh failed for query: {query[:50]}...: {e}")
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._swr_lock:
+                self._refreshing.discard(key)
+                self.refreshes += 1
+                self.refresh_failures += failed
+                self._refresh_ms.append(elapsed_ms)
+        if not failed:
+            logger.info(f"Refreshed stale answer in {elapsed_ms:.0f}ms for query: {query[:50]}...")
 
-            self._cache[key] = {
-                "response": response,
-                "timestamp": time.time(),
-                "query": query,
+    def _swr_stats(self) -> Dict[str, Any]:
+        with self._swr_lock:
+            latencies = sorted(self._refresh_ms)
+            return {
+                "soft_ttl_hours": self._ttl / 3600,
+                "hard_ttl_hours": self._hard_ttl / 3600,
+                "stale_hits": self.stale_hits,
+                "refreshes": self.refreshes,
+                "refresh_failures": self.refresh_failures,
+                "refresh_skipped": self.refresh_skipped,
+                "refresh_in_flight": len(self._refreshing),
+                "refresh_ms_p50": round(latencies[len(latencies) // 2], 1) if latencies else None,
+                "refresh_ms_max": round(latencies[-1], 1) if latencies else None,
             }
-            self._update_access_order(key)
 
-            logger.info(f"Cached response for query: {query[:50]}...")
+    def _delete(self, key: str):
+        try:
+            self.backend.delete(key)
+        except Exception as e:
+            logger.warning(f"Cache backend {self.backend.name} delete failed: {e}")
 
-    def invalidate(self, query: str = None, source_filter: Optional[List[str]] = None):
+    def _delete_tagged(self, tags: List[str]) -> int:
+        try:
+            return self.backend.delete_tagged(tags)
+        except Exception as e:
+            logger.warning(f"Cache backend {self.backend.name} tag invalidation failed: {e}")
+            return 0
+
+    def invalidate(self, query: str = None, source_filter: Optional[List[str]] = None, mode: str = "full"):
         """
         Invalidate cache entries.
 
         Args:
             query: Specific query to invalidate (or all if None)
             source_filter: Source filter for specific invalidation
+            mode: Answer mode for specific invalidation
         """
-        with self._lock:
-            if query:
-                key = self._make_key(query, source_filter)
-                if key in self._cache:
-                    del self._cache[key]
-                    if key in self._access_order:
-                        self._access_order.remove(key)
-            else:
-                # Clear all
-                self._cache.clear()
-                self._access_order.clear()
-                logger.info("Cache cleared")
+        if query:
+            self._delete(self._make_key(query, source_filter, mode))
+            return
+
+        # Clear all (every worker, with a shared backend)
+        try:
+            self.backend.clear()
+        except Exception as e:
+            logger.warning(f"Cache backend {self.backend.name} clear failed: {e}")
+        if self.semantic is not None:
+            self.semantic.clear()
+        logger.info("Cache cleared")
+
+    def invalidate_books(self, books: Iterable[str]) -> int:
+        """
+        Invalidate every cached answer citing any of the given books.
+
+        Args:
+            books: Book names, as in citations' source field
+
+        Returns:
+            Number of entries removed (0 if the backend failed)
+        """
+        books = list(books)
+        removed = self._delete_tagged([BOOK_TAG + book for book in books])
+        logger.info(f"Invalidated {removed} cached answers citing {', '.join(books)}")
+        return removed
+
+    def invalidate_chunks(self, chunk_ids: Iterable[str]) -> int:
+        """
+        Invalidate every cached answer citing any of the given chunks.
+
+        Args:
+            chunk_ids: Chunk IDs, as in citations' chunk_id field
+
+        Returns:
+            Number of entries removed (0 if the backend failed)
+        """
+        chunk_ids = list(chunk_ids)
+        removed = self._delete_tagged([CHUNK_TAG + chunk for chunk in chunk_ids])
+        logger.info(f"Invalidated {removed} cached answers citing {len(chunk_ids)} chunks")
+        return removed
+
+    def purge_expired(self) -> int:
+        """Drop every expired entry now; returns how many were removed."""
+        return self.backend.purge_expired()
 
     def get_stats(self) -> Dict[str, Any]:
         """Get cache statistics."""
-        with self._lock:
-            total_requests = self._hits + self._misses
-            hit_rate = (self._hits / total_requests * 100) if total_requests > 0 else 0
+        try:
+            stats = self.backend.stats()
+        except Exception as e:
+            logger.warning(f"Cache backend {self.backend.name} stats failed: {e}")
+            stats = {"size": 0, "hits": 0, "misses": 0, "error": str(e)}
 
-            return {
-                "size": len(self._cache),
-                "max_size": self._max_size,
-                "hits": self._hits,
-                "misses": self._misses,
-                "hit_rate_percent": round(hit_rate, 2),
-                "ttl_hours": self._ttl / 3600,
-            }
+        total_requests = stats["hits"] + stats["misses"]
+        hit_rate = (stats["hits"] / total_requests * 100) if total_requests > 0 else 0
+
+        return {
+            **stats,
+            "hit_rate_percent": round(hit_rate, 2),
+            "ttl_hours": self._ttl / 3600,
+            "backend": self.backend.name,
+            "shared": self.backend.shared,
+            "index_version": read_index_version(),
+            "semantic": self.semantic.stats() if self.semantic is not None else {"enabled": False},
+            "stale_while_revalidate": self._swr_stats(),
+        }
+
+    def close(self):
+        """Stop background refreshes and release the backend, flushing any writes still queued for disk."""
+        self._refresher.shutdown(wait=False, cancel_futures=True)
+        self.backend.close()
 
 
 # Global cache instance
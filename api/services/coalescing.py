@@ -0,0 +1,185 @@
+"""
+Request coalescing for identical in-flight queries.
+
+When several users ask the same question at once, only the first request
+(the leader) runs retrieval and the LLM call; concurrent duplicates wait
+for its result, or for streams, subscribe to the same event stream from
+the beginning. Requests are keyed on the query cache key, so "the same
+question" means the same thing to both.
+
+A /query follower's answer carries metadata.cache.match "coalesced"; a
+/query/stream follower replays the events sent so far, then follows the
+stream live. Coalescing is per worker. /query/cache-stats counts leaders
+and followers under coalescing, and benchmarks/bench_coalescing.py
+measures a burst of identical questions.
+"""
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical async calls into one.
+
+    The call runs as its own task, so a leader whose client disconnects
+    does not cancel the work its followers are waiting for. An exception
+    is raised in every waiter.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def run(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run fn once for all concurrent callers with the same key.
+
+        Args:
+            key: Identity of the call (the query cache key)
+            fn: Coroutine function doing the work
+
+        Returns:
+            (result, shared) where shared is True for followers
+        """
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            self.followers += 1
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task), shared
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # Mark retrieved; waiters re-raise it themselves
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._inflight), "leaders": self.leaders, "followers": self.followers}
+
+
+class StreamFanout:
+    """
+    One event stream shared by several subscribers.
+
+    A background thread drains the source iterator into a buffer; each
+    subscriber replays the buffer from the start and then follows it
+    live. When the last subscriber goes away the source is closed, which
+    ends the LLM stream as an unshared client disconnect would.
+    """
+
+    def __init__(self, source: Iterator[str], on_finish: Optional[Callable[["StreamFanout"], None]] = None):
+        self.events: List[str] = []
+        self.finished = False
+        self.stopped = False  # Ended early (no subscribers left) or by an error
+        self.error: Optional[BaseException] = None
+        self.subscribers = 1  # The creator
+        self._cond = threading.Condition()
+        self._source = source
+        self._on_finish = on_finish
+        threading.Thread(target=self._pump, name="stream-fanout", daemon=True).start()
+
+    def _pump(self):
+        try:
+            for event in self._source:
+                with self._cond:
+                    self.events.append(event)
+                    self._cond.notify_all()
+                    if self.subscribers == 0:
+                        logger.info("All subscribers left a shared stream, stopping it")
+                        self.stopped = True
+                        break
+        except Exception as e:
+            self.error = e
+            self.stopped = True
+        finally:
+            close = getattr(self._source, "close", None)
+            if close is not None:
+                close()
+            with self._cond:
+                self.finished = True
+                self._cond.notify_all()
+            if self._on_finish is not None:
+                self._on_finish(self)
+
+    def attach(self) -> bool:
+        """Add a subscriber; False if the stream ended early and cannot be replayed in full."""
+        with self._cond:
+            if self.stopped:
+                return False
+            self.subscribers += 1
+            return True
+
+    def subscribe(self) -> Iterator[str]:
+        """Yield every event of the stream, from the first (one call per subscriber)."""
+        position = 0
+        try:
+            while True:
+                with self._cond:
+                    while position >= len(self.events) and not self.finished:
+                        self._cond.wait()
+                    batch = self.events[position:]
+                    position += len(batch)
+                    finished = self.finished and position >= len(self.events)
+                yield from batch
+                if finished:
+                    if self.error is not None:
+                        raise self.error
+                    return
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+
+class StreamCoalescer:
+    """Shares one StreamFanout among concurrent identical streaming queries."""
+
+    def __init__(self):
+        self._inflight: Dict[str, StreamFanout] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def subscribe(self, key: str, start: Callable[[], Iterator[str]]) -> Tuple[Iterator[str], bool]:
+        """
+        Subscribe to the in-flight stream for a key, starting it if needed.
+
+        Args:
+            key: Identity of the stream (the query cache key)
+            start: Creates the source event iterator; called by the leader only
+
+        Returns:
+            (events, shared) where shared is True for followers
+        """
+        with self._lock:
+            fanout = self._inflight.get(key)
+            if fanout is not None and fanout.attach():
+                self.followers += 1
+                return fanout.subscribe(), True
+            self.leaders += 1
+            fanout = StreamFanout(start(), on_finish=lambda done: self._finish(key, done))
+            self._inflight[key] = fanout
+            return fanout.subscribe(), False
+
+    def _finish(self, key: str, fanout: StreamFanout):
+        with self._lock:
+            if self._inflight.get(key) is fanout:
+                del self._inflight[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"in_flight": len(self._inflight), "leaders": self.leaders, "followers": self.followers}
+
+
+# Per-worker coalescers for /query and /query/stream
+query_flights = SingleFlight()
+stream_flights = StreamCoalescer()
@@ -0,0 +1,318 @@
+"""
+Cache prewarming from query history.
+
+Ranks the questions doctors asked recently by frequency and recency and
+answers the top ones through the RAG pipeline ahead of time, so they are
+cache hits at peak hours or right after a deploy or re-index. Runs are
+recorded in PrewarmRun; coverage() then reports how many of the queries
+that followed a run were served from the entries it warmed.
+
+History does not record the source filter or answer mode of a question,
+so questions are warmed unfiltered in the default ANSWER_MODE, the way
+most are asked.
+
+A run ranks PREWARM_DAYS of history (an ask counts half after
+PREWARM_HALF_LIFE_HOURS) and answers up to PREWARM_LIMIT questions,
+PREWARM_CONCURRENCY at a time, within PREWARM_TOKEN_BUDGET tokens. Run it
+before clinic hours or after a deploy or re-index, from prewarm.py or the
+admin cache/prewarm endpoint.
+"""
+import json
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Integer, cast
+from sqlalchemy.orm import Session
+
+from api.config import api_config
+from api.database import PrewarmRun, QueryHistory
+from api.models.query import QueryRequest
+from api.services.cache_service import normalize_query, query_cache
+from api.services.rag_service import RAGService
+
+logger = logging.getLogger(__name__)
+
+# Retrieval depth of a default /query request
+TOP_K = QueryRequest.model_fields["top_k"].default
+
+
+@dataclass
+class PrewarmCandidate:
+    """A recently asked question and its rank score."""
+    question: str  # Most recent wording
+    normalized: str
+    count: int
+    last_asked: datetime
+    score: float
+
+
+def rank_questions(
+    db: Session,
+    limit: int = None,
+    days: int = None,
+    half_life_hours: float = None,
+    now: Optional[datetime] = None,
+) -> List[PrewarmCandidate]:
+    """
+    Rank recent questions by frequency and recency.
+
+    Each ask of a question adds 0.5 ** (age / half_life) to its score, so
+    a question asked often and lately ranks first, and one asked as often
+    last week ranks below it.
+
+    Args:
+        db: Database session
+        limit: Number of questions to return
+        days: How far back to look
+        half_life_hours: Age at which an ask counts half
+        now: Reference time (utcnow if None)
+
+    Returns:
+        Candidates ordered by descending score
+    """
+    limit = limit or api_config.PREWARM_LIMIT
+    days = days or api_config.PREWARM_DAYS
+    half_life = (half_life_hours or api_config.PREWARM_HALF_LIFE_HOURS) * 3600
+    now = now or datetime.utcnow()
+
+    rows = (
+        db.query(QueryHistory.question, QueryHistory.created_at)
+        .filter(QueryHistory.created_at >= now - timedelta(days=days))
+        .order_by(QueryHistory.created_at)
+        .all()
+    )
+    candidates: Dict[str, PrewarmCandidate] = {}
+    for question, created_at in rows:
+        normalized = normalize_query(question)
+        if not normalized:
+            continue
+        weight = 0.5 ** (max(0.0, (now - created_at).total_seconds()) / half_life)
+        candidate = candidates.get(normalized)
+        if candidate is None:
+            candidates[normalized] = PrewarmCandidate(question, normalized, 1, created_at, weight)
+        else:
+            # Rows are in time order, so the latest wording wins
+            candidate.question = question
+            candidate.count += 1
+            candidate.last_asked = created_at
+            candidate.score += weight
+    ranked = sorted(candidates.values(), key=lambda c: (c.score, c.last_asked), reverse=True)
+    return ranked[:limit]
+
+
+def run_prewarm(
+    rag_service: RAGService,
+    candidates: List[PrewarmCandidate],
+    concurrency: int = None,
+    token_budget: int = None,
+) -> Dict[str, Any]:
+    """
+    Answer candidates that are not already cached and fill the cache.
+
+    At most `concurrency` questions are answered at once. No new question
+    is started once the LLM tokens used reach the budget, so a run ends
+    at most `concurrency` answers over it.
+
+    Args:
+        rag_service: Pipeline to answer with
+        candidates: Questions in priority order (see rank_questions())
+        concurrency: Questions answered at once
+        token_budget: Prompt plus completion tokens the run may spend
+
+    Returns:
+        Report with the warmed, already warm, failed and over-budget
+        counts, tokens used, elapsed time and the normalized questions
+        warmed (warm_questions)
+    """
+    concurrency = max(1, concurrency or api_config.PREWARM_CONCURRENCY)
+    token_budget = token_budget or api_config.PREWARM_TOKEN_BUDGET
+    mode = api_config.ANSWER_MODE
+    start = time.perf_counter()
+    tokens_used = 0
+    warmed: List[str] = []
+    already_warm: List[str] = []
+    failed: List[str] = []
+    over_budget: List[str] = []
+
+    def warm(candidate: PrewarmCandidate) -> int:
+        embedding = None
+        if query_cache.semantic is not None:
+            embedding = rag_service.embed_query(candidate.question)
+        result = rag_service.query(
+            question=candidate.question,
+            source_filter=None,
+            top_k=TOP_K,
+            mode=mode,
+            embedding=embedding,
+        )
+        query_cache.set(candidate.question, result, None, mode, embedding=embedding)
+        usage = (result.get("metadata") or {}).get("usage") or {}
+        return (usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0)
+
+    def collect(done: Future, candidate: PrewarmCandidate):
+        # Called on this thread only
+        nonlocal tokens_used
+        try:
+            tokens = done.result()
+        except Exception as e:
+            logger.warning(f"Prewarm failed for query: {candidate.question[:50]}...: {e}")
+            failed.append(candidate.normalized)
+            return
+        tokens_used += tokens
+        warmed.append(candidate.normalized)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="prewarm") as pool:
+        running: Dict[Future, PrewarmCandidate] = {}
+        for candidate in candidates:
+            # Not counted, so prewarming does not skew the reported hit rate
+            cached = query_cache.peek(candidate.question, None, mode)
+            if cached is not None and not query_cache.is_stale(cached):
+                already_warm.append(candidate.normalized)
+                continue
+            while len(running) >= concurrency:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future, running.pop(future))
+            if tokens_used >= token_budget:
+                over_budget.append(candidate.normalized)
+                continue
+            running[pool.submit(warm, candidate)] = candidate
+        for future in wait(running).done:
+            collect(future, running.pop(future))
+
+    report = {
+        "candidates": len(candidates),
+        "warmed": len(warmed),
+        "already_warm": len(already_warm),
+        "failed": len(failed),
+        "skipped_over_budget": len(over_budget),
+        "tokens_used": tokens_used,
+        "token_budget": token_budget,
+        "concurrency": concurrency,
+        "elapsed_s": round(time.perf_counter() - start, 1),
+        # Coverage credits the run only with answers it generated itself
+        "warm_questions": warmed,
+    }
+    logger.info(
+        f"Prewarm: {report['warmed']} answered, {report['already_warm']} already cached, "
+        f"{report['failed']} failed, {report['skipped_over_budget']} over budget, "
+        f"{tokens_used}/{token_budget} tokens in {report['elapsed_s']}s"
+    )
+    return report
+
+
+def prewarm(
+    db: Session,
+    rag_service: RAGService,
+    trigger: str,
+    limit: int = None,
+    days: int = None,
+    concurrency: int = None,
+    token_budget: int = None,
+    run: Optional[PrewarmRun] = None,
+) -> PrewarmRun:
+    """
+    Rank recent questions, warm the top ones and record the run.
+
+    Args:
+        db: Database session
+        rag_service: Pipeline to answer with
+        trigger: What started the run ("cli" or "admin")
+        limit: Number of questions to consider
+        days: How far back in history to look
+        concurrency: Questions answered at once
+        token_budget: Prompt plus completion tokens the run may spend
+        run: An already recorded run to complete (created if None)
+
+    Returns:
+        The finished PrewarmRun
+    """
+    if run is None:
+        run = start_run(db, trigger)
+    try:
+        candidates = rank_questions(db, limit=limit, days=days)
+        report = run_prewarm(rag_service, candidates, concurrency, token_budget)
+        run.status = "done"
+        run.questions_json = json.dumps(report.pop("warm_questions"))
+        run.report_json = json.dumps(report)
+        run.tokens_used = report["tokens_used"]
+    except Exception as e:
+        logger.error(f"Prewarm run {run.id} failed: {e}")
+        run.status = "failed"
+        run.report_json = json.dumps({"error": str(e)})
+    run.finished_at = datetime.utcnow()
+    db.commit()
+    return run
+
+
+def start_run(db: Session, trigger: str) -> PrewarmRun:
+    """Record a run as started, so it is listed while it works."""
+    run = PrewarmRun(trigger=trigger, status="running")
+    db.add(run)
+    db.commit()
+    db.refresh(run)
+    return run
+
+
+def coverage(db: Session, run: PrewarmRun, hours: int = 24) -> Dict[str, Any]:
+    """
+    Share of the queries after a run that were served from its warm entries.
+
+    A query counts as served warm when it was a cache hit for one of the
+    questions the run answered. Questions it found already cached are
+    left out, since they would have been hits without the run; neither
+    are paraphrases served by the semantic tier counted.
+
+    Args:
+        db: Database session
+        run: A finished run
+        hours: Length of the window after the run
+
+    Returns:
+        Queries in the window, cache hits, hits on warm entries and the
+        coverage percentage
+    """
+    if run.finished_at is None:
+        return {"window_hours": hours, "window_complete": False, "queries": 0}
+    window_end = run.finished_at + timedelta(hours=hours)
+    warm = set(json.loads(run.questions_json or "[]"))
+    rows = (
+        db.query(QueryHistory.question, cast(QueryHistory.cached, Integer))
+        .filter(QueryHistory.created_at >= run.finished_at, QueryHistory.created_at < window_end)
+        .all()
+    )
+    queries = len(rows)
+    hits = sum(1 for _, cached in rows if cached)
+    warm_asked = [cached for question, cached in rows if normalize_query(question) in warm]
+    warm_hits = sum(1 for cached in warm_asked if cached)
+    return {
+        "window_hours": hours,
+        "window_complete": datetime.utcnow() >= window_end,
+        "queries": queries,
+        "cache_hits": hits,
+        "warm_questions_asked": len(warm_asked),
+        "warm_hits": warm_hits,
+        "coverage_percent": round(warm_hits / queries * 100, 2) if queries else 0,
+    }
+
+
+def run_summary(db: Session, run: PrewarmRun, hours: int = 24) -> Dict[str, Any]:
+    """A run's report with its coverage, for the CLI and admin endpoint."""
+    return {
+        "id": run.id,
+        "trigger": run.trigger,
+        "status": run.status,
+        "started_at": run.started_at.isoformat() if run.started_at else None,
+        "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+        "report": json.loads(run.report_json) if run.report_json else None,
+        "coverage": coverage(db, run, hours) if run.status == "done" else None,
+    }
+
+
+def recent_runs(db: Session, limit: int = 10) -> List[PrewarmRun]:
+    """Most recent runs first."""
+    return db.query(PrewarmRun).order_by(PrewarmRun.started_at.desc()).limit(limit).all()
@@ -1,14 +1,23 @@
 """
 RAG service wrapping existing retriever and chain.
 """
+import itertools
 import time
 import logging
 from typing import Dict, Any, List, Optional, Tuple
 import uuid
 
+from langchain_core.documents import Document
+
+from src.config import config
 from src.vector_store import VectorStoreManager
 from src.retriever import RemedyRetriever
+from src.context_assembler import AssembledContext
+from src.context_compressor import ContextCompressor
 from src.llm_chain import RemedyChain
+from src.model_router import RouteDecision
+from src.repertorization import LocalTable, build_table
+from src.table_parser import RepertorizationParser, parse_table
 from src.utils import sanitize_query
 
 logger = logging.getLogger(__name__)
@@ -42,6 +51,11 @@ class RAGService:
             self.vs_manager = VectorStoreManager()
             self.retriever = RemedyRetriever(self.vs_manager)
             self.chain = RemedyChain()
+            self.compressor = (
+                ContextCompressor(self.vs_manager.embeddings)
+                if config.CONTEXT_COMPRESSION_ENABLED
+                else None
+            )
 
             # Load vector store
             vs = self.vs_manager.get_vectorstore()
@@ -63,6 +77,9 @@ class RAGService:
         question: str,
         source_filter: Optional[List[str]] = None,
         top_k: int = 5,
+        mode: Optional[str] = None,
+        embedding: Optional[List[float]] = None,
+        served_by: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
         """
         Execute a RAG query.
@@ -71,6 +88,11 @@ class RAGService:
             question: User's query
             source_filter: Optional list of source books to filter by
             top_k: Number of documents to retrieve
+            mode: "full" or "analysis" (config.ANSWER_MODE if None)
+            embedding: embed_query(question), if already computed
+            served_by: Optional dict given the redacted LLM key that
+                answered, for query history; the key is kept out of the
+                result so it is never returned or cached
 
         Returns:
             Query response dict with answer, citations, etc.
@@ -84,11 +106,10 @@ class RAGService:
             logger.info(f"Processing query [{query_id}]: {clean_query[:50]}...")
 
             # Retrieve context
-            context, citations, documents = self.retriever.retrieve_as_context(
-                clean_query,
-                k=top_k,
-                source_filter=source_filter,
-            )
+            assembled, route = self._build_context(query_id, clean_query, top_k, source_filter, embedding, mode)
+            context = assembled.render()
+            citations = assembled.citations
+            documents = assembled.documents
 
             if not context:
                 return {
@@ -101,11 +122,20 @@ class RAGService:
                 }
 
             # Generate response
+            usage: Dict[str, Any] = {}
+            table = self._local_table(query_id, clean_query, assembled, mode)
             answer, used_citations = self.chain.generate_response(
                 clean_query,
                 context,
                 citations,
+                books=self._prompt_books(assembled, source_filter),
+                usage=usage,
+                route=route,
+                table=table,
             )
+            if table is not None:
+                answer = self._table_prefix(table) + answer
+            self._take_key(usage, served_by)
 
             # Extract unique sources
             sources_used = list(set(
@@ -114,13 +144,7 @@ class RAGService:
             ))
 
             # Format citations for response
-            formatted_citations = []
-            for doc in documents:
-                formatted_citations.append({
-                    "source": doc.metadata.get("book_name", "Unknown"),
-                    "page": doc.metadata.get("page_number"),
-                    "excerpt": doc.page_content[:300] + "..." if len(doc.page_content) > 300 else doc.page_content,
-                })
+            formatted_citations = self._format_citations(documents)
 
             processing_time = int((time.time() - start_time) * 1000)
             logger.info(f"Query [{query_id}] completed in {processing_time}ms")
@@ -132,6 +156,12 @@ class RAGService:
                 "citations": formatted_citations,
                 "sources_used": sources_used,
                 "processing_time_ms": processing_time,
+                "table": parse_table(answer),
+                "metadata": {
+                    "context": assembled.stats,
+                    "usage": usage,
+                    "answer_mode": "analysis" if table is not None else "full",
+                },
             }
 
         except ValueError as e:
@@ -146,12 +176,23 @@ class RAGService:
         question: str,
         source_filter: Optional[List[str]] = None,
         top_k: int = 3,
+        mode: Optional[str] = None,
+        embedding: Optional[List[float]] = None,
+        served_by: Optional[Dict[str, Any]] = None,
     ):
         """
         Execute a RAG query with streaming LLM response.
 
+        In "analysis" mode the locally computed table is sent as the first
+        token event and only the Analysis paragraph is streamed from the LLM.
+        embedding is embed_query(question), if already computed; served_by
+        is given the redacted LLM key, as in query().
+
         Yields:
-            dict events: {"type": "citations", ...} then {"type": "token", ...} then {"type": "done", ...}
+            JSON events: {"type": "citations", ...}, then {"type": "token", ...}
+            interleaved with parsed-table events ("table_header",
+            "table_row", "analysis") as each line completes, then
+            {"type": "done", ...} carrying the full parsed table
         """
         import json as _json
         start_time = time.time()
@@ -161,31 +202,37 @@ class RAGService:
         logger.info(f"Streaming query [{query_id}]: {clean_query[:50]}...")
 
         # Retrieve context
-        context, citations, documents = self.retriever.retrieve_as_context(
-            clean_query,
-            k=top_k,
-            source_filter=source_filter,
-        )
+        assembled, route = self._build_context(query_id, clean_query, top_k, source_filter, embedding, mode)
+        context = assembled.render()
+        documents = assembled.documents
 
         if not context:
             yield _json.dumps({"type": "done", "id": query_id, "answer": "No relevant information found.", "processing_time_ms": 0})
             return
 
         # Send citations first so the client can render them immediately
-        formatted_citations = []
-        for doc in documents:
-            formatted_citations.append({
-                "source": doc.metadata.get("book_name", "Unknown"),
-                "page": doc.metadata.get("page_number"),
-                "excerpt": doc.page_content[:300] + "..." if len(doc.page_content) > 300 else doc.page_content,
-            })
+        formatted_citations = self._format_citations(documents)
         sources_used = list(set(doc.metadata.get("book_name", "Unknown") for doc in documents))
 
         yield _json.dumps({"type": "citations", "citations": formatted_citations, "sources_used": sources_used})
 
         # Stream LLM tokens
-        for token in self.chain.generate_response_streaming(clean_query, context):
+        books = self._prompt_books(assembled, source_filter)
+        usage: Dict[str, Any] = {}
+        parser = RepertorizationParser()
+        table = self._local_table(query_id, clean_query, assembled, mode)
+        tokens = self.chain.generate_response_streaming(
+            clean_query, context, books=books, usage=usage, route=route, table=table
+        )
+        if table is not None:
+            tokens = itertools.chain([self._table_prefix(table)], tokens)
+        for token in tokens:
             yield _json.dumps({"type": "token", "content": token})
+            for event in parser.feed(token):
+                yield _json.dumps(event)
+        for event in parser.finish():
+            yield _json.dumps(event)
+        self._take_key(usage, served_by)
 
         processing_time = int((time.time() - start_time) * 1000)
         yield _json.dumps({
@@ -194,8 +241,196 @@ class RAGService:
             "processing_time_ms": processing_time,
             "sources_used": sources_used,
             "cached": False,
+            "table": parser.table(),
+            "metadata": {
+                "context": assembled.stats,
+                "usage": usage,
+                "answer_mode": "analysis" if table is not None else "full",
+            },
         })
 
+    @staticmethod
+    def _take_key(usage: Dict[str, Any], served_by: Optional[Dict[str, Any]]):
+        """Move the redacted LLM key out of the usage metadata."""
+        key = usage.pop("key", None)
+        if served_by is not None:
+            served_by["key"] = key
+
+    @staticmethod
+    def replay_stream(response: Dict[str, Any], chunk_chars: int = 24):
+        """
+        Replay a cached query() response as query_stream() events.
+
+        The answer is re-sent as token events of chunk_chars characters
+        (all at once if 0), with the table events a live stream would
+        interleave, and the final done event has "cached": true.
+
+        Yields:
+            JSON events in the same order as query_stream()
+        """
+        import json as _json
+        answer = response.get("answer", "")
+        if not response.get("citations"):
+            # Nothing was retrieved; a live stream sends only the done event
+            yield _json.dumps({
+                "type": "done",
+                "id": response["id"],
+                "answer": answer,
+                "processing_time_ms": response.get("processing_time_ms", 0),
+                "cached": True,
+            })
+            return
+
+        yield _json.dumps({
+            "type": "citations",
+            "citations": response["citations"],
+            "sources_used": response.get("sources_used", []),
+        })
+        parser = RepertorizationParser()
+        step = chunk_chars if chunk_chars > 0 else max(1, len(answer))
+        for start in range(0, len(answer), step):
+            token = answer[start:start + step]
+            yield _json.dumps({"type": "token", "content": token})
+            for event in parser.feed(token):
+                yield _json.dumps(event)
+        for event in parser.finish():
+            yield _json.dumps(event)
+
+        yield _json.dumps({
+            "type": "done",
+            "id": response["id"],
+            "processing_time_ms": response.get("processing_time_ms", 0),
+            "sources_used": response.get("sources_used", []),
+            "cached": True,
+            "table": response.get("table", parser.table()),
+            "metadata": response.get("metadata"),
+        })
+
+    @staticmethod
+    def _chunk_id(doc: Document) -> Optional[str]:
+        """Stable ID of an indexed chunk: book, page (for PDFs) and chunk index."""
+        meta = doc.metadata
+        if "chunk_index" not in meta:
+            return None
+        parts = [meta.get("book_name", "Unknown")]
+        if meta.get("page") is not None:
+            parts.append(f"p{meta['page']}")
+        parts.append(str(meta["chunk_index"]))
+        return ":".join(parts)
+
+    @classmethod
+    def _format_citations(cls, documents: List[Document]) -> List[Dict[str, Any]]:
+        """Citations for the response, one per retrieved chunk."""
+        return [
+            {
+                "source": doc.metadata.get("book_name", "Unknown"),
+                "page": doc.metadata.get("page_number"),
+                "excerpt": doc.page_content[:300] + "..." if len(doc.page_content) > 300 else doc.page_content,
+                "chunk_id": cls._chunk_id(doc),
+            }
+            for doc in documents
+        ]
+
+    @staticmethod
+    def _local_table(
+        query_id: str,
+        clean_query: str,
+        assembled: AssembledContext,
+        mode: Optional[str],
+    ) -> Optional[LocalTable]:
+        """
+        Compute the table locally in analysis mode.
+
+        Returns None (full generation) in full mode or when no query
+        symptom matches a graded rubric in the context.
+        """
+        if (mode or config.ANSWER_MODE) != "analysis":
+            return None
+        table = build_table(clean_query, assembled)
+        if table is None:
+            logger.info(f"Query [{query_id}]: no graded rubrics matched, falling back to full generation")
+            return None
+        logger.info(
+            f"Query [{query_id}]: local table with {len(table.rows)} rows, {len(table.remedies)} remedies "
+            f"({len(table.unmatched)} symptoms unmatched)"
+        )
+        return table
+
+    @staticmethod
+    def _table_prefix(table: LocalTable) -> str:
+        """Answer text before the generated Analysis paragraph."""
+        return table.to_markdown() + "\n\n### Analysis\n\n"
+
+    @staticmethod
+    def _prompt_books(assembled: AssembledContext, source_filter: Optional[List[str]]) -> List[str]:
+        """Books the prompt should describe: those in the context or the filter."""
+        return sorted(set(assembled.books) | set(source_filter or []))
+
+    def _build_context(
+        self,
+        query_id: str,
+        clean_query: str,
+        top_k: int,
+        source_filter: Optional[List[str]],
+        embedding: Optional[List[float]] = None,
+        mode: Optional[str] = None,
+    ) -> Tuple[AssembledContext, Optional[RouteDecision]]:
+        """
+        Retrieve, merge and compress context, route the query to a model
+        tier, then pack the context into that model's token budget.
+
+        In analysis mode the budget is left after the analysis prompt and a
+        table computed on the unpacked context; the table sent is rebuilt
+        from the packed blocks and has at most as many rows.
+        """
+        if embedding is None:
+            # One query embedding serves retrieval and context compression
+            embedding = self.retriever.embed_query(clean_query)
+        assembled = self.retriever.assemble_context(
+            clean_query,
+            k=top_k,
+            source_filter=source_filter,
+            embedding=embedding,
+        )
+        if not assembled.blocks:
+            return assembled, None
+
+        stats = assembled.stats
+        logger.info(
+            f"Context [{query_id}]: {stats['chunks']} chunks -> {stats['blocks']} blocks, "
+            f"{stats['context_tokens']} tokens ({stats['tokens_saved']} saved by overlap removal)"
+        )
+
+        if self.compressor:
+            assembled = self.compressor.compress(clean_query, assembled, embedding)
+            compression = assembled.stats["compression"]
+            if compression["applied"]:
+                logger.info(
+                    f"Context [{query_id}]: compressed {compression['tokens_before']} -> "
+                    f"{compression['tokens_after']} tokens "
+                    f"({compression['spans_kept']}/{compression['spans_total']} spans kept)"
+                )
+
+        books = self._prompt_books(assembled, source_filter)
+        route = self.chain.route(clean_query, books, source_filter)
+        table = build_table(clean_query, assembled) if (mode or config.ANSWER_MODE) == "analysis" else None
+        assembled = self.chain.pack_context(clean_query, assembled, books=books, route=route, table=table)
+        budget = assembled.stats["budget"]
+        logger.info(
+            f"Context [{query_id}]: {budget['input_tokens']}/{budget['input_budget']} input tokens "
+            f"for {budget['model']} ({budget['blocks_dropped']} blocks over budget)"
+        )
+        return assembled, route
+
+    def embed_query(self, question: str) -> List[float]:
+        """
+        Embed a question the way query() retrieves with it.
+
+        Pass the result back to query() so the question is embedded once
+        for both the semantic cache lookup and retrieval.
+        """
+        return self.retriever.embed_query(sanitize_query(question))
+
     def get_sources(self) -> List[str]:
         """Get list of available source books."""
         return self.vs_manager.list_sources()
@@ -0,0 +1,76 @@
+"""
+Pre-rendered JSON bodies for cached /query responses.
+
+A cache hit would otherwise rebuild a QueryResponse, validate every
+Citation and serialize the whole answer again. Instead the parts of the
+response that every hit shares are validated and rendered once, when the
+answer is cached, and a hit only appends the fields that differ per
+request (question, cached, created_at and metadata, which carries the
+semantic and stale markers). benchmarks/bench_cache_hit_path.py compares
+this with rebuilding the QueryResponse.
+"""
+import json
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+from api.models.query import QueryResponse
+
+# Fields filled in per request rather than rendered with the cached body
+PER_REQUEST_FIELDS = {"question", "cached", "created_at", "metadata"}
+
+
+def dumps(obj: Any) -> bytes:
+    """Compact JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=str).encode()
+
+
+def render_body(response: Dict[str, Any]) -> str:
+    """
+    Render the shared part of a query response as a QueryResponse would serialize it.
+
+    Args:
+        response: A RAGService.query() result (or one cached from a stream)
+
+    Returns:
+        A JSON object without the per-request fields, for hit_body()
+
+    Raises:
+        pydantic.ValidationError: If the response does not fit QueryResponse
+    """
+    model = QueryResponse(
+        **{k: v for k, v in response.items() if k in QueryResponse.model_fields and k not in PER_REQUEST_FIELDS},
+        question=response.get("question", ""),
+        cached=True,
+        created_at=datetime.utcnow(),
+    )
+    return dumps(model.model_dump(mode="json", exclude=PER_REQUEST_FIELDS)).decode()
+
+
+def hit_body(body: str, question: str, metadata: Optional[Dict[str, Any]], created_at: datetime) -> bytes:
+    """
+    Complete a rendered body for one cache hit.
+
+    Args:
+        body: Output of render_body()
+        question: The question as this request asked it
+        metadata: The hit's metadata (with any semantic or stale markers)
+        created_at: Response timestamp
+
+    Returns:
+        The response body, equivalent to the QueryResponse of the hit
+    """
+    tail = dumps({
+        "question": question,
+        "cached": True,
+        "created_at": created_at.isoformat(),
+        "metadata": metadata,
+    })
+    # Both are non-empty objects: splice them into one
+    return body.encode()[:-1] + b"," + tail[1:]
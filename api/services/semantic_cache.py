@@ -0,0 +1,186 @@
+"""
+Semantic index over cached questions.
+
+Maps question embeddings to exact cache keys so a paraphrase ("restlessness
+and fear of death" for "fear of death with restlessness") can be served the
+answer cached for the original wording. The index lives in each worker's
+memory and only points at entries in the query cache backend; an entry that
+has since been evicted or invalidated is dropped from the index when a
+lookup lands on it.
+
+On an exact miss the question is embedded once and the same embedding is
+reused for retrieval. Only questions with the same index version, source
+filter and mode are compared; a hit at or above SEMANTIC_CACHE_THRESHOLD
+names the matched question in metadata.cache, and /query/cache-stats
+counts semantic lookups and hits apart from exact hits.
+"""
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from api.config import api_config
+
+Scope = Tuple[str, ...]
+
+
+class _ScopeIndex:
+    """Unit-normalized embeddings of one scope's questions, one row per cache key."""
+
+    def __init__(self, dim: int):
+        self.vectors = np.zeros((16, dim), dtype=np.float32)
+        self.added_at = np.zeros(16, dtype=np.float64)
+        self.keys: List[str] = []
+        self.rows: Dict[str, int] = {}
+
+    def add(self, key: str, vector: np.ndarray):
+        row = self.rows.get(key)
+        if row is None:
+            row = len(self.keys)
+            if row == len(self.vectors):
+                self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+                self.added_at = np.concatenate([self.added_at, np.zeros_like(self.added_at)])
+            self.keys.append(key)
+            self.rows[key] = row
+        self.vectors[row] = vector
+        self.added_at[row] = time.time()
+
+    def remove(self, key: str):
+        row = self.rows.pop(key, None)
+        if row is None:
+            return
+        # Move the last row into the gap so live rows stay contiguous
+        last = len(self.keys) - 1
+        if row != last:
+            moved = self.keys[last]
+            self.vectors[row] = self.vectors[last]
+            self.added_at[row] = self.added_at[last]
+            self.keys[row] = moved
+            self.rows[moved] = row
+        self.keys.pop()
+
+    def oldest(self) -> str:
+        return self.keys[int(np.argmin(self.added_at[:len(self.keys)]))]
+
+    def nearest(self, vector: np.ndarray) -> Tuple[Optional[str], float]:
+        if not self.keys:
+            return None, 0.0
+        scores = self.vectors[:len(self.keys)] @ vector
+        row = int(np.argmax(scores))
+        return self.keys[row], float(scores[row])
+
+
+class SemanticIndex:
+    """
+    Nearest-neighbour lookup of cached questions by embedding.
+
+    Questions are grouped into scopes (index version, source filter and
+    answer mode), and a lookup only compares against its own scope, so
+    an answer is never served for a different filter or mode. Similarity
+    is the cosine of unit-normalized embeddings, computed for a whole
+    scope with one matrix-vector product.
+    """
+
+    def __init__(self, threshold: float = None, max_size: int = None):
+        self.threshold = threshold or api_config.SEMANTIC_CACHE_THRESHOLD
+        self.max_size = max_size or api_config.SEMANTIC_CACHE_MAX_SIZE
+        self._scopes: Dict[Scope, _ScopeIndex] = {}
+        self._scope_of: Dict[str, Scope] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.stale = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def add(self, scope: Scope, key: str, embedding: List[float]):
+        """Index a cached question's embedding under its exact cache key."""
+        vector = self._normalize(embedding)
+        if vector is None:
+            return
+        with self._lock:
+            if key not in self._scope_of and len(self._scope_of) >= self.max_size:
+                self._evict_oldest()
+            index = self._scopes.get(scope)
+            if index is not None and index.vectors.shape[1] != len(vector):
+                # The embedding model changed; earlier vectors are not comparable
+                for old_key in index.keys:
+                    self._scope_of.pop(old_key, None)
+                index = None
+            if index is None:
+                index = self._scopes[scope] = _ScopeIndex(len(vector))
+            index.add(key, vector)
+            self._scope_of[key] = scope
+
+    def _evict_oldest(self):
+        # Empty scopes are deleted, so every scope has an oldest key
+        oldest = []
+        for index in self._scopes.values():
+            key = index.oldest()
+            oldest.append((index.added_at[index.rows[key]], key))
+        self._remove(min(oldest)[1])
+
+    def _remove(self, key: str):
+        scope = self._scope_of.pop(key, None)
+        if scope is None:
+            return
+        index = self._scopes[scope]
+        index.remove(key)
+        if not index.keys:
+            del self._scopes[scope]
+
+    def nearest(self, scope: Scope, embedding: List[float]) -> Tuple[Optional[str], float]:
+        """
+        Closest cached question in a scope at or above the threshold.
+
+        Args:
+            scope: Scope the question was asked in
+            embedding: The question's embedding
+
+        Returns:
+            (cache key, similarity), or (None, best similarity) below the threshold
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            self.lookups += 1
+            index = self._scopes.get(scope)
+            if vector is None or index is None or index.vectors.shape[1] != len(vector):
+                return None, 0.0
+            key, similarity = index.nearest(vector)
+        if similarity < self.threshold:
+            return None, similarity
+        return key, similarity
+
+    def record_hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def discard(self, key: str):
+        """Drop a key whose cache entry is gone."""
+        with self._lock:
+            self.stale += 1
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._scopes.clear()
+            self._scope_of.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._scope_of),
+                "scopes": len(self._scopes),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "misses": self.lookups - self.hits,
+                "stale": self.stale,
+                "hit_rate_percent": round(self.hits / self.lookups * 100, 2) if self.lookups else 0,
+                "threshold": self.threshold,
+                "max_size": self.max_size,
+            }
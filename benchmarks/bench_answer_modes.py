@@ -0,0 +1,142 @@
+"""
+Benchmark full-generation answers against locally computed tables.
+
+Full mode has the LLM write the repertorization table and the Analysis;
+analysis mode builds the table from the graded rubric entries in the
+context and asks the LLM only for the Analysis paragraph. Both run
+through RemedyChain's streaming path against the fake LLM server, with
+context taken from the Phatak and Fredrick repertories in data/.
+
+Reports time to first visible text, total latency and output tokens per
+mode. Latency follows the fake server's tokens-per-second setting, so the
+saving is proportional to the output tokens no longer generated.
+
+Usage:
+    python benchmarks/bench_answer_modes.py
+    python benchmarks/bench_answer_modes.py --runs 10 --tokens-per-sec 40
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+# Add project root to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from langchain_core.documents import Document
+
+from benchmarks.fake_llm_server import FakeLLMOptions, start_server
+from src.config import config
+from src.context_assembler import AssembledContext, ContextBlock
+from src.llm_chain import RemedyChain
+from src.repertorization import build_table
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+
+# (book file, first line, last line) of the excerpts used as context
+EXCERPTS = [
+    ("Phatak.txt", 17550, 17610),  # FEAR and its sub-rubrics
+    ("Fedrick.txt", 0, 30),  # MIND: times of day
+]
+
+QUERIES = [
+    "fear of being alone, anxiety in the morning, worse in the evening",
+    "fear of animals and dogs, fear of arrest, worse at night",
+    "fear in darkness, abrupt manner, complaints in the afternoon",
+]
+
+
+def load_context() -> AssembledContext:
+    blocks = []
+    for rank, (name, first, last) in enumerate(EXCERPTS):
+        # The loader tries utf-8 first and falls back to latin-1
+        raw = (DATA_DIR / name).read_bytes()
+        try:
+            text = raw.decode("utf-8")
+        except UnicodeDecodeError:
+            text = raw.decode("latin-1")
+        excerpt = "\n".join(text.splitlines()[first:last])
+        doc = Document(page_content=excerpt, metadata={"book_name": Path(name).stem})
+        blocks.append(ContextBlock(excerpt, [doc], rank, 0.0))
+    return AssembledContext(blocks, [block.documents[0] for block in blocks])
+
+
+def run_query(chain: RemedyChain, question: str, assembled: AssembledContext, mode: str) -> Dict[str, Any]:
+    start = time.perf_counter()
+    table = build_table(question, assembled) if mode == "analysis" else None
+    table_ms = (time.perf_counter() - start) * 1000
+    first_ms = table_ms if table is not None else None
+
+    usage: Dict[str, Any] = {}
+    for token in chain.generate_response_streaming(
+        question, assembled.render(), books=assembled.books, usage=usage, table=table
+    ):
+        if first_ms is None:
+            first_ms = (time.perf_counter() - start) * 1000
+
+    return {
+        "table_ms": table_ms,
+        "first_text_ms": first_ms,
+        "total_ms": (time.perf_counter() - start) * 1000,
+        "completion_tokens": usage.get("completion_tokens", 0),
+        "local_table": table is not None,
+    }
+
+
+def summarize(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def median(name: str) -> float:
+        return round(statistics.median(sample[name] for sample in samples), 1)
+
+    return {
+        "requests": len(samples),
+        "local_tables": sum(sample["local_table"] for sample in samples),
+        "table_ms_p50": round(statistics.median(sample["table_ms"] for sample in samples), 3),
+        "first_text_ms_p50": median("first_text_ms"),
+        "total_ms_p50": median("total_ms"),
+        "completion_tokens_mean": round(statistics.mean(sample["completion_tokens"] for sample in samples), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=3, help="Runs of every query per mode")
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=80.0)
+    args = parser.parse_args()
+
+    server = start_server(FakeLLMOptions(ttft_ms=args.ttft_ms, tokens_per_sec=args.tokens_per_sec, seed=0))
+    os.environ["USE_OPENROUTER"] = "true"
+    os.environ["OPENROUTER_API_KEY"] = "bench-key"
+    config.LLM_HEDGE_ENABLED = False
+    config.OPENROUTER_BASE_URL = server.base_url
+    chain = RemedyChain()
+    assembled = load_context()
+
+    try:
+        results = {}
+        for mode in ("full", "analysis"):
+            samples = [
+                run_query(chain, question, assembled, mode)
+                for _ in range(args.runs)
+                for question in QUERIES
+            ]
+            results[mode] = summarize(samples)
+        full, analysis = results["full"], results["analysis"]
+        results["saving"] = {
+            "total_ms_percent": round((1 - analysis["total_ms_p50"] / full["total_ms_p50"]) * 100, 1),
+            "completion_tokens_percent": round(
+                (1 - analysis["completion_tokens_mean"] / full["completion_tokens_mean"]) * 100, 1
+            ),
+        }
+        print(json.dumps(results, indent=2))
+    finally:
+        chain.clients.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Benchmark the /query cache-hit path: model rebuild vs pre-rendered body.
+
+Before, a hit rebuilt a QueryResponse (validating every Citation) and
+FastAPI validated and serialized it again through response_model. Now the
+shared part of the body is rendered once when the answer is cached and a
+hit only serializes question, cached, created_at and metadata.
+
+Both paths run as real FastAPI routes, driven through the ASGI interface
+without a network or server, over a cached answer shaped like a real one
+(citations with 300-character excerpts, a parsed table, context and usage
+metadata). History saving is left out; it is the same on both paths.
+
+Usage:
+    python benchmarks/bench_cache_hit_path.py
+    python benchmarks/bench_cache_hit_path.py --requests 20000 --citations 10
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+# Add project root to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fastapi import FastAPI
+from fastapi.responses import Response
+
+from api.models.query import Citation, QueryResponse
+from api.services import response_body
+from api.services.response_body import hit_body, render_body
+
+REMEDIES = ["Acon.", "Ars.", "Bell.", "Calc.", "Gels.", "Lyc.", "Phos.", "Puls."]
+
+
+def cached_answer(citations: int) -> Dict[str, Any]:
+    excerpt = ("FEAR, death, of: Acon., Ars., Cact., Calc., Gels., Nit-ac., Plat. " * 6)[:300] + "..."
+    rows = [
+        {"symptom": f"Symptom {i}", "grades": {remedy: (i + j) % 4 for j, remedy in enumerate(REMEDIES)}}
+        for i in range(6)
+    ]
+    answer = "| Symptom | " + " | ".join(REMEDIES) + " |\n" + "\n".join(
+        f"| {row['symptom']} | " + " | ".join(str(g) for g in row["grades"].values()) + " |" for row in rows
+    ) + "\n\n### Analysis\n\n" + "Aconite covers the sudden fear of death with restlessness. " * 8
+    response = {
+        "id": "0f8e2c1a-8d7b-4d53-9a3e-2b0c6f1d9e77",
+        "question": "fear of death with restlessness, worse at night",
+        "answer": answer,
+        "citations": [
+            {"source": "Phatak", "page": None, "excerpt": excerpt, "chunk_id": f"Phatak:{1200 + i}"}
+            for i in range(citations)
+        ],
+        "sources_used": ["Phatak", "Fedrick"],
+        "processing_time_ms": 4210,
+        "table": {"remedies": REMEDIES, "rows": rows, "totals": {r: 9 for r in REMEDIES}, "analysis": "..."},
+        "metadata": {
+            "context": {"chunks": citations, "blocks": citations - 1, "context_tokens": 1850, "tokens_saved": 120},
+            "usage": {"prompt_tokens": 2410, "completion_tokens": 380, "cached_tokens": 1900, "model": "m"},
+            "answer_mode": "full",
+        },
+    }
+    response["cache_body"] = render_body(response)
+    return response
+
+
+def build_app(cached: Dict[str, Any]) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/model", response_model=QueryResponse)
+    async def model_hit():
+        return QueryResponse(
+            id=cached["id"],
+            question=cached["question"],
+            answer=cached["answer"],
+            citations=[Citation(**c) for c in cached["citations"]],
+            sources_used=cached["sources_used"],
+            processing_time_ms=cached["processing_time_ms"],
+            cached=True,
+            created_at=datetime.utcnow(),
+            table=cached.get("table"),
+            metadata=cached.get("metadata"),
+        )
+
+    @app.post("/prerendered")
+    async def prerendered_hit():
+        return Response(
+            content=hit_body(cached["cache_body"], cached["question"], cached.get("metadata"), datetime.utcnow()),
+            media_type="application/json",
+        )
+
+    return app
+
+
+async def call(app: FastAPI, path: str) -> bytes:
+    """One POST through the ASGI interface; returns the response body."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"content-type", b"application/json")], "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    body: List[bytes] = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return b"".join(body)
+
+
+async def measure(app: FastAPI, path: str, requests: int) -> Dict[str, Any]:
+    for _ in range(min(200, requests)):
+        await call(app, path)
+    samples = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        await call(app, path)
+        samples.append((time.perf_counter() - t0) * 1e6)
+    elapsed = time.perf_counter() - start
+    samples.sort()
+    return {
+        "requests": requests,
+        "us_p50": round(statistics.median(samples), 1),
+        "us_p99": round(samples[int(len(samples) * 0.99) - 1], 1),
+        "requests_per_sec": round(requests / elapsed),
+    }
+
+
+async def run(args) -> Dict[str, Any]:
+    cached = cached_answer(args.citations)
+    app = build_app(cached)
+
+    # Both paths must return the same document (created_at aside)
+    model, prerendered = json.loads(await call(app, "/model")), json.loads(await call(app, "/prerendered"))
+    model.pop("created_at"), prerendered.pop("created_at")
+    assert model == prerendered, "pre-rendered body differs from the QueryResponse"
+
+    results = {
+        "encoder": "orjson" if response_body.orjson is not None else "json",
+        "body_bytes": len(await call(app, "/prerendered")),
+        "model": await measure(app, "/model", args.requests),
+        "prerendered": await measure(app, "/prerendered", args.requests),
+    }
+    results["speedup_p50"] = round(results["model"]["us_p50"] / results["prerendered"]["us_p50"], 2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=5000, help="Hits per path")
+    parser.add_argument("--citations", type=int, default=5, help="Citations in the cached answer")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
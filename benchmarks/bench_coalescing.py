@@ -0,0 +1,132 @@
+"""
+Benchmark stream coalescing under a burst of identical questions.
+
+A popular question often arrives from many clients within a few seconds,
+before its answer is in the query cache. Without coalescing every client
+starts its own LLM stream; with StreamCoalescer the first client's stream
+is shared and later ones replay its events so far and follow it live.
+
+Each client streams through RemedyChain against the fake LLM server,
+arriving at a random offset within the burst window. Reports upstream
+LLM requests, completion tokens and per-client latency for both setups.
+
+Usage:
+    python benchmarks/bench_coalescing.py
+    python benchmarks/bench_coalescing.py --clients 50 --window-ms 2000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List
+
+# Add project root to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from benchmarks.fake_llm_server import FakeLLMOptions, start_server
+from api.services.coalescing import StreamCoalescer
+from src.config import config
+from src.llm_chain import RemedyChain
+
+QUESTION = "fear of death with restlessness, worse at night"
+CONTEXT = (
+    "FEAR, death, of: Acon., Ars., Cact., Calc., Gels., Nit-ac., Plat.\n"
+    "RESTLESSNESS, night: Ars., Rhus-t., Acon., Cham.\n"
+)
+KEY = "bench:fear-of-death"
+
+
+def start_stream(chain: RemedyChain) -> Iterator[str]:
+    usage: Dict[str, Any] = {}
+    for token in chain.generate_response_streaming(QUESTION, CONTEXT, books=["Phatak"], usage=usage):
+        yield json.dumps({"type": "token", "content": token})
+    yield json.dumps({"type": "done", "metadata": {"usage": usage}})
+
+
+def run_burst(open_stream: Callable[[], Iterator[str]], clients: int, window_ms: float, seed: int) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    offsets = sorted(rng.uniform(0, window_ms / 1000) for _ in range(clients))
+    latencies: List[float] = []
+    answers: List[str] = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def client(offset: float):
+        time.sleep(max(0.0, start + offset - time.perf_counter()))
+        arrived = time.perf_counter()
+        text = "".join(
+            event.get("content", "")
+            for event in map(json.loads, open_stream())
+        )
+        with lock:
+            latencies.append((time.perf_counter() - arrived) * 1000)
+            answers.append(text)
+
+    threads = [threading.Thread(target=client, args=(offset,)) for offset in offsets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    return {
+        "clients": clients,
+        "distinct_answers": len(set(answers)),
+        "latency_ms_p50": round(statistics.median(latencies), 1),
+        "latency_ms_p95": round(latencies[int(len(latencies) * 0.95) - 1], 1),
+        "wall_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+
+
+def measure(server, open_stream: Callable[[], Iterator[str]], args) -> Dict[str, Any]:
+    before = dict(server.state.stats)
+    result = run_burst(open_stream, args.clients, args.window_ms, args.seed)
+    after = server.state.stats
+    result["llm_requests"] = after["requests"] - before["requests"]
+    result["completion_tokens"] = after["completion_tokens"] - before["completion_tokens"]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=20, help="Identical questions in the burst")
+    parser.add_argument("--window-ms", type=float, default=1000.0, help="Spread of client arrivals")
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=80.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = start_server(FakeLLMOptions(ttft_ms=args.ttft_ms, tokens_per_sec=args.tokens_per_sec, seed=0))
+    os.environ["USE_OPENROUTER"] = "true"
+    os.environ["OPENROUTER_API_KEY"] = "bench-key"
+    config.LLM_HEDGE_ENABLED = False
+    config.OPENROUTER_BASE_URL = server.base_url
+    chain = RemedyChain()
+    coalescer = StreamCoalescer()
+
+    try:
+        results = {
+            "independent": measure(server, lambda: start_stream(chain), args),
+            "coalesced": measure(server, lambda: coalescer.subscribe(KEY, lambda: start_stream(chain))[0], args),
+        }
+        results["coalescer"] = coalescer.stats()
+        independent, coalesced = results["independent"], results["coalesced"]
+        results["saving"] = {
+            "llm_requests_percent": round((1 - coalesced["llm_requests"] / independent["llm_requests"]) * 100, 1),
+            "completion_tokens_percent": round(
+                (1 - coalesced["completion_tokens"] / max(1, independent["completion_tokens"])) * 100, 1
+            ),
+        }
+        print(json.dumps(results, indent=2))
+    finally:
+        chain.clients.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
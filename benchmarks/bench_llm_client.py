@@ -0,0 +1,132 @@
+"""
+Benchmark the native chat-completions client against the LangChain path.
+
+Measures import time and client-side per-request overhead. Requests are
+answered by an in-process mock transport, so no API quota is used and
+the numbers exclude network and model latency.
+
+Usage:
+    python benchmarks/bench_llm_client.py
+    python benchmarks/bench_llm_client.py --requests 500
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+# Add project root to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.config import config
+from src.llm_chain import RemedyChain
+from src.llm_client import LLMClientPool
+from src.prompts import REMEDY_SYSTEM_PROMPT, USER_PROMPT
+
+CONTEXT = "[Source 1: Phatak - Page 12]\nFEAR: death, of: ACON. ARS. Calc. Gels.\n" * 20
+QUESTION = "fear of death with restlessness"
+
+COMPLETION = {
+    "id": "bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "bench",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 1, "total_tokens": 11},
+}
+
+
+def _mock(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, json=COMPLETION)
+
+
+def measure_import(statement: str, runs: int = 5) -> float:
+    """Median wall time in ms of a fresh interpreter running an import."""
+    code = f"import time; t = time.perf_counter(); {statement}; print(time.perf_counter() - t)"
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", code],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent.parent,
+        )
+        samples.append(float(out.stdout.strip().splitlines()[-1]) * 1000)
+    return statistics.median(samples)
+
+
+def bench_langchain(n: int) -> list:
+    """Previous path: new ChatOpenAI and prompt | llm | parser per request."""
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_openai import ChatOpenAI
+
+    http_client = httpx.Client(transport=httpx.MockTransport(_mock))
+    prompt = ChatPromptTemplate.from_messages([("system", REMEDY_SYSTEM_PROMPT), ("human", USER_PROMPT)])
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        llm = ChatOpenAI(
+            model=config.OPENROUTER_MODEL,
+            temperature=config.LLM_TEMPERATURE,
+            max_tokens=config.LLM_MAX_OUTPUT_TOKENS,
+            api_key="bench-key",
+            base_url=config.OPENROUTER_BASE_URL,
+            http_client=http_client,
+        )
+        chain = prompt | llm | StrOutputParser()
+        chain.invoke({"question": QUESTION, "context": CONTEXT})
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def bench_native(n: int) -> list:
+    """New path: pooled async client, plain string formatting."""
+    pool = LLMClientPool(transport=httpx.MockTransport(_mock))
+    client = pool.get("bench-key", config.OPENROUTER_BASE_URL)
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        messages = RemedyChain.build_messages(QUESTION, CONTEXT)
+        pool.run(client.complete(messages, config.OPENROUTER_MODEL))
+        samples.append((time.perf_counter() - start) * 1000)
+    pool.close()
+    return samples
+
+
+def summarize(samples: list) -> dict:
+    ordered = sorted(samples)
+    return {
+        "mean_ms": round(statistics.mean(ordered), 3),
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p99_ms": round(ordered[int(len(ordered) * 0.99) - 1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per path")
+    args = parser.parse_args()
+
+    results = {
+        "import_ms": {
+            "langchain": round(measure_import(
+                "import langchain_openai, langchain_core.prompts, langchain_core.output_parsers"
+            ), 1),
+            "native": round(measure_import("import src.llm_client"), 1),
+        },
+        "per_request": {
+            "langchain": summarize(bench_langchain(args.requests)),
+            "native": summarize(bench_native(args.requests)),
+        },
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
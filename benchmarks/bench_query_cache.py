@@ -0,0 +1,131 @@
+"""
+Microbenchmark of the striped in-memory cache against the previous list-based LRU.
+
+For each cache size the cache is filled to capacity, then timed on hits,
+on misses and on sets that evict. MemoryBackend (the store behind
+QueryCache) is timed directly with prebuilt keys, so the numbers cover
+the data structure and not key hashing or body rendering. The previous
+implementation kept LRU order in a list (O(n) remove and pop(0) under
+one lock); it is timed on a bounded number of operations so large sizes
+still finish.
+
+Usage:
+    python benchmarks/bench_query_cache.py
+    python benchmarks/bench_query_cache.py --sizes 10000 100000 --ops 20000
+"""
+import argparse
+import importlib.util
+import json
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# Add project root to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+def _load_cache_backends():
+    """Import cache_backends by path; the api.services package loads the whole RAG stack."""
+    path = Path(__file__).parent.parent / "api" / "services" / "cache_backends.py"
+    spec = importlib.util.spec_from_file_location("cache_backends", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+MemoryBackend = _load_cache_backends().MemoryBackend
+
+TTL = 24 * 3600
+# A complete /query response, as QueryCache stores it
+RESPONSE = {
+    "id": "bench",
+    "question": "fear of death",
+    "answer": "Consider Aconite first. " * 4,
+    "citations": [{"source": "Phatak", "page": 176, "excerpt": "FEAR, Death, of: ACO; ARS."}],
+    "sources_used": ["Phatak"],
+    "processing_time_ms": 1200,
+}
+
+
+class ListLRUCache:
+    """The previous implementation: recency kept in a Python list."""
+
+    def __init__(self, max_size: int):
+        self._cache: Dict[str, Dict[str, Any]] = {}
+        self._access_order: List[str] = []
+        self._max_size = max_size
+        self._ttl = TTL
+        self._lock = threading.Lock()
+
+    def _update_access_order(self, key: str):
+        if key in self._access_order:
+            self._access_order.remove(key)
+        self._access_order.append(key)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if key not in self._cache:
+                return None
+            entry = self._cache[key]
+            if time.time() - entry["timestamp"] > self._ttl:
+                return None
+            self._update_access_order(key)
+            return entry["response"]
+
+    def set(self, key: str, response: Dict[str, Any], ttl: float = TTL):
+        with self._lock:
+            if key not in self._cache and len(self._cache) >= self._max_size and self._access_order:
+                self._cache.pop(self._access_order.pop(0), None)
+            self._cache[key] = {"response": response, "timestamp": time.time()}
+            self._update_access_order(key)
+
+
+def per_op_us(fn: Callable[[int], Any], keys: List[int]) -> float:
+    start = time.perf_counter()
+    for i in keys:
+        fn(i)
+    return (time.perf_counter() - start) / len(keys) * 1e6
+
+
+def bench(cache: Any, size: int, ops: int, seed: int = 0) -> Dict[str, float]:
+    rng = random.Random(seed)
+    keys = [f"query {i}" for i in range(size)]
+    missing = [f"missing {i}" for i in range(ops)]
+    new = [f"new {i}" for i in range(ops)]
+    start = time.perf_counter()
+    for key in keys:
+        cache.set(key, RESPONSE, TTL)
+    fill_s = time.perf_counter() - start
+
+    hits = [rng.randrange(size) for _ in range(ops)]
+    return {
+        "fill_s": round(fill_s, 2),
+        "hit_us": round(per_op_us(lambda i: cache.get(keys[i]), hits), 2),
+        "miss_us": round(per_op_us(lambda i: cache.get(missing[i]), list(range(ops))), 2),
+        "evicting_set_us": round(per_op_us(lambda i: cache.set(new[i], RESPONSE, TTL), list(range(ops))), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--ops", type=int, default=50_000, help="Timed operations per measurement")
+    parser.add_argument("--legacy-ops", type=int, default=500, help="Timed operations for the list-based cache")
+    parser.add_argument("--legacy-max-size", type=int, default=100_000, help="Largest size to run the list-based cache at")
+    args = parser.parse_args()
+
+    results = {}
+    for size in args.sizes:
+        row = {"striped_lru": bench(MemoryBackend(max_size=size, max_bytes=size * 1024), size, args.ops)}
+        if size <= args.legacy_max_size:
+            row["list_lru"] = bench(ListLRUCache(size), size, args.legacy_ops)
+        results[size] = row
+        print(json.dumps({size: row}), flush=True)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+"""
+Local stand-in for an OpenAI-compatible chat completions API.
+
+Answers /v1/chat/completions (streaming and non-streaming) with canned
+repertorization tables, so RemedyChain, /query/stream and key rotation can
+be load-tested without spending OpenRouter quota. Latency and failures are
+configurable:
+
+- time to first token, plus a prefill delay per uncached input token
+- streaming speed in tokens per second
+- injected 429 (with Retry-After), 500 and mid-stream connection drops
+- keys that always fail with 401 or 429
+- a simulated prompt cache: a system prompt seen before is reported as
+  cached tokens and skips its share of the prefill delay
+
+A trailing assistant message is treated as a prefill and the answer
+continues after it, like providers that support assistant prefixes.
+Analysis-only requests (a locally computed table in the prompt) are
+answered with the Analysis paragraph alone.
+
+Usage:
+    python benchmarks/fake_llm_server.py --port 8089 --ttft-ms 400 --tokens-per-sec 80
+    OPENROUTER_BASE_URL=http://127.0.0.1:8089/v1 uvicorn api.main:app
+
+Benchmarks can also start it in-process with start_server().
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+# Add project root to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.tokenizer import count_tokens
+
+# Marks an analysis-only request (see ANALYSIS_USER_PROMPT)
+ANALYSIS_MARKER = "COMPUTED REPERTORIZATION TABLE:"
+
+CANNED_ANSWERS = [
+    (
+        ("fear", "anxiety", "death", "restless"),
+        """## Repertorization
+
+| Symptom | Acon. | Ars. | Arg-n. | Gels. |
+| --- | --- | --- | --- | --- |
+| Fear of death | + | + | + | |
+| Restlessness, anxious | + | + | | |
+| Anticipation, complaints from | | | + | + |
+| Worse at night, after midnight | | + | | |
+| Sudden onset after fright | + | | | + |
+| **Total** | **3** | **3** | **2** | **2** |
+
+**Analysis:** Aconite and Arsenicum cover the case equally, but the sudden onset after fright and the intensity of the fear of death favour Aconite; Phatak grades ACON. under fear of death. Arsenicum's restlessness with midnight aggravation is confirmed in Kent's Materia Medica. Argentum nitricum and Gelsemium cover the anticipatory side. Consider Aconite first, then Arsenicum, keeping the patient's full totality in view.
+""",
+    ),
+    (
+        ("headache", "head", "throbbing", "migraine"),
+        """## Repertorization
+
+| Symptom | Bell. | Bry. | Glon. | Nat-m. |
+| --- | --- | --- | --- | --- |
+| Headache, throbbing | + | | + | + |
+| Worse from motion | + | + | | |
+| Worse from sun | | | + | + |
+| Face red, hot | + | | + | |
+| Thirst for large quantities | | + | | + |
+| **Total** | **3** | **2** | **3** | **3** |
+
+**Analysis:** Belladonna, Glonoinum and Natrum muriaticum each cover three symptoms. The throbbing headache with a red, hot face is a Grade 3 picture for BELL. in Phatak, and the sudden violent onset matches Kent's description. Glonoinum is strong if the sun clearly aggravates. Consider Belladonna first, then Glonoinum, keeping the patient's full totality in view.
+""",
+    ),
+    (
+        (),
+        """## Repertorization
+
+| Symptom | Puls. | Sulph. | Lyc. | Sep. |
+| --- | --- | --- | --- | --- |
+| Changeable symptoms | + | | | |
+| Worse in warm room | + | + | + | |
+| Desire for open air | + | + | | + |
+| Flatulence after eating | | + | + | |
+| Indifference to family | | | | + |
+| **Total** | **3** | **3** | **2** | **2** |
+
+**Analysis:** Pulsatilla and Sulphur share the highest coverage, both confirmed by Phatak for warm-room aggravation. Pulsatilla's changeable symptoms and desire for open air are keynotes in Kent's Materia Medica. Sepia's indifference to family is a strong mind rubric but covers less of the case. Consider Pulsatilla first, then Sulphur, keeping the patient's full totality in view.
+""",
+    ),
+]
+
+_TOKEN = re.compile(r"\s*\S+")
+
+
+@dataclass
+class FakeLLMOptions:
+    """Latency and failure behaviour of the fake server."""
+
+    ttft_ms: float = 300.0
+    tokens_per_sec: float = 60.0
+    ms_per_input_token: float = 0.05  # Prefill cost of uncached input tokens
+    rate_429: float = 0.0
+    rate_500: float = 0.0
+    rate_drop: float = 0.0  # Share of streams cut off mid-answer
+    retry_after: float = 1.0
+    bad_keys: Set[str] = field(default_factory=set)  # Always 401
+    throttled_keys: Set[str] = field(default_factory=set)  # Always 429
+    seed: Optional[int] = None
+
+
+class FakeLLMState:
+    """Shared counters, prompt cache and RNG of a running server."""
+
+    def __init__(self, options: FakeLLMOptions):
+        self.options = options
+        self.lock = threading.Lock()
+        self.rng = random.Random(options.seed)
+        self.seen_prefixes: Set[str] = set()
+        self.stats: Dict[str, int] = {
+            "requests": 0,
+            "streams": 0,
+            "injected_429": 0,
+            "injected_500": 0,
+            "injected_drops": 0,
+            "auth_failures": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "completion_tokens": 0,
+        }
+
+    def count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def roll(self, rate: float) -> bool:
+        if rate <= 0:
+            return False
+        with self.lock:
+            return self.rng.random() < rate
+
+    def cached_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """Tokens of a system prompt already seen (simulated prefix cache)."""
+        system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+        if not system:
+            return 0
+        digest = hashlib.sha1(system.encode("utf-8")).hexdigest()
+        with self.lock:
+            hit = digest in self.seen_prefixes
+            self.seen_prefixes.add(digest)
+        return count_tokens(system) if hit else 0
+
+
+def canned_answer(question: str) -> str:
+    """Pick the canned table whose keywords match the question."""
+    lowered = question.lower()
+    for keywords, answer in CANNED_ANSWERS:
+        if not keywords or any(word in lowered for word in keywords):
+            return answer
+    return CANNED_ANSWERS[-1][1]
+
+
+def answer_tokens(messages: List[Dict[str, Any]]) -> List[str]:
+    """Answer for a request, continuing after an assistant prefill if present."""
+    user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+    question, _, table = user.rsplit("PATIENT QUERY:", 1)[-1].partition(ANALYSIS_MARKER)
+    answer = canned_answer(question)
+    if table:
+        answer = answer.split("**Analysis:**", 1)[-1].lstrip()
+    if messages and messages[-1].get("role") == "assistant":
+        prefill = (messages[-1].get("content") or "").rstrip()
+        answer = answer[len(prefill):] if answer.startswith(prefill) else answer
+    return _TOKEN.findall(answer)
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeLLM/1.0"
+
+    @property
+    def state(self) -> FakeLLMState:
+        return self.server.state
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output clean
+
+    def _send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        self._send_json(status, {"error": {"message": message, "code": status}}, headers)
+
+    def do_GET(self):
+        path = self.path.rstrip("/")
+        if path.endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "fake/remedy-model", "object": "model"}]})
+        elif path.endswith("/stats"):
+            with self.state.lock:
+                self._send_json(200, dict(self.state.stats))
+        else:
+            self._send_error(404, "Not found")
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_error(404, "Not found")
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_error(400, "Invalid JSON body")
+            return
+
+        options = self.state.options
+        self.state.count("requests")
+        api_key = (self.headers.get("Authorization") or "").removeprefix("Bearer ").strip()
+
+        if api_key in options.bad_keys:
+            self.state.count("auth_failures")
+            self._send_error(401, "Invalid API key")
+            return
+        if api_key in options.throttled_keys or self.state.roll(options.rate_429):
+            self.state.count("injected_429")
+            self._send_error(429, "Rate limit exceeded", {"Retry-After": f"{options.retry_after:g}"})
+            return
+        if self.state.roll(options.rate_500):
+            self.state.count("injected_500")
+            self._send_error(500, "Internal server error")
+            return
+
+        messages = payload.get("messages") or []
+        model = payload.get("model", "fake/remedy-model")
+        prompt_text = "\n".join(m.get("content") or "" for m in messages)
+        prompt_tokens = count_tokens(prompt_text)
+        cached = min(self.state.cached_tokens(messages), prompt_tokens)
+        tokens = answer_tokens(messages)[: int(payload.get("max_tokens") or 4096)]
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens),
+            "prompt_tokens_details": {"cached_tokens": cached},
+        }
+        self.state.count("prompt_tokens", prompt_tokens)
+        self.state.count("cached_tokens", cached)
+
+        # Prefill: fixed time to first token plus a cost per uncached input token
+        time.sleep((options.ttft_ms + options.ms_per_input_token * (prompt_tokens - cached)) / 1000)
+
+        if payload.get("stream"):
+            self._stream(model, tokens, usage, payload)
+            return
+
+        time.sleep(len(tokens) / options.tokens_per_sec if options.tokens_per_sec > 0 else 0)
+        self.state.count("completion_tokens", len(tokens))
+        self._send_json(200, {
+            "id": f"fake-{time.time_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _event(self, model: str, delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra) -> bytes:
+        body = {
+            "id": "fake-stream",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            **extra,
+        }
+        return f"data: {json.dumps(body)}\n\n".encode("utf-8")
+
+    def _stream(self, model: str, tokens: List[str], usage: Dict[str, Any], payload: Dict[str, Any]):
+        options = self.state.options
+        self.state.count("streams")
+        drop_at = len(tokens) // 2 if self.state.roll(options.rate_drop) else None
+        interval = 1 / options.tokens_per_sec if options.tokens_per_sec > 0 else 0
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            self._write_chunk(self._event(model, {"role": "assistant", "content": ""}))
+            for idx, token in enumerate(tokens):
+                if idx == drop_at:
+                    # Cut the connection without ending the chunked body
+                    self.state.count("injected_drops")
+                    self.close_connection = True
+                    return
+                if idx:
+                    time.sleep(interval)
+                self._write_chunk(self._event(model, {"content": token}))
+                self.state.count("completion_tokens")
+            self._write_chunk(self._event(model, {}, "stop"))
+            if (payload.get("stream_options") or {}).get("include_usage"):
+                self._write_chunk(
+                    f"data: {json.dumps({'id': 'fake-stream', 'choices': [], 'usage': usage})}\n\n".encode("utf-8")
+                )
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # Client cancelled (e.g. a hedge loser)
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, options: FakeLLMOptions):
+        super().__init__(address, FakeLLMHandler)
+        self.state = FakeLLMState(options)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def start_server(options: Optional[FakeLLMOptions] = None, host: str = "127.0.0.1", port: int = 0) -> FakeLLMServer:
+    """
+    Start a fake server on a background thread.
+
+    Args:
+        options: Latency and failure behaviour (defaults if None)
+        host: Interface to bind
+        port: Port to bind (0 picks a free one)
+
+    Returns:
+        The running server; use server.base_url and server.shutdown()
+    """
+    server = FakeLLMServer((host, port), options or FakeLLMOptions())
+    threading.Thread(target=server.serve_forever, name="fake-llm-server", daemon=True).start()
+    return server
+
+
+def _key_set(value: str) -> Set[str]:
+    return {key.strip() for key in value.split(",") if key.strip()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="Fixed time to first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=60.0, help="Streaming speed")
+    parser.add_argument("--ms-per-input-token", type=float, default=0.05, help="Prefill cost per uncached input token")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--rate-500", type=float, default=0.0, help="Share of requests answered with 500")
+    parser.add_argument("--rate-drop", type=float, default=0.0, help="Share of streams dropped mid-answer")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429")
+    parser.add_argument("--bad-keys", type=_key_set, default=set(), help="Comma-separated keys that get 401")
+    parser.add_argument("--throttled-keys", type=_key_set, default=set(), help="Comma-separated keys that get 429")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for error injection")
+    args = parser.parse_args()
+
+    options = FakeLLMOptions(
+        ttft_ms=args.ttft_ms,
+        tokens_per_sec=args.tokens_per_sec,
+        ms_per_input_token=args.ms_per_input_token,
+        rate_429=args.rate_429,
+        rate_500=args.rate_500,
+        rate_drop=args.rate_drop,
+        retry_after=args.retry_after,
+        bad_keys=args.bad_keys,
+        throttled_keys=args.throttled_keys,
+        seed=args.seed,
+    )
+    server = FakeLLMServer((args.host, args.port), options)
+    print(f"Fake LLM server listening on {server.base_url}")
+    print(f"Point the app at it with OPENROUTER_BASE_URL={server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Local stand-in for a Redis server, speaking RESP2 over TCP.
+
+Implements the commands the redis cache backend and redis-py's
+connection setup use, with key expiry, so CACHE_BACKEND=redis can be
+tried and load-tested without installing Redis:
+
+    PING, ECHO, SELECT, CLIENT, HELLO (RESP2 only), GET, MGET, SET (EX/PX/NX/XX),
+    DEL, EXISTS, INCR, INCRBY, EXPIRE, PEXPIRE, TTL, PTTL, KEYS, SCAN, DBSIZE,
+    FLUSHDB, FLUSHALL, SADD, SREM, SMEMBERS, SCARD
+
+Usage:
+    python benchmarks/fake_redis_server.py --port 6390
+    CACHE_BACKEND=redis CACHE_REDIS_URL=redis://127.0.0.1:6390/0 uvicorn api.main:app --workers 4
+
+Benchmarks can also start it in-process with start_server().
+"""
+import argparse
+import fnmatch
+import socketserver
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+OK = b"+OK\r\n"
+WRONGTYPE = "WRONGTYPE Operation against a key holding the wrong kind of value"
+
+
+class RESPError(Exception):
+    pass
+
+
+def encode(value) -> bytes:
+    """Encode a reply as RESP2."""
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, bool):
+        return f":{int(value)}\r\n".encode()
+    if isinstance(value, int):
+        return f":{value}\r\n".encode()
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    if isinstance(value, str):
+        return encode(value.encode())
+    if isinstance(value, (list, tuple, set)):
+        return b"*%d\r\n" % len(value) + b"".join(encode(item) for item in value)
+    raise TypeError(f"Cannot encode {type(value)}")
+
+
+class FakeRedisStore:
+    """Keyspace shared by all connections: key -> (string or set, expires_at or None)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data: Dict[bytes, Tuple[Union[bytes, Set[bytes]], Optional[float]]] = {}
+        self.commands = 0
+
+    def _live(self, key: bytes) -> Optional[Tuple[bytes, Optional[float]]]:
+        item = self.data.get(key)
+        if item is not None and item[1] is not None and item[1] <= time.time():
+            del self.data[key]
+            return None
+        return item
+
+    def _live_keys(self, pattern: bytes = b"*") -> List[bytes]:
+        glob = pattern.decode("utf-8", "replace")
+        return [
+            key for key in list(self.data)
+            if self._live(key) is not None and fnmatch.fnmatchcase(key.decode("utf-8", "replace"), glob)
+        ]
+
+    def execute(self, args: List[bytes]):
+        if not args:
+            raise RESPError("ERR empty command")
+        name = args[0].upper().decode()
+        handler = getattr(self, f"cmd_{name.lower()}", None)
+        if handler is None:
+            raise RESPError(f"ERR unknown command '{name}'")
+        with self.lock:
+            self.commands += 1
+            return handler(*args[1:])
+
+    # Connection commands
+    def cmd_ping(self, message: bytes = None):
+        return b"PONG" if message is None else message
+
+    def cmd_echo(self, message: bytes):
+        return message
+
+    def cmd_select(self, db: bytes):
+        return OK
+
+    def cmd_client(self, *args):
+        return OK
+
+    def cmd_hello(self, *args):
+        if args and args[0] != b"2":
+            raise RESPError("NOPROTO this server only speaks RESP2")
+        return [b"server", b"fake-redis", b"proto", 2]
+
+    # String commands
+    def cmd_get(self, key: bytes):
+        item = self._live(key)
+        if item is not None and not isinstance(item[0], bytes):
+            raise RESPError(WRONGTYPE)
+        return None if item is None else item[0]
+
+    def cmd_mget(self, *keys: bytes):
+        # MGET answers nil for keys of other types
+        return [item[0] if item and isinstance(item[0], bytes) else None for item in map(self._live, keys)]
+
+    def cmd_set(self, key: bytes, value: bytes, *options: bytes):
+        expires_at = None
+        nx = xx = False
+        opts = [opt.upper() for opt in options]
+        i = 0
+        while i < len(opts):
+            if opts[i] in (b"EX", b"PX"):
+                amount = float(options[i + 1])
+                expires_at = time.time() + (amount if opts[i] == b"EX" else amount / 1000)
+                i += 2
+                continue
+            nx = nx or opts[i] == b"NX"
+            xx = xx or opts[i] == b"XX"
+            i += 1
+        exists = self._live(key) is not None
+        if (nx and exists) or (xx and not exists):
+            return None
+        self.data[key] = (value, expires_at)
+        return OK
+
+    def cmd_incrby(self, key: bytes, amount: bytes):
+        item = self._live(key)
+        try:
+            value = int(item[0]) if item else 0
+        except (ValueError, TypeError):
+            raise RESPError("ERR value is not an integer or out of range")
+        value += int(amount)
+        self.data[key] = (str(value).encode(), item[1] if item else None)
+        return value
+
+    def cmd_incr(self, key: bytes):
+        return self.cmd_incrby(key, b"1")
+
+    # Set commands
+    def _set(self, key: bytes, create: bool = False) -> Optional[Set[bytes]]:
+        item = self._live(key)
+        if item is None:
+            if not create:
+                return None
+            item = self.data[key] = (set(), None)
+        if not isinstance(item[0], set):
+            raise RESPError(WRONGTYPE)
+        return item[0]
+
+    def cmd_sadd(self, key: bytes, *members: bytes):
+        members_set = self._set(key, create=True)
+        before = len(members_set)
+        members_set.update(members)
+        return len(members_set) - before
+
+    def cmd_srem(self, key: bytes, *members: bytes):
+        members_set = self._set(key)
+        if members_set is None:
+            return 0
+        before = len(members_set)
+        members_set.difference_update(members)
+        if not members_set:
+            del self.data[key]
+        return before - len(members_set)
+
+    def cmd_smembers(self, key: bytes):
+        return sorted(self._set(key) or ())
+
+    def cmd_scard(self, key: bytes):
+        return len(self._set(key) or ())
+
+    # Keyspace commands
+    def cmd_del(self, *keys: bytes):
+        return sum(1 for key in keys if self._live(key) is not None and self.data.pop(key, None))
+
+    def cmd_exists(self, *keys: bytes):
+        return sum(1 for key in keys if self._live(key) is not None)
+
+    def cmd_pexpire(self, key: bytes, ms: bytes):
+        item = self._live(key)
+        if item is None:
+            return 0
+        self.data[key] = (item[0], time.time() + int(ms) / 1000)
+        return 1
+
+    def cmd_expire(self, key: bytes, seconds: bytes):
+        return self.cmd_pexpire(key, str(int(seconds) * 1000).encode())
+
+    def cmd_pttl(self, key: bytes):
+        item = self._live(key)
+        if item is None:
+            return -2
+        return -1 if item[1] is None else int((item[1] - time.time()) * 1000)
+
+    def cmd_ttl(self, key: bytes):
+        ms = self.cmd_pttl(key)
+        return ms if ms < 0 else int(ms / 1000)
+
+    def cmd_keys(self, pattern: bytes):
+        return self._live_keys(pattern)
+
+    def cmd_scan(self, cursor: bytes, *options: bytes):
+        pattern, count = b"*", 10
+        opts = list(options)
+        for i in range(0, len(opts) - 1, 2):
+            if opts[i].upper() == b"MATCH":
+                pattern = opts[i + 1]
+            elif opts[i].upper() == b"COUNT":
+                count = int(opts[i + 1])
+        keys = sorted(self._live_keys(pattern))
+        start = int(cursor)
+        page = keys[start:start + count]
+        next_cursor = start + count if start + count < len(keys) else 0
+        return [str(next_cursor).encode(), page]
+
+    def cmd_dbsize(self):
+        return len(self._live_keys())
+
+    def cmd_flushdb(self, *args):
+        self.data.clear()
+        return OK
+
+    def cmd_flushall(self, *args):
+        return self.cmd_flushdb()
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    """One client connection: parse RESP arrays (or inline commands) and reply."""
+
+    def _read_command(self) -> Optional[List[bytes]]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()  # Inline command, e.g. from telnet
+        args = []
+        for _ in range(int(line[1:])):
+            header = self.rfile.readline()
+            size = int(header[1:])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def handle(self):
+        store: FakeRedisStore = self.server.store
+        while True:
+            try:
+                args = self._read_command()
+            except (ConnectionError, ValueError):
+                return
+            if args is None:
+                return
+            try:
+                reply = store.execute(args)
+                self.wfile.write(reply if reply is OK else encode(reply))
+            except RESPError as e:
+                self.wfile.write(f"-{e}\r\n".encode())
+            except (ValueError, TypeError, IndexError):
+                self.wfile.write(b"-ERR syntax error\r\n")
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: Tuple[str, int]):
+        super().__init__(address, FakeRedisHandler)
+        self.store = FakeRedisStore()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0) -> FakeRedisServer:
+    """
+    Start a fake Redis server on a background thread.
+
+    Args:
+        host: Interface to bind
+        port: Port to bind (0 picks a free one)
+
+    Returns:
+        The running server; use server.url and server.shutdown()
+    """
+    server = FakeRedisServer((host, port))
+    threading.Thread(target=server.serve_forever, name="fake-redis-server", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+
+    server = FakeRedisServer((args.host, args.port))
+    print(f"Fake Redis server on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
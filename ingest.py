@@ -6,8 +6,14 @@ Usage:
     python ingest.py              # Process all files in data/
     python ingest.py --reset      # Clear and rebuild vector store
     python ingest.py --data-dir /path/to/docs  # Custom data directory
+    python ingest.py --book data/Phatak.txt    # Re-ingest one book in place
+    python ingest.py --remove-book Phatak      # Remove one book
+
+Re-ingesting or removing one book leaves the rest of the index, and the
+cached answers that do not cite that book, untouched.
 """
 import argparse
+import json
 import shutil
 import sys
 from pathlib import Path
@@ -16,7 +22,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from src.config import config
-from src.document_loader import load_documents_from_directory
+from src.document_loader import extract_book_name, load_documents_from_directory, load_single_file
 from src.text_splitter import MetadataPreservingTextSplitter
 from src.vector_store import VectorStoreManager
 
@@ -48,8 +54,22 @@ def main():
         default=config.CHUNK_OVERLAP,
         help=f"Chunk overlap for text splitting (default: {config.CHUNK_OVERLAP})",
     )
+    parser.add_argument(
+        "--book",
+        type=Path,
+        help="Re-ingest a single book file, replacing only its chunks",
+    )
+    parser.add_argument(
+        "--remove-book",
+        metavar="BOOK_NAME",
+        help="Remove a single book's chunks from the vector store",
+    )
     args = parser.parse_args()
 
+    if args.book or args.remove_book:
+        update_book(args)
+        return
+
     print("=" * 60)
     print("RAG Medical Remedy Finder - Data Ingestion")
     print("=" * 60)
@@ -128,5 +148,29 @@ def main():
     print("-" * 60)
 
 
+def update_book(args):
+    """Replace or remove one book's chunks in the existing vector store."""
+    vs_manager = VectorStoreManager()
+    if vs_manager.get_vectorstore() is None:
+        print("No vector store found. Run a full ingestion first.")
+        sys.exit(1)
+
+    if args.remove_book:
+        vs_manager.delete_book(args.remove_book)
+        book_name = args.remove_book
+    else:
+        book_name = extract_book_name(args.book)
+        print(f"Loading {args.book} as {book_name}")
+        splitter = MetadataPreservingTextSplitter(
+            chunk_size=args.chunk_size,
+            chunk_overlap=args.chunk_overlap,
+        )
+        chunks = splitter.split_documents(load_single_file(args.book))
+        vs_manager.replace_book(book_name, chunks)
+
+    print(f"\nCached answers citing {book_name} are now stale and will be regenerated.")
+    print(f"To free them at once: POST /api/v1/admin/cache/invalidate with {json.dumps({'books': [book_name]})}")
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,111 @@
+"""
+Warm the query cache with the most asked recent questions.
+
+Ranks the questions in query history by frequency and recency and answers
+the top ones that are not already cached, so they are cache hits before
+peak clinic hours or right after a deploy or re-index.
+
+Usage:
+    python prewarm.py                         # Top PREWARM_LIMIT questions
+    python prewarm.py --limit 100 --token-budget 500000
+    python prewarm.py --dry-run               # Show the ranking only
+    python prewarm.py --report                # Recent runs and their coverage
+
+The API workers only see entries warmed here through a cache they share
+with this process: the disk tier of the memory backend (CACHE_DISK_PATH,
+on by default), or CACHE_BACKEND=sqlite or redis.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Add project root to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from api.config import api_config
+from api.database import SessionLocal, create_tables
+from api.services import prewarm
+from api.services.cache_service import query_cache
+from api.services.rag_service import get_rag_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm the query cache from query history")
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=api_config.PREWARM_LIMIT,
+        help=f"Questions to consider (default: {api_config.PREWARM_LIMIT})",
+    )
+    parser.add_argument(
+        "--days",
+        type=int,
+        default=api_config.PREWARM_DAYS,
+        help=f"Days of history to rank (default: {api_config.PREWARM_DAYS})",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=api_config.PREWARM_CONCURRENCY,
+        help=f"Questions answered at once (default: {api_config.PREWARM_CONCURRENCY})",
+    )
+    parser.add_argument(
+        "--token-budget",
+        type=int,
+        default=api_config.PREWARM_TOKEN_BUDGET,
+        help=f"LLM tokens the run may spend (default: {api_config.PREWARM_TOKEN_BUDGET})",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print the ranked questions without answering them",
+    )
+    parser.add_argument(
+        "--report",
+        action="store_true",
+        help="Print recent runs and the coverage of the day after each",
+    )
+    args = parser.parse_args()
+
+    create_tables()
+    db = SessionLocal()
+    try:
+        if args.report:
+            runs = prewarm.recent_runs(db)
+            print(json.dumps([prewarm.run_summary(db, run) for run in runs], indent=2))
+            return
+
+        candidates = prewarm.rank_questions(db, limit=args.limit, days=args.days)
+        if args.dry_run:
+            for rank, candidate in enumerate(candidates, 1):
+                print(
+                    f"{rank:3d}. {candidate.score:7.2f}  x{candidate.count:<4d} "
+                    f"{candidate.last_asked:%Y-%m-%d %H:%M}  {candidate.question}"
+                )
+            return
+        if not candidates:
+            print(f"No questions in the last {args.days} days of history")
+            return
+
+        print(f"Warming up to {len(candidates)} questions from the last {args.days} days")
+        run = prewarm.prewarm(
+            db,
+            get_rag_service(),
+            "cli",
+            limit=args.limit,
+            days=args.days,
+            concurrency=args.concurrency,
+            token_budget=args.token_budget,
+        )
+        print(json.dumps(prewarm.run_summary(db, run), indent=2))
+        if run.status != "done":
+            sys.exit(1)
+    finally:
+        db.close()
+        # Flush entries still queued for the disk tier
+        query_cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,14 +3,32 @@ Configuration management for the RAG system.
 Handles environment variables, paths, and model settings.
 """
 import os
+import json
+import logging
 from pathlib import Path
 from dotenv import load_dotenv
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+def _json_env(name: str) -> dict:
+    """A JSON object from an environment variable; {} if unset or malformed."""
+    value = os.getenv(name, "{}")
+    try:
+        parsed = json.loads(value)
+    except ValueError:
+        logger.warning(f"Ignoring {name}: not valid JSON")
+        return {}
+    if not isinstance(parsed, dict):
+        logger.warning(f"Ignoring {name}: expected a JSON object")
+        return {}
+    return parsed
+
 
 @dataclass
 class Config:
@@ -42,6 +60,14 @@ class Config:
     TOP_K_RESULTS: int = 3
     SIMILARITY_THRESHOLD: float = 0.3
 
+    # Extractive context compression (keeps the query-relevant spans only)
+    CONTEXT_COMPRESSION_ENABLED: bool = field(
+        default_factory=lambda: os.getenv("CONTEXT_COMPRESSION_ENABLED", "false").lower() == "true"
+    )
+    COMPRESSION_TOKEN_BUDGET: int = field(
+        default_factory=lambda: int(os.getenv("COMPRESSION_TOKEN_BUDGET", "1500"))
+    )
+
     # LLM settings
     @property
     def OPENAI_API_KEY(self) -> Optional[str]:
@@ -49,6 +75,27 @@ class Config:
 
     LLM_MODEL: str = "gpt-4o-mini"  # Cost-effective, good quality
     LLM_TEMPERATURE: float = 0.1  # Low temperature for factual responses
+    LLM_MAX_OUTPUT_TOKENS: int = 2048
+    LLM_TIMEOUT_SECONDS: float = 60.0
+    LLM_CONNECT_TIMEOUT_SECONDS: float = 15.0
+    LLM_MAX_CONNECTIONS: int = 20  # Pooled connections per API key
+    OPENAI_BASE_URL: str = field(
+        default_factory=lambda: os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+    )
+
+    # Input token budgets (prompt + context + question) per model.
+    # Override with MODEL_INPUT_TOKEN_BUDGETS='{"model/id": 12000}'
+    DEFAULT_INPUT_TOKEN_BUDGET: int = field(
+        default_factory=lambda: int(os.getenv("DEFAULT_INPUT_TOKEN_BUDGET", "10000"))
+    )
+    MODEL_INPUT_TOKEN_BUDGETS: Dict[str, int] = field(
+        default_factory=lambda: {
+            "google/gemini-2.5-flash": 16000,
+            "gpt-4o-mini": 16000,
+            "llama3.2": 6000,  # Raise Ollama's num_ctx to at least this
+            **_json_env("MODEL_INPUT_TOKEN_BUDGETS"),
+        }
+    )
 
     # OpenRouter settings (free alternative to OpenAI)
     @property
@@ -74,17 +121,75 @@ class Config:
         except ValueError:
             return None
 
-    OPENROUTER_BASE_URL: str = "https://openrouter.ai/api/v1"
+    # Per-key health tracking and circuit breaking
+    KEY_FAILURE_THRESHOLD: int = 3  # Consecutive failures before the circuit opens
+    KEY_CIRCUIT_OPEN_SECONDS: float = 30.0
+    KEY_RATE_LIMIT_COOLDOWN_SECONDS: float = 5.0  # 429 without Retry-After, doubled per retry
+    KEY_AUTH_COOLDOWN_SECONDS: float = 3600.0  # 401/403: key is likely revoked
+    KEY_MAX_COOLDOWN_SECONDS: float = 300.0
+    KEY_HEALTH_WINDOW: int = 50  # Requests in the rolling success rate
+
+    # Point at benchmarks/fake_llm_server.py to run benchmarks offline
+    OPENROUTER_BASE_URL: str = field(
+        default_factory=lambda: os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+    )
     OPENROUTER_MODEL: str = "google/gemini-2.5-flash"
 
+    @property
+    def OPENROUTER_FALLBACK_MODELS(self) -> List[str]:
+        models = os.getenv("OPENROUTER_FALLBACK_MODELS", "")
+        return [model.strip() for model in models.split(",") if model.strip()]
+
+    # Hedged requests: if the first token is late, race a second request
+    # on another key (or the first fallback model) and keep the faster one
+    LLM_HEDGE_ENABLED: bool = field(
+        default_factory=lambda: os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+    )
+    LLM_HEDGE_DELAY_MS: float = field(
+        default_factory=lambda: float(os.getenv("LLM_HEDGE_DELAY_MS", "2500"))
+    )
+
     @property
     def USE_OPENROUTER(self) -> bool:
         return os.getenv("USE_OPENROUTER", "false").lower() == "true"
 
-    # Ollama settings (alternative local LLM)
-    # Uncomment and configure if using Ollama instead of OpenAI
-    # OLLAMA_BASE_URL: str = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-    # OLLAMA_MODEL: str = os.getenv("OLLAMA_MODEL", "llama3.2")
+    # Ollama settings (local LLM, used as the fast routing tier)
+    OLLAMA_BASE_URL: str = field(
+        default_factory=lambda: os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+    )
+    OLLAMA_MODEL: str = field(default_factory=lambda: os.getenv("OLLAMA_MODEL", "llama3.2"))
+
+    # Streaming guard: stop at a repeated table or Analysis, looping n-grams
+    # or a run-on after the Analysis. Off until its false-positive rate
+    # has been measured on real answers.
+    STREAM_GUARD_ENABLED: bool = field(
+        default_factory=lambda: os.getenv("STREAM_GUARD_ENABLED", "false").lower() == "true"
+    )
+    GUARD_NGRAM_SIZE: int = 10  # Words per n-gram
+    GUARD_NGRAM_REPEATS: int = 3  # Occurrences of one n-gram treated as a loop
+    GUARD_MAX_CHARS_AFTER_ANALYSIS: int = 2500
+
+    # Model routing by query complexity. The fast tier defaults to Ollama;
+    # set ROUTER_FAST_MODEL to a provider model id to keep it remote.
+    # ROUTER_DEEP_MODEL defaults to the standard model with a larger budget.
+    MODEL_ROUTING_ENABLED: bool = field(
+        default_factory=lambda: os.getenv("MODEL_ROUTING_ENABLED", "false").lower() == "true"
+    )
+    ROUTER_FAST_MODEL: str = field(default_factory=lambda: os.getenv("ROUTER_FAST_MODEL", ""))
+    ROUTER_DEEP_MODEL: str = field(default_factory=lambda: os.getenv("ROUTER_DEEP_MODEL", ""))
+    ROUTER_FAST_MAX_TOKENS: int = 1024
+    ROUTER_STANDARD_MAX_TOKENS: int = 1536
+    ROUTER_FAST_MAX_CHARS: int = 80
+    ROUTER_DEEP_MIN_CHARS: int = 300
+    ROUTER_DEEP_MIN_CLAUSES: int = 5
+    ROUTER_DEEP_MIN_BOOKS: int = 4
+
+    # Answer mode: "full" has the LLM write the table and analysis;
+    # "analysis" computes the table locally from graded rubric entries and
+    # asks the LLM only for the Analysis paragraph
+    ANSWER_MODE: str = field(default_factory=lambda: os.getenv("ANSWER_MODE", "full").lower())
+    LOCAL_TABLE_MAX_REMEDIES: int = 5
+    ANALYSIS_MAX_OUTPUT_TOKENS: int = 400
 
     # ChromaDB settings
     CHROMA_COLLECTION_NAME: str = "homeopathy_remedies"
@@ -0,0 +1,193 @@
+"""
+Overlap-aware assembly of retrieved chunks into an LLM context string.
+Adjacent chunks from the same book are merged and their shared overlap
+is sent only once.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from src.config import config
+from src.tokenizer import count_tokens
+
+# Shortest suffix/prefix match treated as a real chunk overlap
+MIN_OVERLAP_CHARS = 20
+
+SOURCE_SEPARATOR = "\n---\n"
+
+
+def format_source(idx: int, citation: str, text: str) -> str:
+    """Format one context entry with its citation label."""
+    return f"[Source {idx}: {citation}]\n{text}\n"
+
+
+def find_overlap(left: str, right: str, max_overlap: int = config.CHUNK_OVERLAP) -> int:
+    """
+    Find how many leading characters of right repeat the end of left.
+
+    Args:
+        left: Earlier chunk text
+        right: Following chunk text
+        max_overlap: Largest overlap to look for
+
+    Returns:
+        Length of the overlapping span (0 if none)
+    """
+    limit = min(len(left), len(right), max_overlap)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+@dataclass
+class ContextBlock:
+    """A run of one or more adjacent chunks from the same book."""
+
+    text: str
+    documents: List[Document]
+    rank: int  # Best retrieval position of any chunk in the block
+    score: float  # Best (lowest) distance of any chunk in the block
+
+    @property
+    def citations(self) -> List[str]:
+        seen = []
+        for doc in self.documents:
+            citation = doc.metadata.get("citation")
+            if citation and citation not in seen:
+                seen.append(citation)
+        return seen
+
+    @property
+    def citation(self) -> str:
+        citations = self.citations
+        if not citations:
+            return f"Source {self.rank + 1}"
+        if len(citations) > 2:
+            return f"{citations[0]} to {citations[-1]}"
+        return "; ".join(citations)
+
+    @property
+    def book_name(self) -> str:
+        return self.documents[0].metadata.get("book_name", "Unknown")
+
+
+@dataclass
+class AssembledContext:
+    """Context blocks ready to be rendered, plus the documents behind them."""
+
+    blocks: List[ContextBlock]
+    documents: List[Document]
+    stats: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def citations(self) -> List[str]:
+        return [block.citation for block in self.blocks]
+
+    @property
+    def books(self) -> List[str]:
+        return sorted({block.book_name for block in self.blocks})
+
+    def render(self) -> str:
+        """Render blocks in order as the context string sent to the LLM."""
+        return SOURCE_SEPARATOR.join(
+            format_source(idx, block.citation, block.text)
+            for idx, block in enumerate(self.blocks, 1)
+        )
+
+
+class ContextAssembler:
+    """
+    Merges neighbouring chunks and orders the merged blocks by relevance.
+
+    Chunks are grouped by source file (and page, for PDFs) and by
+    chunk_index. Consecutive indices are joined with their overlapping
+    span removed; blocks are then ordered by their best retrieval rank.
+    """
+
+    def __init__(self, max_overlap: int = config.CHUNK_OVERLAP):
+        self.max_overlap = max_overlap
+
+    @staticmethod
+    def _group_key(doc: Document) -> Optional[Tuple[str, Any]]:
+        meta = doc.metadata
+        if "chunk_index" not in meta:
+            return None
+        source = meta.get("source") or meta.get("book_name")
+        if source is None:
+            return None
+        return source, meta.get("page")
+
+    def _merge_run(self, run: List[Tuple[int, int, Document, float]]) -> ContextBlock:
+        text = run[0][2].page_content
+        for _, _, doc, _ in run[1:]:
+            overlap = find_overlap(text, doc.page_content, self.max_overlap)
+            if overlap:
+                text += doc.page_content[overlap:]
+            else:
+                text += "\n" + doc.page_content
+        return ContextBlock(
+            text=text,
+            documents=[doc for _, _, doc, _ in run],
+            rank=min(rank for _, rank, _, _ in run),
+            score=min(score for _, _, _, score in run),
+        )
+
+    def assemble(self, results: List[Tuple[Document, float]]) -> AssembledContext:
+        """
+        Assemble retrieval results into context blocks.
+
+        Args:
+            results: (Document, distance) tuples in retrieval order
+
+        Returns:
+            AssembledContext with token statistics in stats
+        """
+        documents = [doc for doc, _ in results]
+        blocks: List[ContextBlock] = []
+        groups: Dict[Tuple[str, Any], List[Tuple[int, int, Document, float]]] = {}
+
+        for rank, (doc, score) in enumerate(results):
+            key = self._group_key(doc)
+            if key is None:
+                blocks.append(ContextBlock(doc.page_content, [doc], rank, score))
+                continue
+            groups.setdefault(key, []).append(
+                (int(doc.metadata["chunk_index"]), rank, doc, score)
+            )
+
+        merged_chunks = 0
+        for entries in groups.values():
+            entries.sort(key=lambda e: e[0])
+            run = [entries[0]]
+            for entry in entries[1:]:
+                if entry[0] == run[-1][0]:
+                    continue  # Same chunk retrieved twice
+                if entry[0] == run[-1][0] + 1:
+                    run.append(entry)
+                    continue
+                blocks.append(self._merge_run(run))
+                merged_chunks += len(run) - 1
+                run = [entry]
+            blocks.append(self._merge_run(run))
+            merged_chunks += len(run) - 1
+
+        blocks.sort(key=lambda b: b.rank)
+        assembled = AssembledContext(blocks=blocks, documents=documents)
+
+        naive = SOURCE_SEPARATOR.join(
+            format_source(idx, doc.metadata.get("citation", f"Source {idx}"), doc.page_content)
+            for idx, doc in enumerate(documents, 1)
+        )
+        raw_tokens = count_tokens(naive)
+        context_tokens = count_tokens(assembled.render())
+        assembled.stats = {
+            "chunks": len(documents),
+            "blocks": len(blocks),
+            "merged_chunks": merged_chunks,
+            "raw_tokens": raw_tokens,
+            "context_tokens": context_tokens,
+            "tokens_saved": max(0, raw_tokens - context_tokens),
+        }
+        return assembled
@@ -0,0 +1,159 @@
+"""
+Extractive compression of assembled context.
+Keeps only the lines and sentences closest to the query, within a token budget.
+"""
+import re
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.config import config
+from src.context_assembler import AssembledContext, ContextBlock
+from src.tokenizer import count_tokens
+
+# Lines longer than this are split further into sentences
+MAX_LINE_CHARS = 300
+MIN_SPAN_CHARS = 8
+ELISION_MARKER = "[...]"
+
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+(?=[A-Z\"(])")
+_PAGE_MARKER = re.compile(r"^---.*---$")
+_RUBRIC_HEAD = re.compile(r"^[^.:]{2,80}:")  # "Beards:", "MORNING: (86)"
+
+
+def _is_continuation(line: str) -> bool:
+    """Whether a line continues the previous one (wrapped prose or remedy list)."""
+    if ":" in line:
+        return False
+    if line[0].islower():
+        return True
+    tokens = line.split()
+    abbreviations = sum(token.endswith((".", ",")) for token in tokens)
+    return abbreviations / len(tokens) >= 0.6
+
+
+def split_spans(text: str) -> List[str]:
+    """
+    Split block text into scoreable spans.
+
+    Wrapped lines are first re-joined, so a rubric keeps its full remedy
+    list. Rubric lines are kept whole; long prose lines from the materia
+    medicas are split into sentences.
+    """
+    lines: List[str] = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or _PAGE_MARKER.match(line):
+            continue
+        if lines and _is_continuation(line):
+            lines[-1] = f"{lines[-1]} {line}"
+        else:
+            lines.append(line)
+
+    spans = []
+    for line in lines:
+        if len(line) < MIN_SPAN_CHARS:
+            continue
+        if len(line) <= MAX_LINE_CHARS or _RUBRIC_HEAD.match(line):
+            spans.append(line)
+            continue
+        spans.extend(
+            sentence for sentence in _SENTENCE_BOUNDARY.split(line)
+            if len(sentence) >= MIN_SPAN_CHARS
+        )
+    return spans
+
+
+class ContextCompressor:
+    """
+    Scores context spans against the query embedding and keeps the best.
+
+    All spans of a request are embedded in one batched call, and the query
+    embedding computed for retrieval is reused. Selected spans
+    stay inside their original block, in original order, so each kept span
+    still carries the citation of the chunk it came from.
+    """
+
+    def __init__(self, embeddings, token_budget: int = None):
+        self.embeddings = embeddings
+        self.token_budget = token_budget or config.COMPRESSION_TOKEN_BUDGET
+
+    def _score(self, query: str, spans: List[str], query_embedding: Optional[Sequence[float]] = None) -> np.ndarray:
+        if query_embedding is None:
+            query_embedding = self.embeddings.embed_query(query)
+        query_vec = np.asarray(query_embedding, dtype=np.float32)
+        span_vecs = np.asarray(self.embeddings.embed_documents(spans), dtype=np.float32)
+        norms = np.linalg.norm(span_vecs, axis=1) * (np.linalg.norm(query_vec) or 1.0)
+        return span_vecs @ query_vec / np.where(norms == 0, 1.0, norms)
+
+    def compress(
+        self,
+        query: str,
+        assembled: AssembledContext,
+        query_embedding: Optional[Sequence[float]] = None,
+    ) -> AssembledContext:
+        """
+        Compress assembled context down to the configured token budget.
+
+        Args:
+            query: Sanitized user query
+            assembled: Context produced by the ContextAssembler
+            query_embedding: The query's retrieval embedding (embedded
+                again if None)
+
+        Returns:
+            New AssembledContext with compressed blocks (unchanged if it
+            already fits the budget or has no scoreable spans); its
+            stats always carry a "compression" entry
+        """
+        stats = dict(assembled.stats)
+        if stats.get("context_tokens", 0) <= self.token_budget:
+            stats["compression"] = {"applied": False, "budget": self.token_budget}
+            return AssembledContext(assembled.blocks, assembled.documents, stats)
+
+        located: List[Tuple[int, int, str]] = []  # (block_idx, span_idx, text)
+        for block_idx, block in enumerate(assembled.blocks):
+            for span_idx, span in enumerate(split_spans(block.text)):
+                located.append((block_idx, span_idx, span))
+        if not located:
+            # Only page markers or fragments; nothing to score
+            stats["compression"] = {"applied": False, "budget": self.token_budget, "spans_total": 0}
+            return AssembledContext(assembled.blocks, assembled.documents, stats)
+
+        scores = self._score(query, [span for _, _, span in located], query_embedding)
+
+        kept = set()
+        used = 0
+        for pos in np.argsort(-scores):
+            span_tokens = count_tokens(located[pos][2])
+            if used + span_tokens > self.token_budget:
+                continue
+            kept.add(int(pos))
+            used += span_tokens
+
+        blocks = []
+        for block_idx, block in enumerate(assembled.blocks):
+            lines = []
+            last_span = -1
+            for pos, (b_idx, span_idx, span) in enumerate(located):
+                if b_idx != block_idx or pos not in kept:
+                    continue
+                if lines and span_idx != last_span + 1:
+                    lines.append(ELISION_MARKER)
+                lines.append(span)
+                last_span = span_idx
+            if lines:
+                blocks.append(ContextBlock("\n".join(lines), block.documents, block.rank, block.score))
+
+        compressed = AssembledContext(blocks, assembled.documents, stats)
+        compressed_tokens = count_tokens(compressed.render())
+        stats["compression"] = {
+            "applied": True,
+            "budget": self.token_budget,
+            "spans_total": len(located),
+            "spans_kept": len(kept),
+            "tokens_before": stats.get("context_tokens", 0),
+            "tokens_after": compressed_tokens,
+        }
+        stats["context_tokens"] = compressed_tokens
+        return compressed
@@ -0,0 +1,114 @@
+"""
+Version markers for the vector index.
+
+Ingestion writes a fresh version next to the Chroma files. The query cache
+puts it in every key, so answers cached against an older index are never
+served after a re-ingest, even from a cache that outlived the process.
+
+Re-ingesting or removing a single book instead bumps that book's entry in
+a per-book version file. Cached answers record the versions of the books
+they cite, and any process sees the change on its next lookup.
+"""
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from src.config import config
+
+VERSION_FILE = "index_version"
+BOOK_VERSIONS_FILE = "book_versions.json"
+UNVERSIONED = "0"  # Index built before version markers existed
+
+# path -> ((inode, mtime_ns), parsed contents), so a lookup per query is one
+# stat() call; markers are replaced by rename, so the inode changes too
+_versions: Dict[Path, Tuple[Tuple[int, int], Any]] = {}
+
+
+def _read_cached(path: Path, parse, default):
+    try:
+        stat = path.stat()
+    except OSError:
+        return default
+    stamp = (stat.st_ino, stat.st_mtime_ns)
+    cached = _versions.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    value = parse(path.read_text())
+    _versions[path] = (stamp, value)
+    return value
+
+
+def _write_atomic(path: Path, text: str):
+    # Write then rename so readers never see a partial marker
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+
+def _new_version() -> str:
+    return f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+
+
+def read_index_version(directory: Optional[Path] = None) -> str:
+    """
+    Current version of the index in a vector store directory.
+
+    Args:
+        directory: Vector store directory (config.VECTORSTORE_DIR if None)
+
+    Returns:
+        The version string, or UNVERSIONED if no marker has been written
+    """
+    path = (directory or config.VECTORSTORE_DIR) / VERSION_FILE
+    return _read_cached(path, lambda text: text.strip() or UNVERSIONED, UNVERSIONED)
+
+
+def bump_index_version(directory: Optional[Path] = None) -> str:
+    """
+    Record that the index in a directory has changed.
+
+    Args:
+        directory: Vector store directory (config.VECTORSTORE_DIR if None)
+
+    Returns:
+        The new version string
+    """
+    version = _new_version()
+    _write_atomic((directory or config.VECTORSTORE_DIR) / VERSION_FILE, version)
+    return version
+
+
+def read_book_versions(directory: Optional[Path] = None) -> Dict[str, str]:
+    """
+    Versions of the books re-ingested or removed one at a time.
+
+    Args:
+        directory: Vector store directory (config.VECTORSTORE_DIR if None)
+
+    Returns:
+        Mapping of book name to version; books never changed alone are absent
+    """
+    path = (directory or config.VECTORSTORE_DIR) / BOOK_VERSIONS_FILE
+    return _read_cached(path, json.loads, {})
+
+
+def bump_book_version(book_name: str, directory: Optional[Path] = None) -> str:
+    """
+    Record that one book's chunks in the index have changed.
+
+    Args:
+        book_name: Book whose chunks were replaced or removed
+        directory: Vector store directory (config.VECTORSTORE_DIR if None)
+
+    Returns:
+        The book's new version string
+    """
+    directory = directory or config.VECTORSTORE_DIR
+    versions = dict(read_book_versions(directory))
+    versions[book_name] = _new_version()
+    _write_atomic(directory / BOOK_VERSIONS_FILE, json.dumps(versions, indent=2, sort_keys=True))
+    return versions[book_name]
@@ -1,16 +1,35 @@
 """
 LLM chain for generating responses from retrieved context.
 """
+import asyncio
 import logging
 import random
-from typing import Tuple, List, Iterator, Optional
+import time
+from collections import deque
+from dataclasses import dataclass, field, replace
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Tuple, List, Optional
 
 import httpx
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
 
 from src.config import config
+from src.context_assembler import AssembledContext
+from src.llm_client import ChatCompletion, LLMClientPool, LLMStreamError
+from src.model_router import ModelRouter, ModelTier, RouteDecision
+from src.output_guard import GuardStats, StreamGuard
+from src.prompts import (
+    ANALYSIS_USER_PROMPT,
+    REMEDY_SYSTEM_PROMPT,
+    USER_PROMPT,
+    build_analysis_system_prompt,
+    build_system_prompt,
+    sections_for_books,
+)
+from src.repertorization import LocalTable
+from src.stream_continuation import ContinuationFilter, continuation_messages
+from src.token_budget import TokenBudgetPlanner
+from src.tokenizer import count_tokens
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -24,21 +43,244 @@ OPENROUTER_HEADERS = {
 RETRYABLE_STATUS_CODES = {401, 403, 429, 500, 502, 503, 504}
 
 
+AUTH_FAILURE_STATUS_CODES = {401, 403}
+
+
+def retry_after_seconds(exc: Exception) -> Optional[float]:
+    """Read a Retry-After header (seconds or HTTP date) from an HTTP error."""
+    if not isinstance(exc, httpx.HTTPStatusError):
+        return None
+    value = exc.response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def error_status_code(exc: Exception) -> Optional[int]:
+    """HTTP status behind an LLM error, if there is one."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code
+    code = getattr(exc, "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+@dataclass
+class KeyHealth:
+    """Rolling health and circuit-breaker state of one API key."""
+
+    consecutive_failures: int = 0
+    circuit: str = "closed"  # closed | open | half_open
+    open_until: float = 0.0
+    open_seconds: float = 0.0
+    cooldown_until: float = 0.0
+    probe_in_flight: bool = False
+    latency_ms: Optional[float] = None  # Exponentially weighted moving average
+    outcomes: Deque[bool] = field(default_factory=lambda: deque(maxlen=config.KEY_HEALTH_WINDOW))
+    requests: int = 0
+    failures: int = 0
+    last_status: Optional[int] = None
+    last_error: Optional[str] = None
+
+    @property
+    def success_rate(self) -> float:
+        if not self.outcomes:
+            return 1.0
+        return sum(self.outcomes) / len(self.outcomes)
+
+
 class OpenRouterKeyManager:
-    """Keeps track of available OpenRouter keys and shuffles them deterministically."""
+    """
+    Keeps per-key health for OpenRouter keys and orders them by it.
+
+    Each key tracks consecutive failures, Retry-After cooldowns, rolling
+    latency and success rate. After KEY_FAILURE_THRESHOLD consecutive
+    failures (or any auth failure) its circuit opens and the key is skipped
+    until the open period ends; then a single half-open probe decides
+    whether it closes again or reopens for twice as long. Keys of equal
+    health are shuffled so load still spreads across them.
+    """
+
+    LATENCY_ALPHA = 0.2
 
     def __init__(self, keys: List[str], seed: Optional[int] = None):
         if not keys:
             raise ValueError("At least one OpenRouter API key is required for rotation")
         self._keys = keys
         self._rng = random.Random(seed) if seed is not None else random.Random()
+        self._health: Dict[str, KeyHealth] = {key: KeyHealth() for key in keys}
+        self._lock = Lock()
+
+    def _refresh(self, health: KeyHealth, now: float):
+        if health.circuit == "open" and now >= health.open_until:
+            health.circuit = "half_open"
+            health.probe_in_flight = False
+
+    def _tier(self, health: KeyHealth, now: float) -> int:
+        """0 healthy, 1 half-open probe, 2 degraded, 3 unavailable."""
+        if health.circuit == "open" or now < health.cooldown_until:
+            return 3
+        if health.circuit == "half_open":
+            return 3 if health.probe_in_flight else 1
+        if health.success_rate < 0.5:
+            return 2
+        return 0
 
     def ordered_keys(self) -> List[str]:
+        """
+        Keys to try for a request, healthiest first.
+
+        Unavailable keys (open circuit or cooling down) come last, soonest
+        available first, so a request still has something to try when
+        every key is throttled.
+        """
         if len(self._keys) == 1:
             return self._keys
+        now = time.time()
         shuffled = self._keys[:]
         self._rng.shuffle(shuffled)
-        return shuffled
+        with self._lock:
+            for health in self._health.values():
+                self._refresh(health, now)
+
+            def sort_key(key: str):
+                health = self._health[key]
+                tier = self._tier(health, now)
+                if tier == 3:
+                    return tier, max(health.open_until, health.cooldown_until), 0.0
+                latency_bucket = (health.latency_ms or 0.0) // 500
+                return tier, round(1 - health.success_rate, 1), latency_bucket
+
+            return sorted(shuffled, key=sort_key)
+
+    def record_attempt(self, key: str):
+        """Mark that a request is starting on a key (claims half-open probes)."""
+        with self._lock:
+            health = self._health.get(key)
+            if health is None:
+                return
+            self._refresh(health, time.time())
+            health.requests += 1
+            if health.circuit == "half_open":
+                health.probe_in_flight = True
+
+    def is_available(self, key: str) -> bool:
+        """Whether a key can take a request now (circuit not open, not cooling down)."""
+        now = time.time()
+        with self._lock:
+            health = self._health.get(key)
+            if health is None:
+                return False
+            self._refresh(health, now)
+            return self._tier(health, now) < 3
+
+    def record_cancelled(self, key: str, elapsed_ms: float):
+        """
+        Record a request we cancelled (e.g. the losing side of a hedge).
+
+        Not a failure, but the elapsed time is a lower bound on the key's
+        latency, so it still feeds the latency average.
+        """
+        with self._lock:
+            health = self._health.get(key)
+            if health is None:
+                return
+            health.probe_in_flight = False
+            if health.latency_ms is None:
+                health.latency_ms = elapsed_ms
+            elif elapsed_ms > health.latency_ms:
+                health.latency_ms += self.LATENCY_ALPHA * (elapsed_ms - health.latency_ms)
+
+    def record_success(self, key: str, latency_ms: float):
+        """Record a successful request and its latency."""
+        with self._lock:
+            health = self._health.get(key)
+            if health is None:
+                return
+            health.outcomes.append(True)
+            health.consecutive_failures = 0
+            health.cooldown_until = 0.0
+            if health.circuit != "closed":
+                logger.info("OpenRouter key %s circuit closed", self.redact(key))
+            health.circuit = "closed"
+            health.open_seconds = 0.0
+            health.probe_in_flight = False
+            if health.latency_ms is None:
+                health.latency_ms = latency_ms
+            else:
+                health.latency_ms += self.LATENCY_ALPHA * (latency_ms - health.latency_ms)
+
+    def record_failure(self, key: str, exc: Exception):
+        """Record a failed request; may start a cooldown or open the circuit."""
+        now = time.time()
+        status = error_status_code(exc)
+        with self._lock:
+            health = self._health.get(key)
+            if health is None:
+                return
+            health.outcomes.append(False)
+            health.failures += 1
+            health.consecutive_failures += 1
+            health.last_status = status
+            health.last_error = str(exc)[:200]
+            health.probe_in_flight = False
+
+            if status == 429:
+                retry_after = retry_after_seconds(exc)
+                if retry_after is None:
+                    retry_after = min(
+                        config.KEY_MAX_COOLDOWN_SECONDS,
+                        config.KEY_RATE_LIMIT_COOLDOWN_SECONDS * 2 ** (health.consecutive_failures - 1),
+                    )
+                health.cooldown_until = now + retry_after
+
+            if status in AUTH_FAILURE_STATUS_CODES:
+                open_seconds = config.KEY_AUTH_COOLDOWN_SECONDS
+            elif health.circuit == "half_open":
+                open_seconds = min(config.KEY_MAX_COOLDOWN_SECONDS, max(health.open_seconds, config.KEY_CIRCUIT_OPEN_SECONDS) * 2)
+            elif health.consecutive_failures >= config.KEY_FAILURE_THRESHOLD:
+                open_seconds = config.KEY_CIRCUIT_OPEN_SECONDS
+            else:
+                return
+
+            health.circuit = "open"
+            health.open_seconds = open_seconds
+            health.open_until = now + open_seconds
+            logger.warning(
+                "OpenRouter key %s circuit opened for %.0fs (%s)",
+                self.redact(key),
+                open_seconds,
+                status or type(exc).__name__,
+            )
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """Per-key health snapshot with redacted keys."""
+        now = time.time()
+        with self._lock:
+            stats = []
+            for key in self._keys:
+                health = self._health[key]
+                self._refresh(health, now)
+                stats.append({
+                    "key": self.redact(key),
+                    "circuit": health.circuit,
+                    "cooldown_remaining_s": round(max(0.0, health.cooldown_until - now), 1),
+                    "open_remaining_s": round(max(0.0, health.open_until - now), 1) if health.circuit == "open" else 0.0,
+                    "consecutive_failures": health.consecutive_failures,
+                    "success_rate": round(health.success_rate, 3),
+                    "latency_ms": round(health.latency_ms, 1) if health.latency_ms is not None else None,
+                    "requests": health.requests,
+                    "failures": health.failures,
+                    "last_status": health.last_status,
+                    "last_error": health.last_error,
+                })
+            return stats
 
     @property
     def count(self) -> int:
@@ -51,289 +293,124 @@ class OpenRouterKeyManager:
         return f"{key[:4]}...{key[-4:]}"
 
 
+async def _prepend(first: Optional[str], stream: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Yield an already received first chunk, then the rest of the stream."""
+    if first:
+        yield first
+    async for chunk in stream:
+        yield chunk
+
+
 def _should_retry_error(exc: Exception) -> bool:
     if isinstance(exc, httpx.HTTPStatusError):
         return exc.response.status_code in RETRYABLE_STATUS_CODES
+    if isinstance(exc, (httpx.TransportError, LLMStreamError)):
+        return True
     lowered = str(exc).lower()
     retry_keywords = ["rate limit", "quota", "api key", "auth", "invalid", "too many requests"]
     return any(keyword in lowered for keyword in retry_keywords)
 
 
-# Prompt template for remedy queries
-REMEDY_PROMPT = """
-You are a homeopathic repertorization assistant. You receive patient symptom descriptions along with retrieved excerpts from six homeopathic reference texts. Your job is to identify the most relevant remedies and produce a structured repertorization table.
-
-## SOURCE TEXTS & THEIR FORMATS
-
-TEXTBOOK EXCERPTS:
-{context}
-
-You will receive context chunks from these books. Each has a distinct format you must understand:
-
-### 1. Kent's Materia Medica (kentbook.txt)
-- **Type:** Materia Medica (narrative, remedy-centric)
-- **Format:** Narrative prose organized by REMEDY NAME in uppercase headers (e.g., "BRYONIA", "BAPTISIA").
-- Each remedy section describes the remedy's nature, constitutional type, mental symptoms, and organ-specific symptoms in flowing paragraphs.
-- Keynote symptoms are embedded in prose, sometimes in quotation marks (e.g., "sensation as if a black cloud had settled all over her").
-- Modalities (aggravation/amelioration) and concomitants are woven into the text, not listed separately.
-- Comparisons to other remedies appear inline (e.g., "like Psorinum and Pulsatilla").
-- No abbreviations — remedy names are written in full or nearly so.
-- **Use for:** Understanding the full remedy picture, constitutional matching, and confirming a remedy's overall "personality."
-
----
-
-### 2. Kent's Repertory (kent-repertory.txt)
-- **Type:** Repertory (symptom-centric, comprehensive)
-- **Format:** The classic homeopathic repertory organized by CHAPTER (MIND, VERTIGO, HEAD, EYE, EAR, NOSE, FACE, MOUTH, THROAT, STOMACH, ABDOMEN, RECTUM, STOOL, BLADDER, KIDNEYS, PROSTATE GLAND, URETHRA, URINE, GENITALIA, LARYNX, RESPIRATION, COUGH, EXPECTORATION, CHEST, BACK, EXTREMITIES, SLEEP, CHILL, FEVER, PERSPIRATION, SKIN, GENERALITIES).
-- Under each chapter, rubrics (symptom headings) are listed hierarchically, followed by remedy abbreviations.
-- **Grading system (CRITICAL):**
-  - **Bold / Capitalized** (e.g., "Ars.", "Nux-v.", "Sulph." — first letter capitalized in original) = Grade 2
-  - **ALL CAPS / Bold-italic in original** (e.g., printed in largest type) = Grade 3 (strongest)
-  - **Lowercase / plain** (e.g., "acon.", "bell.") = Grade 1
-  - In this text file, the grading is preserved as: fully capitalized first letter with period = Grade 2-3, all lowercase = Grade 1
-- Sub-rubrics are indented and follow a hierarchical structure from general to specific.
-- Page markers appear as "--- MIND p. N ---" or similar section dividers marked with dashes.
-- Time modalities are given precisely (e.g., "3 a.m.", "9 p.m.", "11 a.m.").
-- **Use for:** Cross-referencing specific symptoms against remedy lists, checking whether a remedy covers a particular rubric, and identifying the grade/weight of a remedy for a specific symptom.
-
----
-
-### 3. Phatak's Repertory (Phatak.txt)
-- **Type:** Repertory (symptom-centric, concise/compact)
-- **Format:** Repertory organized alphabetically by RUBRIC (symptom heading), not by chapter.
-- Under each rubric, remedies are listed using standard abbreviations.
-- **Grading system:**
-  - **UPPERCASE** (e.g., "ARS", "NUX-V", "SUL") = Grade 3 (strongest clinical confirmation)
-  - **Normal case** (e.g., "Bry", "Calc", "Sep") = Grade 1-2
-- Sub-rubrics are marked with bullet (e) or dashes (-), representing modalities and qualifiers.
-- "Agg" = aggravation (worse from); "Amel" = amelioration (better from).
-- "AGG." and "AMEL." in caps denote general (constitutional) modalities.
-- Page markers appear as "--- Page N ---".
-- **Use for:** Quick rubric lookup, confirming remedy-symptom associations, and identifying high-grade (Grade 3) remedies.
-
----
-
-### 4. Dube's Materia Medica (Dube.txt)
-- **Type:** Materia Medica (structured, remedy-centric)
-- **Format:** Organized by remedy, each in a numbered "Chapter".
-- Each remedy chapter has clearly labeled sections:
-  - **INTRODUCTION** — brief overview
-  - **CLINICAL** — conditions treated
-  - **SPHERES OF ACTION / PATHOGENESIS** — organs and systems affected
-  - **CONSTITUTION** — body type, thermal state, miasm, diathesis
-  - **GUIDING SYMPTOMS** — numbered keynote symptoms (MOST IMPORTANT for repertorization)
-  - **PARTICULARS** — organ-wise detailed symptoms with sub-sections
-  - **Modalities** — Aggravation and Amelioration factors
-  - **Relations** — complementary, antidotal, and comparable remedies
-- Remedy cross-references appear in parentheses (e.g., "(Calc. phos; Phos)").
-- **Use for:** Confirming guiding symptoms (numbered keynotes carry high weight), understanding constitutional type, and checking modalities.
-
----
-
-### 5. Mind Rubric Interpretation Dictionary (mind-rubric-interpretation.txt)
-- **Type:** Glossary / Reference dictionary for mental rubric terminology
-- **Format:** 526 numbered entries, each containing:
-  - **(N) RUBRIC NAME** — the mental symptom term as used in repertories
-  - Phonetic pronunciation
-  - Hindi translation
-  - English definition and clinical interpretation
-  - Cross-references to related rubrics (e.g., "see FORSAKEN", "see FEAR, ANXIETY")
-- Examples:
-  - "(23) ANXIETY — a state of feeling discomfort about something come or happen."
-  - "(4) ABSORBED, buried in thoughts — buried in thoughts, closely resembling the dreamy state of mind; higher thoughts, but he is not conscious of them."
-  - "(17) ANGER, irascibility (see IRRITABILITY & QUARRELSOME) — a strong feeling of displeasure and usually of antagonism."
-- **Use for:** Interpreting and disambiguating mental symptom rubrics. When a patient describes an emotional or psychological state, use this dictionary to map their description to the correct repertorial rubric name. This is essential for accurate rubric selection before looking up remedies in Kent's Repertory or Phatak.
-
----
-
-### 6. Clinical Repertory of Body Language (body-language.txt)
-- **Type:** Repertory (observational, non-verbal symptom-centric)
-- **Format:** A unique repertory that maps observable physical behaviors, gestures, posture, facial expressions, appearance, and body language to homeopathic remedies.
-- Organized by categories:
-  - **Basic Modes** — Responsive, Reflective, Fugitive, Combative (overall behavioral disposition)
-  - **Appearance, Personal** — clothing style, grooming (beards, moustache, perfume, glasses, etc.)
-  - **Colours** — color preferences and aversions
-  - **Face / Facial Expressions** — anxious, blank, childish, fierce, frowning, gloomy, happy, idiotic, mask-like, pinched, serene, stupid, wild, wretched, etc.
-  - **Eye Contact** — intimate, mutual, peering, social, etc.
-  - **Laughing** — causeless, childish giggling, etc.
-  - **Gestures** — hand gestures, drawing in the air, hand gripping, hiding, picking lint, wringing, etc.
-  - **Handshake** — aggressive, dead fish, double-handed, stiff, etc.
-  - **Hand-to-Face Gestures** — nail biting, covering ears/eyes/mouth, hand on cheek, chin stroking, etc.
-- Remedies are listed using standard abbreviations after each rubric entry.
-- **Use for:** When the case includes observations about the patient's demeanor, posture, clothing, gestures, facial expression, or general body language — whether reported by the practitioner or described by the patient. These non-verbal cues can help confirm or differentiate remedy choices. A patient who presents with a "dead fish handshake" or "fugitive" basic mode provides valuable prescribing information.
-
----
-
-### 7. Fredrick's Synthesis Repertory (Fedrick.txt)
-- **Type:** Repertory (comprehensive, modern, symptom-centric)
-- **Format:** A large modern repertory organized by body system chapters (MIND, HEAD, EYE, EAR, etc.), structurally similar to Kent's Repertory but significantly expanded.
-- Rubrics are listed hierarchically with sub-rubrics indented below main entries.
-- Includes extensive cross-references using ">" notation (e.g., "> Irritability", "> Forgetful").
-- **Grading system:**
-  - **UPPERCASE bold** (e.g., "ARS.", "SULPH.", "NATM.") = Grade 3 (highest clinical confirmation)
-  - **Capitalized** (e.g., "Calc.", "Puls.", "Sep.") = Grade 2
-  - **Lowercase** (e.g., "ars.", "bry.", "calc.") = Grade 1
-- **Key distinction from Kent's Repertory:** Includes a large number of modern provings and lesser-known remedies (e.g., "dendrpol", "haliaelc", "lacleo", "dreamp", "hydrog") not found in classical repertories. This makes it especially valuable for cases where common polychrests do not fit.
-- Time modalities are listed precisely within rubrics (e.g., MORNING, AFTERNOON, NIGHT, midnight).
-- **Use for:** Cross-referencing rubrics against a broader remedy base, especially when classical repertories yield no strong match. High-grade remedies in this repertory carry strong clinical weight. Particularly useful for confirming or discovering lesser-known remedies in complex or atypical cases.
-
-## YOUR TASK
-
-PATIENT QUERY: {question}
-
-Given the patient's symptoms and the retrieved context, perform the following:
-
-### Step 1: Extract Key Symptoms
-Identify 4–6 key symptoms from the patient description. Prioritize:
-- **Peculiar / rare / striking symptoms** — most valuable for homeopathic prescribing
-- **Mental and emotional symptoms** — use the Mind Rubric Dictionary (Book 5) to map patient descriptions to correct rubric terms
-- **Clear modalities** — worse/better from specific conditions, times, etc.
-- **Observable body language** — if the case includes observations about gestures, posture, expression, demeanor, use the Body Language Repertory (Book 6)
-- **Constitutional features** — thermal state, body type, cravings/aversions
-- **Concomitants** — seemingly unrelated symptoms appearing together
-
-### Step 2: Identify Top Remedies
-From the retrieved context, identify the 3–5 remedies that appear most frequently and strongly across the key symptoms. Consider:
-- A **Grade 3 remedy** in Phatak (UPPERCASE) or Kent's Repertory carries the most weight.
-- A remedy whose **narrative description in Kent's Materia Medica** closely matches the patient's overall picture is significant even if not listed under every rubric.
-- **Guiding Symptoms** (numbered items) in Dube are high-value matches.
-- A remedy confirmed by **both repertories AND a materia medica** is stronger than one found in only one source.
-- **Body language confirmations** from Book 6 can serve as a tiebreaker between otherwise equally matched remedies.
-- **Mind rubric precision matters** — use Book 5 definitions to ensure you are matching the patient's mental state to the correct rubric, not a loosely similar one.
-- **Fredrick's Synthesis Repertory (Book 7)** is especially valuable when classical repertories yield weak results — a high-grade remedy there (UPPERCASE) carries strong weight, and it may surface lesser-known remedies missed by Kent's or Phatak's.
-
-### Step 3: Produce the Repertorization Table
-
-Output **exactly ONE markdown table** in EXACTLY this format. Do NOT output the table more than once. Do NOT add a "Note:" row or any text between the header row and the Total row.
-
-## Repertorization
-
-| Symptom | Rem1. | Rem2. | Rem3. |
-| --- | --- | --- | --- |
-| symptom 1 | + | | + |
-| symptom 2 | | + | |
-| symptom 3 | + | + | |
-| **Total** | **2** | **2** | **1** |
-
-Rules for the table:
-- Column headers use standard homeopathic abbreviations (e.g., "Ars.", "Bry.", "Nux-v.", "Puls.").
-- Mark "+" if the retrieved excerpts confirm or strongly suggest the remedy covers that symptom.
-- Leave blank if there is no confirmation in the provided context.
-- The **Total** row is the LAST row — it sums the "+" marks per remedy.
-- Sort remedy columns so the highest-scoring remedy appears first (leftmost).
-- If a body language observation or mind rubric interpretation contributed to the analysis, include it as one of the symptom rows (e.g., "Fugitive basic mode" or "Anticipation, complaints from").
-- Any notes about unmatched symptoms must appear AFTER the Analysis paragraph, never inside or between tables.
-
-### Step 4: Brief Analysis (after the table)
-
-Provide a short paragraph (3–5 sentences) explaining:
-- Which remedy has the strongest overall coverage and why.
-- Any Grade 3 confirmations from Phatak or Kent's Repertory that strengthen the case.
-- Any keynote or guiding symptom match from Kent's Materia Medica or Dube.
-- If body language or mind rubric interpretation played a role, mention it.
-- Suggest the top 1–2 remedies to consider further, with the caveat that final prescription should account for the patient's full totality.
-
-## IMPORTANT RULES
-
-1. **Only use information present in the retrieved context.** Do not hallucinate remedy-symptom associations.
-2. If the context is insufficient to confirm a remedy for a symptom, leave the cell blank — do not guess.
-3. Use standard homeopathic abbreviations consistently (follow Phatak's convention where possible).
-4. If a symptom cannot be matched to any rubric or remedy description in the retrieved context, note this below the table.
-5. When the patient describes a mental/emotional symptom, first consult the Mind Rubric Dictionary to identify the precise rubric term, then look it up in the repertories.
-6. When observational data about the patient's physical behavior or appearance is available, check the Body Language Repertory for additional remedy confirmations.
-7. When classical repertories yield no strong match, check Fredrick's Synthesis Repertory (Book 7) for broader remedy coverage including modern provings.
-7. Always remind the user that repertorization is a clinical aid, not a final prescription — the practitioner must verify against the full materia medica and the patient's totality.
-"""
-
-def get_llm():
-    """
-    Get configured LLM instance.
-
-    Priority:
-    1. OpenRouter (if USE_OPENROUTER=true and OPENROUTER_API_KEY is set)
-    2. OpenAI (if OPENAI_API_KEY is set)
-
-    Returns:
-        ChatOpenAI instance
-    """
-    # Build a custom httpx client to avoid connection issues in containers
-    http_client = httpx.Client(
-        timeout=httpx.Timeout(60.0, connect=15.0),
-        follow_redirects=True,
-        transport=httpx.HTTPTransport(retries=3),
-    )
-
-    # Check for OpenRouter first
-    if config.USE_OPENROUTER and config.OPENROUTER_API_KEY:
-        logger.info(f"Using OpenRouter with model: {config.OPENROUTER_MODEL}")
-        logger.info(f"OpenRouter base URL: {config.OPENROUTER_BASE_URL}")
-        return ChatOpenAI(
-            model=config.OPENROUTER_MODEL,
-            temperature=config.LLM_TEMPERATURE,
-            max_tokens=2048,
-            api_key=config.OPENROUTER_API_KEY,
-            base_url=config.OPENROUTER_BASE_URL,
-            default_headers={
-                "HTTP-Referer": "https://cliniq-api.run.app",
-                "X-Title": "ClinIQ Homeopathy Assistant",
-            },
-            http_client=http_client,
-        )
+# =============================================================================
+# Alternative: Ollama local LLM
+# =============================================================================
+# Ollama serves an OpenAI-compatible API, so no extra client is needed.
+# Requires Ollama running locally with a model:
+#     ollama pull llama3.2
+# Then set OPENAI_BASE_URL=http://localhost:11434/v1, any non-empty
+# OPENAI_API_KEY, USE_OPENROUTER=false, and LLM_MODEL to the model name.
 
-    # Fall back to OpenAI
-    if config.OPENAI_API_KEY:
-        logger.info(f"Using OpenAI with model: {config.LLM_MODEL}")
-        return ChatOpenAI(
-            model=config.LLM_MODEL,
-            temperature=config.LLM_TEMPERATURE,
-            api_key=config.OPENAI_API_KEY,
-            http_client=http_client,
-        )
 
-    raise ValueError(
-        "No LLM API key configured. Set either OPENROUTER_API_KEY (with USE_OPENROUTER=true) "
-        "or OPENAI_API_KEY in your .env file."
-    )
+class PromptCacheStats:
+    """Running totals of prompt tokens and provider prompt-cache hits."""
 
+    def __init__(self):
+        self._lock = Lock()
+        self._requests = 0
+        self._prompt_tokens = 0
+        self._cached_tokens = 0
+        self._requests_with_hits = 0
+
+    def record(self, usage: Dict[str, int]):
+        with self._lock:
+            self._requests += 1
+            self._prompt_tokens += usage.get("prompt_tokens", 0)
+            self._cached_tokens += usage.get("cached_tokens", 0)
+            if usage.get("cached_tokens"):
+                self._requests_with_hits += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hit_rate = (self._cached_tokens / self._prompt_tokens * 100) if self._prompt_tokens else 0
+            return {
+                "requests": self._requests,
+                "requests_with_cache_hits": self._requests_with_hits,
+                "prompt_tokens": self._prompt_tokens,
+                "cached_tokens": self._cached_tokens,
+                "cached_token_percent": round(hit_rate, 2),
+            }
+
+
+class HedgeStats:
+    """How often hedged requests fire and which side wins."""
 
-# =============================================================================
-# Alternative: Ollama local LLM
-# =============================================================================
-# Uncomment the following to use Ollama instead of OpenAI:
-#
-# from langchain_ollama import ChatOllama
-#
-# def get_ollama_llm():
-#     """
-#     Get Ollama-based local LLM.
-#
-#     Requires Ollama running locally with a model:
-#         ollama pull llama3.2
-#     """
-#     return ChatOllama(
-#         base_url=config.OLLAMA_BASE_URL,
-#         model=config.OLLAMA_MODEL,
-#         temperature=config.LLM_TEMPERATURE
-#     )
-#
-# Then in RemedyChain.__init__, replace:
-#     self.llm = get_llm()
-# with:
-#     self.llm = get_ollama_llm()
+    def __init__(self):
+        self._lock = Lock()
+        self._requests = 0
+        self._fired = 0
+        self._hedge_wins = 0
+        self._primary_wins = 0
+        self._both_failed = 0
+
+    def record(self, fired: bool, winner: Optional[int]):
+        """Record one race; winner is 0 (primary), 1 (hedge) or None (both failed)."""
+        with self._lock:
+            self._requests += 1
+            if not fired:
+                return
+            self._fired += 1
+            if winner == 1:
+                self._hedge_wins += 1
+            elif winner == 0:
+                self._primary_wins += 1
+            else:
+                self._both_failed += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": config.LLM_HEDGE_ENABLED,
+                "delay_ms": config.LLM_HEDGE_DELAY_MS,
+                "requests": self._requests,
+                "hedges_fired": self._fired,
+                "fire_percent": round(self._fired / self._requests * 100, 2) if self._requests else 0,
+                "hedge_wins": self._hedge_wins,
+                "primary_wins_after_hedge": self._primary_wins,
+                "both_failed": self._both_failed,
+                "hedge_win_percent": round(self._hedge_wins / self._fired * 100, 2) if self._fired else 0,
+            }
+
+
+@dataclass(frozen=True)
+class LLMTarget:
+    """One place a request can be sent: API key, endpoint and model."""
+
+    api_key: str
+    base_url: str
+    headers: Dict[str, str]
+    model: str
+    max_tokens: int = config.LLM_MAX_OUTPUT_TOKENS
 
 
 class RemedyChain:
     """Chain for generating remedy answers from context."""
 
-    def __init__(self):
-        self.http_client = httpx.Client(
-            timeout=httpx.Timeout(60.0, connect=15.0),
-            follow_redirects=True,
-            transport=httpx.HTTPTransport(retries=3),
-        )
-        self.prompt = ChatPromptTemplate.from_template(REMEDY_PROMPT)
+    def __init__(self, client_pool: Optional[LLMClientPool] = None):
+        self.budget_planner = TokenBudgetPlanner(REMEDY_SYSTEM_PROMPT + USER_PROMPT)
+        self.cache_stats = PromptCacheStats()
+        self.hedge_stats = HedgeStats()
+        self.guard_stats = GuardStats()
         self.openrouter_manager: Optional[OpenRouterKeyManager] = None
-        self.default_llm: Optional[ChatOpenAI] = None
 
         if config.USE_OPENROUTER and config.OPENROUTER_API_KEYS:
             self.openrouter_manager = OpenRouterKeyManager(
@@ -344,80 +421,498 @@ class RemedyChain:
                 "OpenRouter multi-key rotation enabled (%d keys)",
                 self.openrouter_manager.count,
             )
+        elif config.OPENAI_API_KEY:
+            logger.info(f"Using OpenAI with model: {config.LLM_MODEL}")
         else:
-            self.default_llm = get_llm()
-
-    def _build_chain(self, llm: ChatOpenAI):
-        return self.prompt | llm | StrOutputParser()
-
-    def _create_openrouter_llm(self, api_key: str) -> ChatOpenAI:
-        redacted = OpenRouterKeyManager.redact(api_key)
-        logger.info("OpenRouter key %s chosen", redacted)
-        return ChatOpenAI(
-            model=config.OPENROUTER_MODEL,
-            temperature=config.LLM_TEMPERATURE,
-            max_tokens=2048,
-            api_key=api_key,
-            base_url=config.OPENROUTER_BASE_URL,
-            default_headers=OPENROUTER_HEADERS,
-            http_client=self.http_client,
+            raise ValueError(
+                "No LLM API key configured. Set either OPENROUTER_API_KEY (with USE_OPENROUTER=true) "
+                "or OPENAI_API_KEY in your .env file."
+            )
+
+        self.clients = client_pool or LLMClientPool()
+        self.router = self._build_router()
+
+    @property
+    def model_name(self) -> str:
+        """Model that requests are sent to."""
+        if self.openrouter_manager:
+            return config.OPENROUTER_MODEL
+        return config.LLM_MODEL
+
+    def _build_router(self) -> ModelRouter:
+        if not config.MODEL_ROUTING_ENABLED:
+            return ModelRouter(ModelTier("standard", self.model_name, config.LLM_MAX_OUTPUT_TOKENS), enabled=False)
+
+        if config.ROUTER_FAST_MODEL:
+            fast = ModelTier("fast", config.ROUTER_FAST_MODEL, config.ROUTER_FAST_MAX_TOKENS)
+        else:
+            # Ollama's OpenAI-compatible endpoint; it needs a non-empty key
+            fast = ModelTier(
+                "fast",
+                config.OLLAMA_MODEL,
+                config.ROUTER_FAST_MAX_TOKENS,
+                base_url=f"{config.OLLAMA_BASE_URL.rstrip('/')}/v1",
+                api_key="ollama",
+            )
+        router = ModelRouter(
+            standard=ModelTier("standard", self.model_name, config.ROUTER_STANDARD_MAX_TOKENS),
+            fast=fast,
+            deep=ModelTier("deep", config.ROUTER_DEEP_MODEL or self.model_name, config.LLM_MAX_OUTPUT_TOKENS),
+            enabled=True,
         )
+        logger.info(f"Model routing enabled: fast={fast.model}, standard={router.standard.model}, deep={router.deep.model}")
+        return router
+
+    def route(
+        self,
+        question: str,
+        books: Optional[List[str]] = None,
+        source_filter: Optional[List[str]] = None,
+    ) -> RouteDecision:
+        """Pick the model tier for a query (standard tier if routing is off)."""
+        return self.router.route(question, books, source_filter)
 
-    def _invoke_with_openrouter(
+    def pack_context(
         self,
+        question: str,
+        assembled: AssembledContext,
+        books: Optional[List[str]] = None,
+        route: Optional[RouteDecision] = None,
+        table: Optional[LocalTable] = None,
+    ) -> AssembledContext:
+        """
+        Fit retrieved context into the model's input token budget.
+
+        Args:
+            question: User's question
+            assembled: Retrieved context blocks, most relevant first
+            books: Books the prompt will describe (defaults to the context's books)
+            route: Routing decision; the budget is that of the routed model
+            table: Locally computed table in analysis mode; the budget is
+                then left after the analysis prompt and the table
+
+        Returns:
+            Context trimmed to the budget, with budget usage in its stats
+        """
+        sections = sections_for_books(books if books is not None else assembled.books)
+        if table is not None:
+            static_prompt = build_analysis_system_prompt(sections) + ANALYSIS_USER_PROMPT
+            extra_text = table.to_markdown() + "\n" + table.describe_rubrics()
+        else:
+            static_prompt = build_system_prompt(sections) + USER_PROMPT
+            extra_text = ""
+        return self.budget_planner.pack(
+            question,
+            assembled,
+            route.tier.model if route else self.model_name,
+            static_prompt=static_prompt,
+            extra_text=extra_text,
+        )
+
+    @staticmethod
+    def build_messages(
         question: str,
         context: str,
-    ) -> str:
-        if not self.openrouter_manager:
-            raise ValueError("OpenRouter key manager is not configured")
+        books: Optional[List[str]] = None,
+        table: Optional[LocalTable] = None,
+    ) -> List[Dict[str, str]]:
+        """
+        Render the chat messages for a request.
+
+        Static instructions go first in the system message so every request
+        describing the same books shares a cacheable prefix. With a locally
+        computed table the model is asked only for the Analysis paragraph.
+        """
+        sections = sections_for_books(books)
+        if table is not None:
+            user = ANALYSIS_USER_PROMPT.format(
+                context=context,
+                question=question,
+                table=table.to_markdown(),
+                rubrics=table.describe_rubrics(),
+            )
+            return [
+                {"role": "system", "content": build_analysis_system_prompt(sections)},
+                {"role": "user", "content": user},
+            ]
+        return [
+            {"role": "system", "content": build_system_prompt(sections)},
+            {"role": "user", "content": USER_PROMPT.format(context=context, question=question)},
+        ]
+
+    def _targets(self, route: Optional[RouteDecision] = None) -> List[LLMTarget]:
+        """
+        Targets to try, in order: every key, then fallback models on the best key.
 
+        A tier with its own endpoint (local Ollama) goes first, with the
+        standard tier's targets behind it in case it is down.
+        """
+        tier = route.tier if route else self.router.standard
+        targets = []
+        if tier.base_url:
+            targets.append(LLMTarget(tier.api_key or "", tier.base_url, {}, tier.model, tier.max_tokens))
+            tier = self.router.standard
+
+        if self.openrouter_manager:
+            keys = self.openrouter_manager.ordered_keys()
+            targets.extend(
+                LLMTarget(key, config.OPENROUTER_BASE_URL, OPENROUTER_HEADERS, tier.model, tier.max_tokens)
+                for key in keys
+            )
+            targets.extend(
+                LLMTarget(keys[0], config.OPENROUTER_BASE_URL, OPENROUTER_HEADERS, model, tier.max_tokens)
+                for model in config.OPENROUTER_FALLBACK_MODELS
+                if model != tier.model
+            )
+            return targets
+        targets.append(LLMTarget(config.OPENAI_API_KEY, config.OPENAI_BASE_URL, {}, tier.model, tier.max_tokens))
+        return targets
+
+    def _hedge_target(self, primary: LLMTarget, remaining: List[LLMTarget]) -> Optional[LLMTarget]:
+        """
+        Pick where a hedged request goes, or None if hedging is off.
+
+        With fallback models configured the hedge uses the first one, so a
+        slow provider is raced against a different one; otherwise it uses
+        the same model on the next available key.
+        """
+        if not config.LLM_HEDGE_ENABLED or not self.openrouter_manager:
+            return None
+        other_key = next(
+            (t for t in remaining if self.openrouter_manager.is_available(t.api_key)),
+            None,
+        )
+        fallback_models = [m for m in config.OPENROUTER_FALLBACK_MODELS if m != primary.model]
+        if fallback_models:
+            base = other_key or primary
+            return LLMTarget(base.api_key, base.base_url, base.headers, fallback_models[0], primary.max_tokens)
+        return other_key
+
+    def _record_attempt(self, api_key: str):
+        if self.openrouter_manager:
+            self.openrouter_manager.record_attempt(api_key)
+
+    def _record_success(self, api_key: str, start: float):
+        if self.openrouter_manager:
+            self.openrouter_manager.record_success(api_key, (time.perf_counter() - start) * 1000)
+
+    def _record_failure(self, api_key: str, exc: Exception):
+        if self.openrouter_manager:
+            self.openrouter_manager.record_failure(api_key, exc)
+
+    def _record_cancelled(self, api_key: str, start: float):
+        if self.openrouter_manager:
+            self.openrouter_manager.record_cancelled(api_key, (time.perf_counter() - start) * 1000)
+
+    def _record_usage(self, usage: Dict[str, int], target: Optional[Dict[str, Any]]):
+        if not usage:
+            return
+        self.cache_stats.record(usage)
+        logger.info(
+            "LLM usage: %d prompt tokens (%d cached), %d completion tokens",
+            usage.get("prompt_tokens", 0),
+            usage.get("cached_tokens", 0),
+            usage.get("completion_tokens", 0),
+        )
+        if target is not None:
+            target.update(usage)
+
+    @staticmethod
+    def _estimate_usage(usage: Dict[str, Any], messages: List[Dict[str, str]], answer: str):
+        """Fill token counts the provider did not report with local tokenizer counts."""
+        model = usage.get("model")
+        estimated = False
+        if "prompt_tokens" not in usage:
+            usage["prompt_tokens"] = sum(count_tokens(m["content"], model) for m in messages)
+            estimated = True
+        if "completion_tokens" not in usage:
+            usage["completion_tokens"] = count_tokens(answer, model)
+            estimated = True
+        if estimated:
+            usage["estimated"] = True
+
+    async def _race(
+        self,
+        primary: Callable[[], Awaitable[Any]],
+        hedge: Optional[Callable[[], Awaitable[Any]]],
+        discard: Callable[[Any], Awaitable[None]],
+    ) -> Tuple[Any, int]:
+        """
+        Run the primary attempt, hedging it if it is still pending after the delay.
+
+        Args:
+            primary: Starts the primary attempt
+            hedge: Starts the hedged attempt (None disables hedging)
+            discard: Releases the result of an attempt that finished but lost
+
+        Returns:
+            Tuple of (winning result, 0 for primary or 1 for hedge). The
+            losing attempt is cancelled. If both fail, the primary's error
+            is raised.
+        """
+        first = asyncio.ensure_future(primary())
+        tasks = [first]
+        winner: Optional[asyncio.Future] = None
+        try:
+            if hedge is not None:
+                done, _ = await asyncio.wait({first}, timeout=config.LLM_HEDGE_DELAY_MS / 1000)
+                if not done:
+                    logger.info("No response after %.0f ms — firing hedged request", config.LLM_HEDGE_DELAY_MS)
+                    tasks.append(asyncio.ensure_future(hedge()))
+                elif first.exception() is not None and _should_retry_error(first.exception()):
+                    # The hedge target was taken out of the failover order, so use it now
+                    tasks.append(asyncio.ensure_future(hedge()))
+            pending = set(tasks)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=tasks.index):
+                    if task.exception() is not None:
+                        continue
+                    if winner is None:
+                        winner = task
+                    else:
+                        await discard(task.result())
+        finally:
+            losers = [task for task in tasks if not task.done()]
+            for task in losers:
+                task.cancel()
+            if losers:
+                await asyncio.gather(*losers, return_exceptions=True)
+
+        index = tasks.index(winner) if winner is not None else None
+        if hedge is not None:
+            self.hedge_stats.record(fired=len(tasks) > 1, winner=index)
+            if len(tasks) > 1 and index is not None:
+                logger.info("Hedged request won by %s", "hedge" if index else "primary")
+        if winner is None:
+            raise first.exception()
+        return winner.result(), index
+
+    async def _start_completion(
+        self,
+        target: LLMTarget,
+        messages: List[Dict[str, str]],
+    ) -> Tuple[LLMTarget, ChatCompletion]:
+        client = self.clients.get(target.api_key, target.base_url, target.headers)
+        self._record_attempt(target.api_key)
+        start = time.perf_counter()
+        try:
+            completion = await client.complete(messages, target.model, max_tokens=target.max_tokens)
+        except asyncio.CancelledError:
+            self._record_cancelled(target.api_key, start)
+            raise
+        except Exception as exc:
+            if _should_retry_error(exc):
+                self._record_failure(target.api_key, exc)
+            raise
+        self._record_success(target.api_key, start)
+        return target, completion
+
+    async def _start_stream(
+        self,
+        target: LLMTarget,
+        messages: List[Dict[str, str]],
+        delivered_tokens: int = 0,
+    ) -> Tuple[LLMTarget, AsyncIterator[str], Optional[str], Dict[str, Any]]:
+        """Open a stream and wait for its first token."""
+        client = self.clients.get(target.api_key, target.base_url, target.headers)
+        stream_usage: Dict[str, Any] = {}
+        max_tokens = max(1, target.max_tokens - delivered_tokens)
+        stream = client.stream(messages, target.model, max_tokens=max_tokens, usage=stream_usage)
+        self._record_attempt(target.api_key)
+        start = time.perf_counter()
+        try:
+            first = await stream.__anext__()
+        except StopAsyncIteration:
+            first = None
+        except asyncio.CancelledError:
+            self._record_cancelled(target.api_key, start)
+            raise
+        except Exception as exc:
+            if _should_retry_error(exc):
+                self._record_failure(target.api_key, exc)
+            raise
+        # Time to first token is the latency that matters when streaming
+        self._record_success(target.api_key, start)
+        return target, stream, first, stream_usage
+
+    @staticmethod
+    async def _discard_completion(started: Tuple[LLMTarget, ChatCompletion]):
+        return None
+
+    @staticmethod
+    async def _close_stream(started: Tuple[LLMTarget, AsyncIterator[str], Optional[str], Dict[str, Any]]):
+        await started[1].aclose()
+
+    @staticmethod
+    def _take_hedge_target(hedge: Optional[LLMTarget], remaining: List[LLMTarget]):
+        """Drop the hedge target from the failover list so it is not tried twice."""
+        if hedge is not None:
+            remaining[:] = [t for t in remaining if t != hedge]
+
+    async def _acomplete(
+        self,
+        messages: List[Dict[str, str]],
+        usage: Optional[Dict[str, Any]] = None,
+        route: Optional[RouteDecision] = None,
+    ) -> str:
         last_error: Optional[Exception] = None
-        for key in self.openrouter_manager.ordered_keys():
-            llm = self._create_openrouter_llm(key)
-            chain = self._build_chain(llm)
+        remaining = self._targets(route)
+        while remaining:
+            primary = remaining.pop(0)
+            hedge = self._hedge_target(primary, remaining)
+            self._take_hedge_target(hedge, remaining)
             try:
-                return chain.invoke({"question": question, "context": context})
+                (target, completion), winner = await self._race(
+                    lambda: self._start_completion(primary, messages),
+                    (lambda: self._start_completion(hedge, messages)) if hedge else None,
+                    discard=self._discard_completion,
+                )
             except Exception as exc:
                 if not _should_retry_error(exc):
                     raise
                 last_error = exc
                 logger.warning(
-                    "OpenRouter key %s failed (%s) — trying next key",
-                    OpenRouterKeyManager.redact(key),
+                    "LLM key %s failed (%s) — trying next key",
+                    OpenRouterKeyManager.redact(primary.api_key),
                     exc,
                 )
+                continue
+            self._record_usage(completion.usage, usage)
+            if usage is not None:
+                usage["model"] = target.model
+                usage["key"] = OpenRouterKeyManager.redact(target.api_key)
+            return completion.text
 
-        raise last_error or RuntimeError("All OpenRouter keys failed")
+        raise last_error or RuntimeError("All LLM keys failed")
 
-    def _stream_with_openrouter(self, question: str, context: str) -> Iterator[str]:
-        if not self.openrouter_manager:
-            raise ValueError("OpenRouter key manager is not configured")
+    async def _astream(
+        self,
+        messages: List[Dict[str, str]],
+        usage: Optional[Dict[str, Any]] = None,
+        route: Optional[RouteDecision] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream an answer, failing over to the next key or model on errors.
 
+        If a stream breaks after tokens were delivered, the next target is
+        asked to continue the partial answer (assistant prefill) instead of
+        starting over, and text it repeats is dropped.
+        """
         last_error: Optional[Exception] = None
-        for key in self.openrouter_manager.ordered_keys():
-            llm = self._create_openrouter_llm(key)
-            chain = self._build_chain(llm)
+        delivered: List[str] = []
+        continuations = 0
+        remaining = self._targets(route)
+        while remaining:
+            primary = remaining.pop(0)
+            partial = "".join(delivered)
+            request_messages = continuation_messages(messages, partial) if partial else messages
+            delivered_tokens = count_tokens(partial)
+            hedge = self._hedge_target(primary, remaining)
+            self._take_hedge_target(hedge, remaining)
+            try:
+                (target, stream, first, stream_usage), winner = await self._race(
+                    lambda: self._start_stream(primary, request_messages, delivered_tokens),
+                    (lambda: self._start_stream(hedge, request_messages, delivered_tokens)) if hedge else None,
+                    discard=self._close_stream,
+                )
+            except Exception as exc:
+                if not _should_retry_error(exc):
+                    raise
+                last_error = exc
+                logger.warning(
+                    "LLM key %s streaming failed (%s) — switching keys",
+                    OpenRouterKeyManager.redact(primary.api_key),
+                    exc,
+                )
+                continue
+
+            echo = ContinuationFilter(partial) if partial else None
+            if partial:
+                continuations += 1
+                logger.info(
+                    "Continuing stream on key %s (%s) after %d delivered characters",
+                    OpenRouterKeyManager.redact(target.api_key),
+                    target.model,
+                    len(partial),
+                )
+            if usage is not None:
+                # Recorded now: a stream the guard closes early never reaches its end
+                usage["model"] = target.model
+                usage["key"] = OpenRouterKeyManager.redact(target.api_key)
+                if continuations:
+                    usage["continuations"] = continuations
+            chunks = _prepend(first, stream)
             try:
-                for chunk in chain.stream({"question": question, "context": context}):
-                    yield chunk
+                async for chunk in chunks:
+                    text = echo.feed(chunk) if echo else chunk
+                    if text:
+                        delivered.append(text)
+                        yield text
+                if echo:
+                    text = echo.flush()
+                    if text:
+                        delivered.append(text)
+                        yield text
+                if echo and echo.repeated_chars:
+                    logger.info("Dropped %d repeated characters from the continuation", echo.repeated_chars)
+                self._record_usage(stream_usage, usage)
                 return
             except Exception as exc:
                 if not _should_retry_error(exc):
                     raise
+                self._record_failure(target.api_key, exc)
                 last_error = exc
                 logger.warning(
-                    "OpenRouter key %s streaming failed (%s) — switching keys",
-                    OpenRouterKeyManager.redact(key),
+                    "LLM key %s streaming failed after %d characters (%s) — switching keys",
+                    OpenRouterKeyManager.redact(target.api_key),
+                    len("".join(delivered)),
                     exc,
                 )
+            finally:
+                # Close the wrapper too, or a stream closed early leaves it to the loop's finalizer
+                await chunks.aclose()
+                await stream.aclose()
+
+        raise last_error or RuntimeError("All LLM keys failed during streaming")
+
+    def _log_route(
+        self,
+        route: RouteDecision,
+        usage: Dict[str, Any],
+        start: float,
+        ttft_ms: Optional[float] = None,
+    ):
+        """Log a routing decision with the latency it produced, for tuning thresholds."""
+        total_ms = (time.perf_counter() - start) * 1000
+        usage["route"] = route.tier.name
+        usage["total_ms"] = round(total_ms, 1)
+        if ttft_ms is not None:
+            usage["ttft_ms"] = round(ttft_ms, 1)
+        features = route.features
+        logger.info(
+            f"Route {route.tier.name} ({route.reason}): model={usage.get('model', route.tier.model)} "
+            f"chars={features.get('chars')} clauses={features.get('clauses')} books={features.get('books')} "
+            f"filter={features.get('source_filter')} max_tokens={route.tier.max_tokens} "
+            f"ttft={'-' if ttft_ms is None else f'{ttft_ms:.0f}ms'} total={total_ms:.0f}ms "
+            f"completion_tokens={usage.get('completion_tokens', '-')}"
+        )
 
-        raise last_error or RuntimeError("All OpenRouter keys failed during streaming")
+    @staticmethod
+    def _analysis_route(route: RouteDecision) -> RouteDecision:
+        """The same tier with the smaller output budget of an analysis-only answer."""
+        max_tokens = min(route.tier.max_tokens, config.ANALYSIS_MAX_OUTPUT_TOKENS)
+        return RouteDecision(replace(route.tier, max_tokens=max_tokens), route.reason, route.features)
 
     def generate_response(
         self,
         question: str,
         context: str,
         citations: List[str],
+        books: Optional[List[str]] = None,
+        usage: Optional[Dict[str, Any]] = None,
+        route: Optional[RouteDecision] = None,
+        table: Optional[LocalTable] = None,
     ) -> Tuple[str, List[str]]:
         """
         Generate a response based on context.
@@ -426,6 +921,15 @@ class RemedyChain:
             question: User's question
             context: Retrieved context from documents
             citations: List of citation strings
+            books: Books present in the context; the prompt only describes
+                these (all books if None)
+            usage: Optional dict filled with the provider's token usage
+                (prompt, completion and cached prompt tokens; local
+                tokenizer counts if not reported), the model and redacted
+                key that answered, the routing tier and latency
+            route: Routing decision (routed from the question and books if None)
+            table: Locally computed table; if given only the Analysis
+                paragraph is generated and returned
 
         Returns:
             Tuple of (response_text, citations_used)
@@ -437,27 +941,44 @@ class RemedyChain:
         logger.info(f"Generating response for question: {question[:50]}...")
         logger.info(f"Context length: {len(context)} characters")
 
+        route = route or self.route(question, books)
+        if table is not None:
+            route = self._analysis_route(route)
+        usage = usage if usage is not None else {}
+        messages = self.build_messages(question, context, books, table)
+        start = time.perf_counter()
         try:
-            if self.openrouter_manager:
-                response = self._invoke_with_openrouter(question, context)
-            else:
-                if not self.default_llm:
-                    raise ValueError("No LLM configured for query execution")
-                chain = self._build_chain(self.default_llm)
-                response = chain.invoke({"question": question, "context": context})
+            response = self.clients.run(self._acomplete(messages, usage, route))
+            self._estimate_usage(usage, messages, response)
+            self._log_route(route, usage, start)
             logger.info(f"Response generated successfully, length: {len(response)} characters")
             return response, citations
         except Exception as e:
             logger.error(f"Error generating response: {e}")
             raise
 
-    def generate_response_streaming(self, question: str, context: str):
+    def generate_response_streaming(
+        self,
+        question: str,
+        context: str,
+        books: Optional[List[str]] = None,
+        usage: Optional[Dict[str, Any]] = None,
+        route: Optional[RouteDecision] = None,
+        table: Optional[LocalTable] = None,
+    ):
         """
         Generate a streaming response based on context.
 
         Args:
             question: User's question
             context: Retrieved context from documents
+            books: Books present in the context (all books if None)
+            usage: Optional dict filled with token usage, the answering
+                model and redacted key, routing tier and latency once the
+                stream ends
+            route: Routing decision (routed from the question and books if None)
+            table: Locally computed table; if given only the Analysis
+                paragraph is generated
 
         Yields:
             Response tokens as they are generated
@@ -466,13 +987,48 @@ class RemedyChain:
             yield "Information not found in the provided corpus."
             return
 
-        if self.openrouter_manager:
-            yield from self._stream_with_openrouter(question, context)
-            return
-
-        if not self.default_llm:
-            raise ValueError("No LLM configured for streaming execution")
-
-        chain = self._build_chain(self.default_llm)
-        for chunk in chain.stream({"question": question, "context": context}):
-            yield chunk
+        route = route or self.route(question, books)
+        if table is not None:
+            route = self._analysis_route(route)
+        usage = usage if usage is not None else {}
+        messages = self.build_messages(question, context, books, table)
+        guard = StreamGuard(route.tier.max_tokens) if config.STREAM_GUARD_ENABLED else None
+        start = time.perf_counter()
+        ttft_ms: Optional[float] = None
+        delivered: List[str] = []
+        stream = self.clients.iterate(self._astream(messages, usage, route))
+        try:
+            for chunk in stream:
+                text = guard.feed(chunk) if guard else chunk
+                if text:
+                    if ttft_ms is None:
+                        ttft_ms = (time.perf_counter() - start) * 1000
+                    delivered.append(text)
+                    yield text
+                if guard and guard.stop_reason:
+                    break
+            else:
+                text = guard.flush() if guard else ""
+                if text:
+                    delivered.append(text)
+                    yield text
+        finally:
+            # Cancels the upstream request when the guard stopped early
+            stream.close()
+
+        if guard:
+            self._record_guard(guard, usage)
+        self._estimate_usage(usage, messages, "".join(delivered))
+        self._log_route(route, usage, start, ttft_ms)
+
+    def _record_guard(self, guard: StreamGuard, usage: Dict[str, Any]):
+        report = guard.report()
+        self.guard_stats.record(report)
+        usage["guard"] = report
+        if report["stopped"]:
+            # The provider's usage block never arrives for a cancelled stream
+            usage.setdefault("completion_tokens", report["tokens_delivered"])
+            logger.info(
+                f"Stream guard stopped generation ({report['reason']}) after "
+                f"{report['tokens_delivered']} tokens, ~{report['tokens_saved_estimate']} tokens saved"
+            )
@@ -0,0 +1,228 @@
+"""
+Lean client for OpenAI-compatible chat completions (OpenRouter, OpenAI, ...).
+
+Requests go through one pooled httpx.AsyncClient per API key, which keeps
+connections alive across requests. All clients live on a single
+background event loop, so synchronous callers (FastAPI sync generators,
+Streamlit) can use them without owning a loop.
+"""
+import asyncio
+import json
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Coroutine, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from src.config import config
+
+logger = logging.getLogger(__name__)
+
+
+class LLMStreamError(Exception):
+    """Error reported by the provider inside an SSE stream."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass
+class ChatCompletion:
+    """Result of a non-streaming chat completion."""
+
+    text: str
+    model: str
+    finish_reason: Optional[str] = None
+    usage: Dict[str, int] = field(default_factory=dict)
+
+
+def parse_usage(payload: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """Normalize an OpenAI-style usage block, including cached prompt tokens."""
+    if not payload:
+        return {}
+    details = payload.get("prompt_tokens_details") or {}
+    return {
+        "prompt_tokens": payload.get("prompt_tokens", 0) or 0,
+        "completion_tokens": payload.get("completion_tokens", 0) or 0,
+        "cached_tokens": details.get("cached_tokens", 0) or 0,
+    }
+
+
+class ChatCompletionsClient:
+    """Chat completions for one API key over a pooled async HTTP client."""
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str,
+        headers: Optional[Dict[str, str]] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"Authorization": f"Bearer {api_key}", **(headers or {})},
+            timeout=httpx.Timeout(config.LLM_TIMEOUT_SECONDS, connect=config.LLM_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=config.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=config.LLM_MAX_CONNECTIONS,
+            ),
+            follow_redirects=True,
+            transport=transport or httpx.AsyncHTTPTransport(retries=3),
+        )
+
+    @staticmethod
+    def _payload(
+        messages: List[Dict[str, str]],
+        model: str,
+        max_tokens: int,
+        temperature: float,
+        stream: bool,
+        extra: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        payload = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            **extra,
+        }
+        if stream:
+            payload["stream"] = True
+            payload["stream_options"] = {"include_usage": True}
+        return payload
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        max_tokens: int = config.LLM_MAX_OUTPUT_TOKENS,
+        temperature: float = config.LLM_TEMPERATURE,
+        **extra: Any,
+    ) -> ChatCompletion:
+        """Send a chat completion request and return the full answer."""
+        response = await self._client.post(
+            "/chat/completions",
+            json=self._payload(messages, model, max_tokens, temperature, False, extra),
+        )
+        response.raise_for_status()
+        data = response.json()
+        if "error" in data:
+            raise LLMStreamError(str(data["error"].get("message", data["error"])), data["error"].get("code"))
+        choice = data["choices"][0]
+        return ChatCompletion(
+            text=choice["message"].get("content") or "",
+            model=data.get("model", model),
+            finish_reason=choice.get("finish_reason"),
+            usage=parse_usage(data.get("usage")),
+        )
+
+    async def stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        max_tokens: int = config.LLM_MAX_OUTPUT_TOKENS,
+        temperature: float = config.LLM_TEMPERATURE,
+        usage: Optional[Dict[str, Any]] = None,
+        **extra: Any,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a chat completion over SSE.
+
+        Yields:
+            Text deltas as they arrive. The final usage block, when the
+            provider sends one, is written into the usage dict.
+        """
+        payload = self._payload(messages, model, max_tokens, temperature, True, extra)
+        async with self._client.stream("POST", "/chat/completions", json=payload) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue  # Blank separators and ": keep-alive" comments
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                event = json.loads(data)
+                if "error" in event:
+                    error = event["error"]
+                    raise LLMStreamError(str(error.get("message", error)), error.get("code"))
+                if event.get("usage") and usage is not None:
+                    usage.update(parse_usage(event["usage"]))
+                for choice in event.get("choices") or []:
+                    text = (choice.get("delta") or {}).get("content")
+                    if text:
+                        yield text
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+class LLMClientPool:
+    """
+    Owns the background event loop and one client per (base URL, API key).
+
+    Sync helpers run coroutines and async iterators on that loop, so
+    connection pools are reused by every request in the process.
+    """
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self._transport = transport
+        self._clients: Dict[Tuple[str, str], ChatCompletionsClient] = {}
+        self._lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever,
+            name="llm-client-loop",
+            daemon=True,
+        )
+        self._thread.start()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._loop
+
+    def get(
+        self,
+        api_key: str,
+        base_url: str,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> ChatCompletionsClient:
+        """Return the shared client for an API key, creating it on first use."""
+        key = (base_url, api_key)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = ChatCompletionsClient(api_key, base_url, headers, self._transport)
+                self._clients[key] = client
+            return client
+
+    def run(self, coro: Coroutine) -> Any:
+        """Run a coroutine on the pool's loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def iterate(self, agen: AsyncIterator) -> Iterator:
+        """Consume an async iterator on the pool's loop from synchronous code."""
+        try:
+            while True:
+                try:
+                    yield self.run(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            # Closing early (client disconnect) cancels the upstream request
+            aclose = getattr(agen, "aclose", None)
+            if aclose is not None:
+                self.run(aclose())
+
+    def close(self):
+        """Close every client and stop the loop."""
+        for client in list(self._clients.values()):
+            self.run(client.aclose())
+        self._clients.clear()
+        # Finalize streams left suspended (e.g. after [DONE]) while the loop still runs
+        self.run(self._loop.shutdown_asyncgens())
+        self._loop.call_soon_threadsafe(self._loop.stop)
@@ -0,0 +1,124 @@
+"""
+Routes queries to a model tier by cheap local complexity features.
+Short single-book lookups go to a fast tier, long multi-symptom cases
+to a deep tier, everything else to the standard model.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from src.config import config
+
+# Symptom clauses are separated by punctuation, line breaks or joining words
+_CLAUSE_SPLIT = re.compile(r"[,;.\n]+|\s+(?:and|with|also|but)\s+", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class ModelTier:
+    """A model and output budget for one class of queries."""
+
+    name: str
+    model: str
+    max_tokens: int
+    base_url: Optional[str] = None  # Own endpoint (e.g. local Ollama) instead of the provider's
+    api_key: Optional[str] = None
+
+
+@dataclass
+class RouteDecision:
+    """The tier picked for a query, and why."""
+
+    tier: ModelTier
+    reason: str
+    features: Dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "tier": self.tier.name,
+            "model": self.tier.model,
+            "max_tokens": self.tier.max_tokens,
+            "reason": self.reason,
+            **self.features,
+        }
+
+
+def split_clauses(question: str) -> List[str]:
+    """Split a query into its symptom clauses."""
+    return [clause.strip() for clause in _CLAUSE_SPLIT.split(question) if len(clause.strip()) > 1]
+
+
+def count_clauses(question: str) -> int:
+    """Count symptom clauses in a query."""
+    return len(split_clauses(question))
+
+
+class ModelRouter:
+    """
+    Picks a model tier from query length, clause count and books in play.
+
+    Books in play are those in the retrieved context plus any
+    source_filter; a filter narrowed to one book marks a focused lookup.
+    With routing disabled every query gets the standard tier.
+    """
+
+    def __init__(
+        self,
+        standard: ModelTier,
+        fast: Optional[ModelTier] = None,
+        deep: Optional[ModelTier] = None,
+        enabled: Optional[bool] = None,
+    ):
+        self.standard = standard
+        self.fast = fast
+        self.deep = deep
+        self.enabled = config.MODEL_ROUTING_ENABLED if enabled is None else enabled
+
+    @staticmethod
+    def features(
+        question: str,
+        books: Optional[List[str]] = None,
+        source_filter: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        return {
+            "chars": len(question),
+            "clauses": count_clauses(question),
+            "books": len(books or []),
+            "source_filter": len(source_filter or []),
+        }
+
+    def route(
+        self,
+        question: str,
+        books: Optional[List[str]] = None,
+        source_filter: Optional[List[str]] = None,
+    ) -> RouteDecision:
+        """
+        Pick the tier for a query.
+
+        Args:
+            question: Sanitized user query
+            books: Books the prompt will describe
+            source_filter: Books the user restricted the search to
+
+        Returns:
+            RouteDecision with the tier, a short reason and the features used
+        """
+        features = self.features(question, books, source_filter)
+        if not self.enabled:
+            return RouteDecision(self.standard, "routing disabled", features)
+
+        if self.deep is not None:
+            if features["chars"] >= config.ROUTER_DEEP_MIN_CHARS:
+                return RouteDecision(self.deep, "long query", features)
+            if features["clauses"] >= config.ROUTER_DEEP_MIN_CLAUSES:
+                return RouteDecision(self.deep, "many symptoms", features)
+            if features["books"] >= config.ROUTER_DEEP_MIN_BOOKS:
+                return RouteDecision(self.deep, "many books", features)
+
+        if self.fast is not None and features["clauses"] <= 1:
+            if features["chars"] <= config.ROUTER_FAST_MAX_CHARS and features["books"] <= 1:
+                return RouteDecision(self.fast, "short single-book lookup", features)
+            if features["source_filter"] == 1 and features["chars"] <= config.ROUTER_FAST_MAX_CHARS * 2:
+                return RouteDecision(self.fast, "filtered to one book", features)
+
+        return RouteDecision(self.standard, "default", features)
@@ -0,0 +1,227 @@
+"""
+Streaming guard that stops runaway generations.
+Watches the answer as it streams and ends it at a second repertorization
+table or Analysis section, a looping run of repeated n-grams, or text
+running on far past the Analysis. Headings after the Analysis (notes,
+the clinical-aid reminder, a disclaimer) are part of a valid answer and
+pass through.
+"""
+import re
+from collections import Counter, deque
+from threading import Lock
+from typing import Any, Deque, Dict, Optional
+
+from src.config import config
+from src.table_parser import ANALYSIS_START
+from src.tokenizer import count_tokens
+
+# Lines starting like these are held back until they can be classified
+HOLD_CHARS = 40
+
+_WORD = re.compile(r"[A-Za-z0-9][A-Za-z0-9'-]*")
+_HEADING = re.compile(r"^#{1,6}\s")
+_REPERTORIZATION = re.compile(r"repertori[sz]ation", re.IGNORECASE)
+
+
+class StreamGuard:
+    """
+    Incremental monitor for one streamed answer.
+
+    feed() returns the part of each chunk that is safe to deliver. Lines
+    that may start a table, heading or Analysis section are held until
+    they can be classified, so a repeated table is cut before its first
+    character reaches the client. Once stop_reason is set the caller
+    should cancel the upstream request.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = config.LLM_MAX_OUTPUT_TOKENS,
+        ngram_size: int = config.GUARD_NGRAM_SIZE,
+        ngram_repeats: int = config.GUARD_NGRAM_REPEATS,
+        max_chars_after_analysis: int = config.GUARD_MAX_CHARS_AFTER_ANALYSIS,
+    ):
+        self.max_tokens = max_tokens
+        self.ngram_size = ngram_size
+        self.ngram_repeats = ngram_repeats
+        self.max_chars_after_analysis = max_chars_after_analysis
+        self.stop_reason: Optional[str] = None
+
+        self._text = ""  # Everything delivered so far
+        self._line = ""  # Current line, possibly partly held back
+        self._line_decided = False
+        self._prev_table_line = False
+        self._table_start: Optional[int] = None
+        self._repertorization_heading = False
+        self._analysis_start: Optional[int] = None
+        self._word_tail = ""
+        self._words: Deque[str] = deque(maxlen=ngram_size)
+        self._ngrams: Counter = Counter()
+        self._saved_estimate = 0
+
+    def feed(self, text: str) -> str:
+        """Take a streamed chunk; return the part to deliver now."""
+        if self.stop_reason:
+            return ""
+        released = []
+        for piece in re.split(r"(?<=\n)", text):
+            if not piece:
+                continue
+            out = self._feed_piece(piece)
+            if out:
+                released.append(out)
+                self._deliver(out)
+            if self.stop_reason:
+                break
+        return "".join(released)
+
+    def flush(self) -> str:
+        """Release a held partial line once the stream has ended."""
+        if self.stop_reason or self._line_decided or not self._line:
+            return ""
+        reason = self._classify(self._line.lstrip())
+        if reason:
+            self._stop(reason, self._line)
+            return ""
+        out, self._line = self._line, ""
+        self._deliver(out)
+        return out
+
+    def report(self) -> Dict[str, Any]:
+        """Per-request summary: why generation stopped and the tokens saved."""
+        return {
+            "stopped": self.stop_reason is not None,
+            "reason": self.stop_reason,
+            "tokens_delivered": count_tokens(self._text),
+            "tokens_saved_estimate": self._saved_estimate,
+        }
+
+    def _feed_piece(self, piece: str) -> str:
+        """Process text up to and including at most one newline."""
+        complete = piece.endswith("\n")
+        self._line += piece
+        if self._line_decided:
+            release = piece
+        else:
+            stripped = self._line.lstrip()
+            if not complete and self._should_hold(stripped):
+                return ""
+            reason = self._classify(stripped)
+            if reason:
+                self._stop(reason, self._line)
+                return ""
+            self._line_decided = True
+            release = self._line
+
+        if complete:
+            self._prev_table_line = self._line.lstrip().startswith("|")
+            self._line = ""
+            self._line_decided = False
+        return release
+
+    @staticmethod
+    def _should_hold(stripped: str) -> bool:
+        if not stripped:
+            return True
+        if len(stripped) >= HOLD_CHARS:
+            return False
+        if stripped[0] in "#*":
+            return True
+        return "analysis".startswith(stripped.lower()[:8])
+
+    def _classify(self, stripped: str) -> Optional[str]:
+        """Decide on a line from its start; returns a stop reason or None."""
+        if not stripped:
+            return None
+        position = len(self._text)
+
+        if stripped.startswith("|") and not self._prev_table_line:
+            if self._table_start is not None or self._analysis_start is not None:
+                return "repeated table"
+            self._table_start = position
+            return None
+
+        if ANALYSIS_START.match(stripped):
+            if self._analysis_start is not None:
+                return "repeated analysis"
+            self._analysis_start = position
+            return None
+
+        if _HEADING.match(stripped) and _REPERTORIZATION.search(stripped):
+            if self._repertorization_heading or self._analysis_start is not None:
+                return "repeated table"
+            self._repertorization_heading = True
+        return None
+
+    def _deliver(self, out: str):
+        self._text += out
+        if (
+            self._analysis_start is not None
+            and len(self._text) - self._analysis_start > self.max_chars_after_analysis
+        ):
+            self._stop("content after analysis", "")
+            return
+        self._track_ngrams(out)
+
+    def _track_ngrams(self, out: str):
+        text = self._word_tail + out
+        words = _WORD.findall(text)
+        if words and text[-1:].isalnum():
+            self._word_tail = words.pop()
+        else:
+            self._word_tail = ""
+        for word in words:
+            self._words.append(word.lower())
+            if len(self._words) < self.ngram_size:
+                continue
+            ngram = tuple(self._words)
+            self._ngrams[ngram] += 1
+            if self._ngrams[ngram] >= self.ngram_repeats:
+                self._stop("repeated n-grams", "")
+                return
+
+    def _stop(self, reason: str, discarded: str):
+        """Stop generation; discarded is held text that will never be delivered."""
+        self.stop_reason = reason
+        generated = count_tokens(self._text + discarded)
+        remaining = max(0, self.max_tokens - generated)
+        if reason == "repeated n-grams":
+            # Loops tend to run until the output limit
+            estimate = remaining
+        elif reason in ("repeated table", "repeated analysis") and self._table_start is not None:
+            # A repeat is about as long as the original table and analysis
+            estimate = count_tokens(self._text[self._table_start:])
+        elif self._analysis_start is not None:
+            estimate = count_tokens(self._text[self._analysis_start:])
+        else:
+            estimate = remaining
+        self._saved_estimate = min(remaining, estimate)
+
+
+class GuardStats:
+    """Running totals of generations stopped by the guard."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._streams = 0
+        self._stopped: Counter = Counter()
+        self._tokens_saved = 0
+
+    def record(self, report: Dict[str, Any]):
+        with self._lock:
+            self._streams += 1
+            if report["stopped"]:
+                self._stopped[report["reason"]] += 1
+                self._tokens_saved += report["tokens_saved_estimate"]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stopped = sum(self._stopped.values())
+            return {
+                "enabled": config.STREAM_GUARD_ENABLED,
+                "streams": self._streams,
+                "stopped": stopped,
+                "stopped_percent": round(stopped / self._streams * 100, 2) if self._streams else 0,
+                "stopped_by_reason": dict(self._stopped),
+                "tokens_saved_estimate": self._tokens_saved,
+            }
@@ -0,0 +1,309 @@
+"""
+Local repertorization from graded rubric entries in retrieved repertory text.
+
+Rubric lines are parsed in the formats the source repertories use
+("RUBRIC: (N) acon. ARS. Calc." in Fredrick, "RUBRIC: Ars; CALC; Pul."
+in Phatak, comma lists in the body language repertory), remedies are
+graded by case (ALL CAPS = 3, Capitalized = 2, lowercase = 1) and each
+query symptom is matched to its best rubric. The result is rendered as
+the same markdown table the LLM is asked to produce, each row naming the
+rubric it matched, so only the short Analysis paragraph has to be
+generated.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from src.config import config
+from src.context_assembler import AssembledContext
+from src.model_router import split_clauses
+from src.text_splitter import extract_page_number
+
+# "RUBRIC: remedies"; the head may carry a bullet (any leading non-letters)
+# and Phatak's "+" mark
+_RUBRIC_LINE = re.compile(r"^[^A-Za-z]*(?P<head>[^:]{2,80}?)\+?:\s*(?:\(\d+\)\s*)?(?P<rest>.*)$")
+# Fredrick packs several rubrics on one line: "... zinc. NOON: (4) ars. bell."
+_INLINE_RUBRIC = re.compile(r"[A-Za-z][^.:()]{0,40}:\s*\(\d+\)")
+# Bullets before a sub-rubric of the previous sub-rubric: "." in Fredrick,
+# "¢", "*", "-" or "°" in Phatak
+_NESTED = re.compile(r"^[.¢*°-]")
+# A sub-rubric heading with no remedies of its own, e.g. Fredrick's " die"
+_SUB_HEADING = re.compile(r"^[a-z][a-z ;,'-]{0,40}$")
+_REMEDY = re.compile(r"^[A-Za-z][A-Za-z-]{1,11}$")
+_WORD = re.compile(r"[a-z]{3,}")
+_LIST_SPLIT = re.compile(r"[\s,;]+")
+
+# Words that show a remedy list is really prose or a cross-reference
+_PROSE_WORDS = frozenset(
+    "see under with the and from for of in on to at as if by or is are was".split()
+)
+_STOP_WORDS = frozenset(
+    "the and with from for of in on to at as if by or has have had very feels feeling patient "
+    "when after before worse better during being been".split()
+)
+
+# Share of a symptom's significant words a rubric must contain; symptoms of
+# up to three words must match every word
+MIN_RUBRIC_SCORE = 0.75
+
+
+@dataclass
+class Rubric:
+    """One rubric with its graded remedies."""
+
+    name: str
+    remedies: Dict[str, int]  # Remedy key -> grade (1-3)
+    labels: Dict[str, str] = field(default_factory=dict)  # Remedy key -> abbreviation as printed
+    book: str = ""
+    page: int = 0
+    words: Tuple[str, ...] = ()
+
+
+@dataclass
+class LocalTable:
+    """A repertorization computed from rubric entries."""
+
+    remedies: List[str]  # Column abbreviations, highest score first
+    rows: List[Tuple[str, List[bool]]]  # Symptom label and a mark per remedy
+    totals: List[int]
+    grades: List[int]  # Sum of grades per remedy, the tie-breaker
+    rubrics: List[Rubric] = field(default_factory=list)  # Best rubric per matched symptom
+    unmatched: List[str] = field(default_factory=list)  # Symptoms with no rubric
+
+    def to_markdown(self) -> str:
+        """Render in the exact table format of the full-answer prompt."""
+        lines = [
+            "## Repertorization",
+            "",
+            "| Symptom | " + " | ".join(self.remedies) + " |",
+            "| --- |" + " --- |" * len(self.remedies),
+        ]
+        for (symptom, marks), rubric in zip(self.rows, self.rubrics):
+            cells = " | ".join("+" if mark else "" for mark in marks)
+            # Name the matched rubric so the reader can judge the match
+            lines.append(f"| {symptom} ({rubric.name}) | {cells} |")
+        totals = " | ".join(f"**{total}**" for total in self.totals)
+        lines.append(f"| **Total** | {totals} |")
+        return "\n".join(lines)
+
+    def describe_rubrics(self) -> str:
+        """Rubrics behind each row, with grades, for the analysis prompt."""
+        keys = {remedy_key(name) for name in self.remedies}
+        lines = []
+        for (symptom, _), rubric in zip(self.rows, self.rubrics):
+            graded = ", ".join(
+                f"{display_name(rubric.labels[key])} ({grade})"
+                for key, grade in sorted(rubric.remedies.items(), key=lambda item: -item[1])
+                if key in keys
+            )
+            source = f"{rubric.book}, p. {rubric.page}" if rubric.page else rubric.book
+            lines.append(f"- {symptom}: {rubric.name} [{source}] - {graded or 'none of the columns'}")
+        for symptom in self.unmatched:
+            lines.append(f"- {symptom}: no rubric found in the excerpts")
+        return "\n".join(lines)
+
+
+def remedy_key(token: str) -> str:
+    """Normalize an abbreviation so "Nux-v.", "nuxv." and "NUX-V" compare equal."""
+    return re.sub(r"[^a-z]", "", token.lower())
+
+
+def display_name(token: str) -> str:
+    """Column form of an abbreviation: "NUX-V" -> "Nux-v."."""
+    return token.strip(".").capitalize() + "."
+
+
+def grade_of(token: str) -> int:
+    """Grade a remedy abbreviation by case."""
+    letters = re.sub(r"[^A-Za-z]", "", token)
+    if len(letters) > 1 and letters.isupper():
+        return 3
+    if letters[:1].isupper():
+        return 2
+    return 1
+
+
+def _parse_remedies(text: str) -> Optional[List[str]]:
+    """Remedy tokens in a list, or None if the text is not a remedy list."""
+    # Fredrick ends some lists with "> Cross reference"
+    text = text.split(">", 1)[0]
+    tokens = [token.strip(".+“”\"'") for token in _LIST_SPLIT.split(text.strip())]
+    tokens = [token for token in tokens if token]
+    if not tokens:
+        return None
+    for token in tokens:
+        if not _REMEDY.match(token) or token.lower() in _PROSE_WORDS:
+            return None
+    return tokens
+
+
+def _words(text: str) -> Tuple[str, ...]:
+    return tuple(word for word in _WORD.findall(text.lower()) if word not in _STOP_WORDS)
+
+
+def _stem(word: str) -> str:
+    return word[:5]
+
+
+def _split_inline(line: str) -> List[str]:
+    """Split a line at every "head: (N)" rubric start."""
+    starts = [match.start() for match in _INLINE_RUBRIC.finditer(line)]
+    if not starts or line[:starts[0]].strip(" .¢*°-"):
+        starts.insert(0, 0)
+    else:
+        starts[0] = 0  # Keep a leading indent or bullet with its rubric
+    return [line[start:end] for start, end in zip(starts, starts[1:] + [len(line)])]
+
+
+def parse_rubrics(text: str, book: str = "") -> List[Rubric]:
+    """
+    Parse the rubric entries in a block of repertory text.
+
+    A rubric line is "HEAD: remedies"; lines that are only remedies
+    continue the previous entry. Sub-rubrics are prefixed with the last
+    upper-case main rubric, e.g. "FEAR, Alone, of being", and bulleted
+    sub-rubrics also with the sub-rubric above them, e.g. "FEAR, alone,
+    of being, lest he die". A heading without remedies (Fredrick's " die"
+    or ".lest") is kept as the parent or prefix of the rubric after it.
+    """
+    rubrics: List[Rubric] = []
+    current: Optional[Rubric] = None
+    main = ""
+    parent = ""  # Last sub-rubric, the parent of bulleted ones
+    pending = ""  # Nested heading continued on the next line
+    page = 0
+
+    for raw_line in text.splitlines():
+        page_number = extract_page_number(raw_line)
+        if page_number:
+            page = page_number
+            current = None
+            continue
+        for index, line in enumerate(_split_inline(raw_line)):
+            # Indentation and bullets only mean something at the start of a line
+            indented = index == 0 and line[:1].isspace()
+            line = line.strip()
+            if not line:
+                continue
+            nested = index == 0 and bool(_NESTED.match(line))
+            match = _RUBRIC_LINE.match(line)
+            remedies = _parse_remedies(match.group("rest")) if match else None
+            if remedies is not None:
+                head = match.group("head").strip(" .,")
+                if head.split(",")[0].isupper():
+                    main, parent = " ".join(head.split(",")[0].split()), ""
+                    name = head
+                elif nested or pending:
+                    head = f"{pending} {head}" if pending else head
+                    name = ", ".join(part for part in (main, parent, head) if part)
+                else:
+                    # Fredrick indents sub-rubrics; an unindented lowercase
+                    # one is usually a wrapped line and leaves the parent
+                    if indented or head[:1].isupper():
+                        parent = head
+                    name = f"{main}, {head}" if main else head
+                pending = ""
+                current = Rubric(name=name, remedies={}, book=book, page=page, words=_words(name))
+                rubrics.append(current)
+            else:
+                # Continuation lines are unbulleted punctuated lists; a bare
+                # "FEAR" is a page header
+                continues = current is not None and not nested and re.search(r"[.;,]", line)
+                remedies = _parse_remedies(line) if continues else None
+                if remedies is None:
+                    # Prose ends the entry; a bare upper-case line is a main rubric
+                    current = None
+                    pending = ""
+                    heading = line.lstrip(".¢*°- ")
+                    if line.isupper() and len(line) > 2:
+                        main, parent = " ".join(line.strip(" .,:").split()), ""
+                    elif (indented or nested) and _SUB_HEADING.match(heading):
+                        if nested:
+                            pending = heading
+                        else:
+                            parent = heading
+                    continue
+            for token in remedies:
+                key = remedy_key(token)
+                if key:
+                    current.remedies[key] = max(current.remedies.get(key, 0), grade_of(token))
+                    current.labels.setdefault(key, token)
+    return [rubric for rubric in rubrics if rubric.remedies]
+
+
+def _score(symptom_words: Tuple[str, ...], rubric: Rubric) -> float:
+    if not symptom_words:
+        return 0.0
+    rubric_stems = {_stem(word) for word in rubric.words}
+    matched = sum(1 for word in symptom_words if _stem(word) in rubric_stems)
+    return matched / len(symptom_words)
+
+
+def _best_rubric(symptom: str, rubrics: List[Rubric]) -> Optional[Rubric]:
+    words = _words(symptom)
+    best, best_key = None, None
+    for rubric in rubrics:
+        score = _score(words, rubric)
+        if score < MIN_RUBRIC_SCORE:
+            continue
+        # Prefer the closest match, then the more specific (shorter) rubric
+        key = (score, -len(rubric.words))
+        if best_key is None or key > best_key:
+            best, best_key = rubric, key
+    return best
+
+
+def build_table(
+    question: str,
+    assembled: AssembledContext,
+    max_remedies: int = config.LOCAL_TABLE_MAX_REMEDIES,
+) -> Optional[LocalTable]:
+    """
+    Repertorize a query against the rubric entries in its context.
+
+    Args:
+        question: Sanitized user query; each symptom clause becomes a row
+        assembled: Retrieved context blocks
+        max_remedies: Remedy columns to keep
+
+    Returns:
+        The table, or None if no symptom matched a graded rubric
+    """
+    rubrics: List[Rubric] = []
+    for block in assembled.blocks:
+        rubrics.extend(parse_rubrics(block.text, block.book_name))
+    if not rubrics:
+        return None
+
+    matched: List[Tuple[str, Rubric]] = []
+    unmatched: List[str] = []
+    for clause in split_clauses(question):
+        rubric = _best_rubric(clause, rubrics)
+        label = clause[:1].upper() + clause[1:]
+        if rubric is None:
+            unmatched.append(label)
+        else:
+            matched.append((label, rubric))
+    if not matched:
+        return None
+
+    counts: Dict[str, int] = {}
+    grades: Dict[str, int] = {}
+    labels: Dict[str, str] = {}
+    for _, rubric in matched:
+        for key, grade in rubric.remedies.items():
+            counts[key] = counts.get(key, 0) + 1
+            grades[key] = grades.get(key, 0) + grade
+            # Keep a hyphenated form ("Nux-v") over a run-together one ("nuxv")
+            if key not in labels or ("-" in rubric.labels[key] and "-" not in labels[key]):
+                labels[key] = rubric.labels[key]
+    keys = sorted(counts, key=lambda key: (-counts[key], -grades[key], key))[:max_remedies]
+
+    return LocalTable(
+        remedies=[display_name(labels[key]) for key in keys],
+        rows=[(label, [key in rubric.remedies for key in keys]) for label, rubric in matched],
+        totals=[counts[key] for key in keys],
+        grades=[grades[key] for key in keys],
+        rubrics=[rubric for _, rubric in matched],
+        unmatched=unmatched,
+    )
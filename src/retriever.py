@@ -1,11 +1,12 @@
 """
 Document retrieval with configurable parameters.
 """
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 from langchain_core.documents import Document
 
 from src.vector_store import VectorStoreManager
+from src.context_assembler import AssembledContext, ContextAssembler
 from src.config import config
 
 
@@ -14,6 +15,7 @@ class RemedyRetriever:
 
     def __init__(self, vector_store_manager: VectorStoreManager):
         self.vs_manager = vector_store_manager
+        self.assembler = ContextAssembler()
 
     # Common stopwords to exclude from keyword extraction
     _STOPWORDS = {
@@ -30,22 +32,29 @@ class RemedyRetriever:
         words = query.lower().split()
         return [w for w in words if w not in self._STOPWORDS and len(w) > 2]
 
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a query once, for every search that needs it."""
+        return self.vs_manager.embeddings.embed_query(query)
+
     def retrieve(
         self,
         query: str,
         k: int = config.TOP_K_RESULTS,
         source_filter: List[str] = None,
+        embedding: Optional[List[float]] = None,
     ) -> List[Tuple[Document, float]]:
         """
         Retrieve top-k relevant documents using hybrid search.
 
         First tries keyword-filtered similarity search for each keyword,
-        then fills remaining slots with pure similarity search.
+        then fills remaining slots with pure similarity search. All
+        searches share one query embedding.
 
         Args:
             query: Search query string
             k: Number of results to retrieve
             source_filter: Optional list of book names to filter by
+            embedding: Precomputed embed_query(query), if the caller has one
 
         Returns:
             List of (Document, similarity_score) tuples
@@ -54,6 +63,8 @@ class RemedyRetriever:
         vs = self.vs_manager.get_vectorstore()
         if vs is None:
             raise ValueError("Vector store not initialized")
+        if embedding is None:
+            embedding = self.embed_query(query)
 
         # Build filter for source books if provided
         filter_dict = None
@@ -75,7 +86,7 @@ class RemedyRetriever:
             for keyword in keywords[:3]:  # Limit to top 3 keywords
                 try:
                     chroma_results = collection.query(
-                        query_texts=[query],
+                        query_embeddings=[embedding],
                         where_document={"$contains": keyword},
                         n_results=k,
                         **({"where": filter_dict} if filter_dict else {}),
@@ -98,8 +109,8 @@ class RemedyRetriever:
 
         # Fill remaining slots with pure similarity search
         if len(keyword_results) < k:
-            semantic_results = vs.similarity_search_with_score(
-                query, k=k, filter=filter_dict
+            semantic_results = vs.similarity_search_by_vector_with_relevance_scores(
+                embedding, k=k, filter=filter_dict
             )
             for doc, score in semantic_results:
                 if len(keyword_results) >= k:
@@ -137,6 +148,28 @@ class RemedyRetriever:
 
         return filtered_results
 
+    def assemble_context(
+        self,
+        query: str,
+        k: int = config.TOP_K_RESULTS,
+        source_filter: List[str] = None,
+        embedding: Optional[List[float]] = None,
+    ) -> AssembledContext:
+        """
+        Retrieve documents and merge adjacent chunks into context blocks.
+
+        Args:
+            query: Search query string
+            k: Number of results to retrieve
+            source_filter: Optional list of book names to filter by
+            embedding: Precomputed embed_query(query), if the caller has one
+
+        Returns:
+            AssembledContext (empty when nothing was retrieved)
+        """
+        results = self.retrieve(query, k, source_filter=source_filter, embedding=embedding)
+        return self.assembler.assemble(results)
+
     def retrieve_as_context(
         self,
         query: str,
@@ -154,24 +187,9 @@ class RemedyRetriever:
         Returns:
             Tuple of (context_string, list_of_citations, list_of_documents)
         """
-        results = self.retrieve(query, k, source_filter=source_filter)
+        assembled = self.assemble_context(query, k, source_filter=source_filter)
 
-        if not results:
+        if not assembled.blocks:
             return "", [], []
 
-        context_parts = []
-        citations = []
-        documents = []
-
-        for idx, (doc, score) in enumerate(results, 1):
-            citation = doc.metadata.get("citation", f"Source {idx}")
-            citations.append(citation)
-            documents.append(doc)
-
-            # Format each source with clear separation
-            context_parts.append(
-                f"[Source {idx}: {citation}]\n{doc.page_content}\n"
-            )
-
-        context = "\n---\n".join(context_parts)
-        return context, citations, documents
+        return assembled.render(), assembled.citations, assembled.documents
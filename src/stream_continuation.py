@@ -0,0 +1,77 @@
+"""
+Assistant-prefix continuation for streams that fail part-way through.
+The next key or model is asked to continue the partial answer, and any
+text it repeats is dropped so delivered tokens are never sent twice.
+"""
+from typing import Dict, List
+
+from src.context_assembler import find_overlap
+
+# Continuation output held back while checking whether it repeats the partial answer
+ECHO_CHECK_CHARS = 200
+
+
+def continuation_messages(messages: List[Dict[str, str]], partial: str) -> List[Dict[str, str]]:
+    """
+    Messages asking the model to continue a partial answer.
+
+    The partial answer is sent as a trailing assistant message (prefill).
+    Trailing whitespace is stripped because some providers reject a
+    prefill that ends in whitespace.
+    """
+    return messages + [{"role": "assistant", "content": partial.rstrip()}]
+
+
+class ContinuationFilter:
+    """
+    Drops text a continuation repeats from the partial answer.
+
+    Providers that honour the prefill continue right after it; others
+    restart the answer or repeat its last sentence. The first
+    ECHO_CHECK_CHARS of the continuation (longer while it still matches
+    the partial answer) are held back, then any repeated prefix or
+    overlapping tail is cut before the rest is passed through.
+    """
+
+    def __init__(self, partial: str):
+        self.prefix = partial.rstrip()
+        self.trailing = partial[len(self.prefix):]
+        self.repeated_chars = 0
+        self._buffer = ""
+        self._released = not self.prefix
+
+    def feed(self, text: str) -> str:
+        """Take a streamed chunk; return the part that is safe to deliver."""
+        if self._released:
+            return text
+        self._buffer += text
+        if self.prefix.startswith(self._buffer) or len(self._buffer) < ECHO_CHECK_CHARS:
+            return ""
+        return self._release()
+
+    def flush(self) -> str:
+        """Return any held text once the stream has ended."""
+        if self._released:
+            return ""
+        if self.prefix.startswith(self._buffer):
+            # The continuation only repeated what was already delivered
+            self.repeated_chars = len(self._buffer)
+            self._released = True
+            self._buffer = ""
+            return ""
+        return self._release()
+
+    def _release(self) -> str:
+        buffer = self._buffer
+        if buffer.startswith(self.prefix):
+            cut = len(self.prefix)
+        else:
+            cut = find_overlap(self.prefix, buffer, max_overlap=len(buffer))
+        rest = buffer[cut:]
+        # Whitespace after the prefill was already delivered with the partial answer
+        leading_ws = len(rest) - len(rest.lstrip())
+        skip = min(leading_ws, len(self.trailing))
+        self.repeated_chars = cut + skip
+        self._released = True
+        self._buffer = ""
+        return rest[skip:]
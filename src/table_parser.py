@@ -0,0 +1,141 @@
+"""
+Incremental parser for the repertorization table in streamed answers.
+Turns the markdown table and Analysis paragraph into structured events
+as lines complete, so clients never re-parse the accumulated answer.
+"""
+import re
+from typing import Any, Dict, List, Optional
+
+_SEPARATOR_CELL = re.compile(r"^:?-{3,}:?$")
+# Start of the Analysis section: a markdown heading ("### Analysis",
+# "## Step 3: Brief Analysis") or a bold label ("**Analysis**",
+# "**Analysis:** text"). Prose that merely begins with the word
+# ("Analysis of the rubrics shows...") is not a section start.
+ANALYSIS_START = re.compile(
+    r"^(?:#{1,6}\s*(?:step\s*\d+\W*)?(?:brief\s+)?analysis\b"
+    r"|\*\*\s*(?:step\s*\d+\W*)?(?:brief\s+)?analysis\s*:?\s*\*\*)",
+    re.IGNORECASE,
+)
+_HEADING = re.compile(r"^#{1,6}\s")
+
+
+def _cells(line: str) -> List[str]:
+    return [cell.strip() for cell in line.strip().strip("|").split("|")]
+
+
+def _unbold(cell: str) -> str:
+    return cell.replace("**", "").strip()
+
+
+def _to_int(cell: str) -> Optional[int]:
+    try:
+        return int(_unbold(cell))
+    except ValueError:
+        return None
+
+
+class RepertorizationParser:
+    """
+    Line-by-line parser for one answer.
+
+    feed() takes streamed text and returns the events completed by it:
+    table_header (remedy columns), table_row (one symptom row, or the
+    Total row) and analysis (one paragraph line). table() returns the
+    whole parsed table for storage.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pending_header: Optional[List[str]] = None
+        self._remedies: Optional[List[str]] = None
+        self._rows: List[Dict[str, Any]] = []
+        self._totals: Optional[List[Optional[int]]] = None
+        self._table_done = False
+        self._in_analysis = False
+        self._analysis: List[str] = []
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Add streamed text; return events for every line it completes."""
+        self._buffer += text
+        if "\n" not in self._buffer:
+            return []
+        *lines, self._buffer = self._buffer.split("\n")
+        events = []
+        for line in lines:
+            event = self._parse_line(line)
+            if event:
+                events.append(event)
+        return events
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """Parse the last line once the stream has ended."""
+        line, self._buffer = self._buffer, ""
+        event = self._parse_line(line) if line.strip() else None
+        return [event] if event else []
+
+    def table(self) -> Optional[Dict[str, Any]]:
+        """The parsed table and analysis, or None if no table was found."""
+        if self._remedies is None:
+            return None
+        return {
+            "remedies": self._remedies,
+            "rows": self._rows,
+            "totals": self._totals,
+            "analysis": "\n".join(self._analysis) or None,
+        }
+
+    def _parse_line(self, line: str) -> Optional[Dict[str, Any]]:
+        stripped = line.strip()
+
+        if stripped.startswith("|") and not self._table_done:
+            return self._parse_table_line(stripped)
+        if self._remedies is not None:
+            # The table ends at the first non-table line
+            self._table_done = True
+        self._pending_header = None
+
+        if not stripped:
+            return None
+        match = ANALYSIS_START.match(stripped)
+        if match and self._remedies is not None and not self._analysis:
+            self._in_analysis = True
+            # "**Analysis:** text" keeps its text; an Analysis heading has none
+            stripped = "" if stripped.startswith("#") else stripped[match.end():].lstrip(" :*").strip()
+            if not stripped:
+                return None
+        elif self._in_analysis and (_HEADING.match(stripped) or stripped.startswith("|")):
+            self._in_analysis = False
+        if not self._in_analysis:
+            return None
+        self._analysis.append(stripped)
+        return {"type": "analysis", "content": stripped}
+
+    def _parse_table_line(self, line: str) -> Optional[Dict[str, Any]]:
+        cells = _cells(line)
+        if self._remedies is None:
+            if self._pending_header and all(_SEPARATOR_CELL.match(c) for c in cells if c):
+                # A header row is only confirmed by the separator below it
+                label, *remedies = self._pending_header
+                self._remedies = [_unbold(c) for c in remedies]
+                self._pending_header = None
+                return {"type": "table_header", "label": _unbold(label), "remedies": self._remedies}
+            self._pending_header = cells
+            return None
+
+        symptom = _unbold(cells[0]) if cells else ""
+        values = (cells[1:] + [""] * len(self._remedies))[: len(self._remedies)]
+        if symptom.lower() == "total":
+            self._totals = [_to_int(value) for value in values]
+            return {"type": "table_row", "total": True, "symptom": symptom, "totals": self._totals}
+
+        row = {"symptom": symptom, "marks": ["+" in value for value in values]}
+        self._rows.append(row)
+        return {"type": "table_row", "index": len(self._rows) - 1, "total": False, **row}
+
+
+def parse_table(answer: str) -> Optional[Dict[str, Any]]:
+    """Parse a complete answer (e.g. a non-streamed or cached one)."""
+    parser = RepertorizationParser()
+    parser.feed(answer)
+    parser.finish()
+    return parser.table()
@@ -0,0 +1,123 @@
+"""
+Token budget planning for LLM requests.
+Packs retrieved context into a per-model input token budget.
+"""
+import re
+from typing import Dict, Optional, Tuple
+
+from src.config import config
+from src.context_assembler import AssembledContext, ContextBlock, SOURCE_SEPARATOR, format_source
+from src.tokenizer import count_tokens
+
+# Filled per request and counted separately
+_PLACEHOLDER = re.compile(r"\{(?:context|question|table|rubrics)\}")
+
+
+class TokenBudgetPlanner:
+    """
+    Plans how much retrieved context fits into a model's input budget.
+
+    Static prompt templates are counted once per template and model, with
+    the model's tokenizer; a request then only counts its question, any
+    per-request text such as a local table, and its context blocks.
+    """
+
+    def __init__(
+        self,
+        static_prompt: str,
+        model_budgets: Optional[Dict[str, int]] = None,
+        default_budget: Optional[int] = None,
+        max_output_tokens: Optional[int] = None,
+    ):
+        self._static_tokens: Dict[Tuple[str, Optional[str]], int] = {}
+        self.static_prompt = static_prompt
+        self.model_budgets = model_budgets if model_budgets is not None else config.MODEL_INPUT_TOKEN_BUDGETS
+        self.default_budget = default_budget or config.DEFAULT_INPUT_TOKEN_BUDGET
+        self.max_output_tokens = max_output_tokens or config.LLM_MAX_OUTPUT_TOKENS
+
+    def count_static(self, static_prompt: str, model: Optional[str] = None) -> int:
+        """Count a prompt template's fixed tokens (cached per template and model)."""
+        key = (static_prompt, model)
+        tokens = self._static_tokens.get(key)
+        if tokens is None:
+            tokens = count_tokens(_PLACEHOLDER.sub("", static_prompt), model)
+            self._static_tokens[key] = tokens
+        return tokens
+
+    def budget_for(self, model: str) -> int:
+        """Return the configured input token budget for a model."""
+        return self.model_budgets.get(model, self.default_budget)
+
+    def pack(
+        self,
+        question: str,
+        assembled: AssembledContext,
+        model: str,
+        static_prompt: Optional[str] = None,
+        extra_text: str = "",
+    ) -> AssembledContext:
+        """
+        Greedily pack context blocks by relevance into the model's budget.
+
+        Blocks are taken in relevance order; a block that does not fit is
+        skipped in favour of smaller, less relevant ones. If not even the
+        most relevant block fits, it is truncated so the LLM still gets
+        some context.
+
+        Args:
+            question: Sanitized user query
+            assembled: Assembled (optionally compressed) context
+            model: Model the request will be sent to
+            static_prompt: Prompt template variant used for the request
+                (defaults to the one given at construction)
+            extra_text: Other per-request text the prompt carries, e.g.
+                the analysis mode's table and rubrics
+
+        Returns:
+            New AssembledContext whose stats include a "budget" entry
+        """
+        static_tokens = self.count_static(static_prompt or self.static_prompt, model)
+        input_budget = self.budget_for(model)
+        question_tokens = count_tokens(question, model)
+        extra_tokens = count_tokens(extra_text, model)
+        available = max(0, input_budget - static_tokens - question_tokens - extra_tokens)
+        separator_tokens = count_tokens(SOURCE_SEPARATOR, model)
+
+        packed = []
+        used = 0
+        for block in sorted(assembled.blocks, key=lambda b: b.rank):
+            cost = count_tokens(format_source(len(packed) + 1, block.citation, block.text), model)
+            if packed:
+                cost += separator_tokens
+            if used + cost <= available:
+                packed.append(block)
+                used += cost
+
+        truncated = False
+        if not packed and assembled.blocks and available > 0:
+            top = min(assembled.blocks, key=lambda b: b.rank)
+            block_tokens = count_tokens(top.text, model) or 1
+            keep_chars = int(len(top.text) * available / block_tokens * 0.9)
+            packed.append(ContextBlock(top.text[:keep_chars], top.documents, top.rank, top.score))
+            used = count_tokens(format_source(1, top.citation, packed[0].text), model)
+            truncated = True
+
+        stats = dict(assembled.stats)
+        stats["context_tokens"] = used
+        stats["budget"] = {
+            "model": model,
+            "input_budget": input_budget,
+            "max_output_tokens": self.max_output_tokens,
+            "static_prompt_tokens": static_tokens,
+            "question_tokens": question_tokens,
+            "extra_tokens": extra_tokens,
+            "context_tokens": used,
+            "input_tokens": static_tokens + question_tokens + extra_tokens + used,
+            "blocks_packed": len(packed),
+            "blocks_dropped": len(assembled.blocks) - len(packed),
+            "truncated": truncated,
+        }
+        # Citations and cache tags come from the documents: keep only those the model sees
+        packed_ids = {id(doc) for block in packed for doc in block.documents}
+        documents = [doc for doc in assembled.documents if id(doc) in packed_ids]
+        return AssembledContext(packed, documents, stats)
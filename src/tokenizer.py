@@ -0,0 +1,58 @@
+"""
+Token counting helpers.
+
+Uses tiktoken when it is installed and falls back to a character-based
+estimate otherwise, so token accounting never blocks a request.
+"""
+from functools import lru_cache
+from typing import Optional
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+# Encoding used when the model name is unknown to tiktoken (OpenRouter ids,
+# Gemini, Llama, ...). Close enough for budgeting across providers.
+DEFAULT_ENCODING = "o200k_base"
+
+# Average characters per token for English prose, used without tiktoken.
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=16)
+def _get_encoding(model: Optional[str]):
+    """Return a cached tiktoken encoding for a model, or None if unavailable."""
+    if tiktoken is None:
+        return None
+    try:
+        if model:
+            # OpenRouter ids look like "openai/gpt-4o-mini"
+            return tiktoken.encoding_for_model(model.split("/")[-1])
+    except KeyError:
+        pass
+    try:
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception:
+        # Encoding files could not be loaded (e.g. offline container)
+        return None
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    Count tokens in text.
+
+    Args:
+        text: Text to measure
+        model: Optional model name used to pick the tokenizer
+
+    Returns:
+        Token count (estimated when no tokenizer is available)
+    """
+    if not text:
+        return 0
+
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return max(1, len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
@@ -9,6 +9,7 @@ from langchain_chroma import Chroma
 
 from src.config import config
 from src.embeddings import get_embedding_model
+from src.index_version import bump_book_version, bump_index_version
 
 
 class VectorStoreManager:
@@ -54,6 +55,7 @@ class VectorStoreManager:
             persist_directory=str(self.persist_directory),
             collection_name=self.collection_name,
         )
+        bump_index_version(self.persist_directory)
 
         print(f"Created vector store with {len(documents)} documents")
         return self._vectorstore
@@ -87,8 +89,50 @@ class VectorStoreManager:
             raise ValueError("No vector store exists. Create one first.")
 
         vs.add_documents(documents)
+        bump_index_version(self.persist_directory)
         print(f"Added {len(documents)} documents to vector store")
 
+    def delete_book(self, book_name: str) -> int:
+        """
+        Remove every chunk of one book from the vector store.
+
+        Args:
+            book_name: Book to remove (the book_name metadata value)
+
+        Returns:
+            Number of chunks removed
+        """
+        vs = self.get_vectorstore()
+        if vs is None:
+            raise ValueError("No vector store exists. Create one first.")
+
+        ids = vs._collection.get(where={"book_name": book_name}, include=[])["ids"]
+        if ids:
+            vs._collection.delete(ids=ids)
+        bump_book_version(book_name, self.persist_directory)
+        print(f"Removed {len(ids)} chunks of {book_name} from vector store")
+        return len(ids)
+
+    def replace_book(self, book_name: str, documents: List[Document]) -> int:
+        """
+        Replace one book's chunks, leaving the rest of the index untouched.
+
+        Only cached answers citing this book are invalidated, through its
+        entry in the per-book version file.
+
+        Args:
+            book_name: Book being re-ingested
+            documents: The book's new chunks
+
+        Returns:
+            Number of old chunks removed
+        """
+        removed = self.delete_book(book_name)
+        self.get_vectorstore().add_documents(documents)
+        bump_book_version(book_name, self.persist_directory)
+        print(f"Added {len(documents)} chunks of {book_name} to vector store")
+        return removed
+
     def get_collection_stats(self) -> dict:
         """Get statistics about the vector store collection."""
         vs = self.get_vectorstore()
@@ -133,6 +177,7 @@ class VectorStoreManager:
             try:
                 vs._client.delete_collection(self.collection_name)
                 self._vectorstore = None
+                bump_index_version(self.persist_directory)
                 print(f"Deleted collection: {self.collection_name}")
             except Exception as e:
                 print(f"Error deleting collection: {e}")
@@ -0,0 +1,8 @@
+"""
+Shared test setup: make the project root importable.
+Run from the project root with: python -m pytest
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -0,0 +1,120 @@
+"""
+Tests for the query cache backends.
+"""
+import threading
+import time
+
+import pytest
+
+# api.services imports the RAG service, which needs the full dependency set
+pytest.importorskip("langchain_chroma")
+
+from api.config import api_config  # noqa: E402
+from api.services.cache_backends import (  # noqa: E402
+    MemoryBackend,
+    SQLiteBackend,
+    TieredBackend,
+    create_cache_backend,
+)
+
+RESPONSE = {"id": "1", "question": "fear of death", "answer": "Aconite", "citations": []}
+
+
+def tiered(path) -> TieredBackend:
+    return TieredBackend(MemoryBackend(100, 10 ** 7, 4), SQLiteBackend(str(path), compress=True))
+
+
+def test_tag_invalidation_reaches_entries_promoted_from_disk(tmp_path):
+    path = tmp_path / "cache.db"
+    before = tiered(path)
+    before.set("k1", RESPONSE, 3600, ["book:Phatak"])
+    before.set("k2", RESPONSE, 3600, ["book:Fedrick"])
+    before.close()
+
+    # After a restart the entry is only on disk; a hit copies it to memory
+    after = tiered(path)
+    assert after.get("k1") == RESPONSE
+    assert after.delete_tagged(["book:Phatak"]) == 1
+    assert after.get("k1") is None
+    assert after.get("k2") == RESPONSE
+    after.close()
+
+
+def test_disk_lookup_returns_tags_only_when_asked(tmp_path):
+    disk = SQLiteBackend(str(tmp_path / "cache.db"))
+    disk.set("k1", RESPONSE, 3600, ["book:Phatak", "chunk:Phatak:3"])
+    response, _, tags = disk.lookup("k1", with_tags=True)
+    assert response == RESPONSE
+    assert sorted(tags) == ["book:Phatak", "chunk:Phatak:3"]
+    assert disk.lookup("k1")[2] == ()
+    disk.close()
+
+
+def test_memory_lookup_purges_expired_entries_of_its_stripe():
+    memory = MemoryBackend(100, 10 ** 7, 1)
+    memory.set("live", RESPONSE, 3600)
+    memory.set("old", RESPONSE, -1, ["book:Phatak"])
+
+    # Any lookup in the stripe frees the expired entry and its tag
+    assert memory.get("live") == RESPONSE
+    stripe = memory._stripes[0]
+    assert "old" not in stripe.entries
+    assert "book:Phatak" not in stripe.tags
+    assert stripe.expirations == 1
+
+
+def test_disk_tier_creates_its_file_on_first_use(tmp_path, monkeypatch):
+    path = tmp_path / "cache.db"
+    monkeypatch.setattr(api_config, "CACHE_DISK_ENABLED", True)
+    monkeypatch.setattr(api_config, "CACHE_DISK_PATH", str(path))
+    backend = create_cache_backend("memory")
+    assert isinstance(backend, TieredBackend)
+    assert not path.exists()
+
+    backend.set("k1", RESPONSE, 3600)
+    backend.flush()
+    assert path.exists()
+    backend.close()
+
+
+def test_disk_hits_stay_read_only_until_due(tmp_path):
+    disk = SQLiteBackend(str(tmp_path / "cache.db"), touch_seconds=60, counter_flush_seconds=60)
+    disk.set("k1", RESPONSE, 3600)
+    conn = disk._conn()
+    changes = conn.total_changes
+
+    assert disk.get("k1") == RESPONSE
+    assert disk.get("missing") is None
+    # Neither the fresh access time nor the counters were written
+    assert conn.total_changes == changes
+    stats = disk.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    disk.close()
+
+
+def test_disk_hit_refreshes_a_stale_access_time(tmp_path):
+    disk = SQLiteBackend(str(tmp_path / "cache.db"), touch_seconds=60)
+    disk.set("k1", RESPONSE, 3600)
+    conn = disk._conn()
+    conn.execute("UPDATE query_cache SET accessed_at = accessed_at - 120")
+    (before,) = conn.execute("SELECT accessed_at FROM query_cache").fetchone()
+
+    disk.lookup("k1")
+    (after,) = conn.execute("SELECT accessed_at FROM query_cache").fetchone()
+    assert after > before + 60
+    disk.close()
+
+
+def test_close_does_not_hang_on_a_stuck_writer(tmp_path, monkeypatch):
+    backend = TieredBackend(MemoryBackend(100, 10 ** 7, 4), SQLiteBackend(str(tmp_path / "cache.db")), queue_size=1)
+    monkeypatch.setattr(TieredBackend, "CLOSE_TIMEOUT", 0.1)
+    stuck = threading.Event()
+    monkeypatch.setattr(backend.disk, "set_many", lambda items: stuck.wait())
+    backend.set("k1", RESPONSE, 3600)
+    time.sleep(0.05)  # The writer takes k1 and blocks on it
+    backend.set("k2", RESPONSE, 3600)  # Fills the queue
+
+    start = time.monotonic()
+    backend.close()
+    assert time.monotonic() - start < 1
+    stuck.set()
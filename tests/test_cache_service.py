@@ -0,0 +1,50 @@
+"""
+Tests for the query cache service.
+"""
+import pytest
+
+# api.services imports the RAG service, which needs the full dependency set
+pytest.importorskip("langchain_chroma")
+
+from api.services.cache_backends import MemoryBackend  # noqa: E402
+from api.services.cache_service import QueryCache  # noqa: E402
+
+RESPONSE = {
+    "id": "1",
+    "question": "fear of death",
+    "answer": "Aconite",
+    "citations": [{"source": "Phatak", "excerpt": "FEAR, death", "chunk_id": "Phatak:3"}],
+    "sources_used": ["Phatak"],
+    "processing_time_ms": 10,
+}
+
+
+class FailingBackend(MemoryBackend):
+    """A backend whose store is unreachable."""
+
+    def _fail(self, *args, **kwargs):
+        raise ConnectionError("backend unreachable")
+
+    get = set = delete = delete_tagged = clear = _fail
+
+
+def test_backend_failures_never_fail_invalidation():
+    cache = QueryCache(backend=FailingBackend(10, 10 ** 6, 1))
+    cache.invalidate("fear of death")
+    cache.invalidate()
+    assert cache.invalidate_books(["Phatak"]) == 0
+    assert cache.invalidate_chunks(["Phatak:3"]) == 0
+    assert cache.get("fear of death") is None
+    cache.close()
+
+
+def test_invalidate_removes_the_answer_of_the_given_mode_only():
+    cache = QueryCache(backend=MemoryBackend(10, 10 ** 6, 1))
+    cache.set("fear of death", RESPONSE, None, "full")
+    cache.set("fear of death", RESPONSE, None, "analysis")
+
+    cache.invalidate("fear of death", mode="analysis")
+
+    assert cache.get("fear of death", None, "analysis") is None
+    assert cache.get("fear of death", None, "full")["answer"] == "Aconite"
+    cache.close()
@@ -0,0 +1,55 @@
+"""
+Tests for extractive context compression.
+"""
+from langchain_core.documents import Document
+
+from src.context_assembler import AssembledContext, ContextBlock
+from src.context_compressor import ContextCompressor
+
+
+class CountingEmbeddings:
+    """Deterministic embeddings that record how they were called."""
+
+    def __init__(self):
+        self.query_calls = 0
+        self.document_calls = 0
+
+    @staticmethod
+    def _vector(text: str):
+        return [text.lower().count(word) + 0.01 for word in ("fear", "death", "thirst", "night")]
+
+    def embed_query(self, text: str):
+        self.query_calls += 1
+        return self._vector(text)
+
+    def embed_documents(self, texts):
+        self.document_calls += 1
+        return [self._vector(text) for text in texts]
+
+
+def context(text: str, tokens: int) -> AssembledContext:
+    doc = Document(page_content=text, metadata={"book_name": "Phatak"})
+    return AssembledContext([ContextBlock(text, [doc], 0, 0.1)], [doc], {"context_tokens": tokens})
+
+
+def test_context_without_scoreable_spans_still_reports_compression():
+    compressor = ContextCompressor(CountingEmbeddings(), token_budget=10)
+    assembled = context("--- Page 12 ---\nFear.\n--- Page 13 ---", tokens=500)
+    result = compressor.compress("fear of death", assembled)
+    assert result.stats["compression"]["applied"] is False
+    assert result.blocks == assembled.blocks
+
+
+def test_compression_reuses_the_retrieval_embedding():
+    embeddings = CountingEmbeddings()
+    compressor = ContextCompressor(embeddings, token_budget=12)
+    text = "\n".join([
+        "FEAR, death, of: Acon., Ars., Cact., Calc.",
+        "THIRST, large quantities, for: Bry., Nat-m., Phos.",
+        "NIGHT, restlessness at: Ars., Rhus-t.",
+    ])
+    result = compressor.compress("fear of death", context(text, tokens=500), embeddings.embed_query("fear of death"))
+    assert embeddings.query_calls == 1  # Only the caller's
+    assert embeddings.document_calls == 1  # All spans in one batch
+    assert result.stats["compression"]["applied"] is True
+    assert "FEAR, death" in result.render()
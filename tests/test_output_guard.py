@@ -0,0 +1,94 @@
+"""
+Tests for the streaming output guard and the Analysis section start it
+shares with the table parser.
+"""
+import pytest
+
+from src.output_guard import StreamGuard
+from src.table_parser import ANALYSIS_START, parse_table
+
+TABLE = (
+    "| Symptom | Acon | Ars |\n"
+    "|---|---|---|\n"
+    "| Fear of death | + | + |\n"
+    "| **Total** | 1 | 1 |\n"
+)
+
+PROSE_ANALYSIS = (
+    "### Analysis\n\n"
+    "Analysis of the rubrics shows Aconite covering the sudden fear of death, "
+    "while Arsenicum covers the restlessness and anxiety worse after midnight.\n"
+)
+
+
+def stream(guard: StreamGuard, text: str, chunk: int) -> str:
+    out = [guard.feed(text[i:i + chunk]) for i in range(0, len(text), chunk)]
+    out.append(guard.flush())
+    return "".join(out)
+
+
+@pytest.mark.parametrize("line", [
+    "### Analysis",
+    "## Step 4: Brief Analysis (after the table)",
+    "**Analysis**",
+    "**Analysis:** Aconite covers the fear.",
+    "**Brief Analysis**:",
+])
+def test_analysis_start_matches_headings_and_bold_labels(line):
+    assert ANALYSIS_START.match(line)
+
+
+@pytest.mark.parametrize("line", [
+    "Analysis of the rubrics shows Aconite first.",
+    "Analysis: Aconite covers the fear.",
+    "**Aconite** leads the analysis.",
+])
+def test_analysis_start_ignores_prose(line):
+    assert not ANALYSIS_START.match(line)
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 50])
+def test_prose_starting_with_analysis_is_not_cut(chunk):
+    answer = TABLE + "\n" + PROSE_ANALYSIS
+    guard = StreamGuard(max_tokens=2048)
+    assert stream(guard, answer, chunk) == answer
+    assert guard.stop_reason is None
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 50])
+def test_repeated_analysis_heading_is_cut(chunk):
+    answer = TABLE + "\n" + PROSE_ANALYSIS
+    guard = StreamGuard(max_tokens=2048)
+    delivered = stream(guard, answer + "\n### Analysis\n\nAgain.\n", chunk)
+    assert guard.stop_reason == "repeated analysis"
+    assert delivered.rstrip() == answer.rstrip()
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 50])
+def test_repeated_table_is_cut(chunk):
+    guard = StreamGuard(max_tokens=2048)
+    delivered = stream(guard, TABLE + "\n" + TABLE, chunk)
+    assert guard.stop_reason == "repeated table"
+    assert delivered.rstrip() == TABLE.rstrip()
+
+
+def test_parser_keeps_first_word_of_prose_analysis():
+    table = parse_table(TABLE + "\n" + PROSE_ANALYSIS)
+    assert table["analysis"].startswith("Analysis of the rubrics shows")
+
+
+def test_parser_strips_bold_label():
+    table = parse_table(TABLE + "\n**Analysis:** Aconite covers the fear.\n")
+    assert table["analysis"] == "Aconite covers the fear."
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 50])
+def test_sections_after_analysis_are_kept(chunk):
+    answer = (
+        TABLE + "\n" + PROSE_ANALYSIS
+        + "\n### Remedies to consider\n\nAconite, then Arsenicum.\n"
+        + "\n### Disclaimer\n\nRepertorization is a clinical aid, not a final prescription.\n"
+    )
+    guard = StreamGuard(max_tokens=2048)
+    assert stream(guard, answer, chunk) == answer
+    assert guard.stop_reason is None
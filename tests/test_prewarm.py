@@ -0,0 +1,63 @@
+"""
+Tests for cache prewarming.
+"""
+from datetime import datetime
+
+import pytest
+
+# api.services imports the RAG service, which needs the full dependency set
+pytest.importorskip("langchain_chroma")
+
+from api.services import prewarm  # noqa: E402
+from api.services.cache_backends import MemoryBackend  # noqa: E402
+from api.services.cache_service import QueryCache  # noqa: E402
+
+
+class FakeRAGService:
+    def __init__(self):
+        self.asked = []
+
+    def query(self, question, **kwargs):
+        self.asked.append(question)
+        return {
+            "id": str(len(self.asked)),
+            "question": question,
+            "answer": "Aconite",
+            "citations": [],
+            "sources_used": [],
+            "processing_time_ms": 1,
+            "metadata": {"usage": {"prompt_tokens": 100, "completion_tokens": 20}},
+        }
+
+
+def candidate(question: str) -> prewarm.PrewarmCandidate:
+    return prewarm.PrewarmCandidate(question, prewarm.normalize_query(question), 1, datetime.utcnow(), 1.0)
+
+
+def test_coverage_questions_exclude_answers_already_cached(monkeypatch):
+    cache = QueryCache(backend=MemoryBackend(10, 10 ** 6, 1))
+    monkeypatch.setattr(prewarm, "query_cache", cache)
+    rag = FakeRAGService()
+    cache.set("Fear of death", rag.query("Fear of death"), None, prewarm.api_config.ANSWER_MODE)
+    rag.asked.clear()
+
+    report = prewarm.run_prewarm(rag, [candidate("Fear of death"), candidate("Thirst at night")], 1, 10 ** 6)
+
+    assert rag.asked == ["Thirst at night"]
+    assert report["warmed"] == 1 and report["already_warm"] == 1
+    assert report["warm_questions"] == ["thirst at night"]
+    assert report["tokens_used"] == 120
+    cache.close()
+
+
+def test_prewarm_lookups_are_not_counted_in_cache_stats(monkeypatch):
+    cache = QueryCache(backend=MemoryBackend(10, 10 ** 6, 1))
+    monkeypatch.setattr(prewarm, "query_cache", cache)
+    rag = FakeRAGService()
+    cache.set("Fear of death", rag.query("Fear of death"), None, prewarm.api_config.ANSWER_MODE)
+
+    prewarm.run_prewarm(rag, [candidate("Fear of death"), candidate("Thirst at night")], 1, 10 ** 6)
+
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"]) == (0, 0)
+    cache.close()
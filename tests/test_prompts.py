@@ -0,0 +1,45 @@
+"""
+Tests for composing the system prompt from the books in the context.
+"""
+import re
+
+from src.prompts import ALL_SECTIONS, build_analysis_system_prompt, build_system_prompt
+
+
+def rules(prompt: str):
+    return [int(n) for n in re.findall(r"(?m)^(\d+)\. ", prompt)]
+
+
+def test_full_prompt_describes_every_book():
+    prompt = build_system_prompt(ALL_SECTIONS)
+    assert "from seven homeopathic reference texts" in prompt
+    assert re.findall(r"### (\d)\. ", prompt) == [str(n) for n in range(1, 8)]
+    assert "Body Language Repertory (Book 6)" in prompt
+    assert (
+        "- **Mental and emotional symptoms** — use the Mind Rubric Dictionary (Book 5) "
+        "to map patient descriptions to correct rubric terms\n"
+    ) in prompt
+    assert rules(prompt) == list(range(1, 9))
+
+
+def test_book_references_follow_the_included_sections():
+    prompt = build_system_prompt(frozenset({"phatak_repertory", "mind_rubric_dictionary"}))
+    assert "from two homeopathic reference texts" in prompt
+    assert "### 2. Mind Rubric Interpretation Dictionary" in prompt
+    assert "Mind Rubric Dictionary (Book 2)" in prompt
+    assert "Book 5" not in prompt
+    assert "Body Language" not in prompt and "Synthesis" not in prompt
+    assert "**Mental and emotional symptoms**" in prompt
+    assert rules(prompt) == list(range(1, 7))
+
+
+def test_symptom_priority_stays_without_its_book():
+    prompt = build_system_prompt(frozenset({"phatak_repertory"}))
+    assert "- **Mental and emotional symptoms**\n" in prompt
+    assert "Mind Rubric" not in prompt
+
+
+def test_analysis_prompt_counts_a_single_book():
+    prompt = build_analysis_system_prompt(frozenset({"phatak_repertory"}))
+    assert "from one homeopathic reference text." in prompt
+    assert "### 1. Phatak's Repertory" in prompt
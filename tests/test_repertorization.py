@@ -0,0 +1,65 @@
+"""
+Tests for rubric parsing and symptom matching in the local repertorization.
+"""
+from langchain_core.documents import Document
+
+from src.context_assembler import AssembledContext, ContextBlock
+from src.repertorization import build_table, parse_rubrics
+
+PHATAK = (
+    "--- Page 175 ---\n"
+    "FEAR, anxiety, fright: Abro+;\n"
+    "ACO; ARS; Bell.\n"
+    "Alone, of being+: Ant-t; Con;\n"
+    "Naj.\n"
+    "¢ Lest, he injures himself: Ars;\n"
+    "Merc; Nat-s.\n"
+    "Others, for: Ars; Cocl; Pho;\n"
+    "Sul.\n"
+)
+
+FREDRICK = (
+    "MIND  FEAR\n"
+    " alone, of being: (3) acon. ARS. Phos. > neglected\n"
+    ". evening: (2) brom. dros.\n"
+    ".lest\n"
+    "he die: (3) Argn. ARS. Phos.\n"
+    " die\n"
+    ". about to die; one was: (2) ACON. ars.\n"
+)
+
+
+def test_phatak_sub_rubrics_keep_their_parent():
+    names = [rubric.name for rubric in parse_rubrics(PHATAK, "Phatak")]
+    assert names == [
+        "FEAR, anxiety, fright",
+        "FEAR, Alone, of being",
+        "FEAR, Alone, of being, Lest, he injures himself",
+        "FEAR, Others, for",
+    ]
+
+
+def test_fredrick_sub_rubrics_keep_their_parent():
+    rubrics = parse_rubrics(FREDRICK, "Fredrick")
+    assert [rubric.name for rubric in rubrics] == [
+        "MIND FEAR, alone, of being",
+        "MIND FEAR, alone, of being, evening",
+        "MIND FEAR, alone, of being, lest he die",
+        "MIND FEAR, die, about to die; one was",
+    ]
+    assert rubrics[0].remedies == {"acon": 1, "ars": 3, "phos": 2}
+
+
+def _table(question: str, text: str, book: str):
+    doc = Document(page_content=text, metadata={"book_name": book})
+    return build_table(question, AssembledContext([ContextBlock(text, [doc], 0, 0.1)], [doc]))
+
+
+def test_one_shared_word_does_not_match_a_rubric():
+    # "FEAR, Others, for" shares only "fear" with the symptom
+    assert _table("fear of death", PHATAK, "Phatak") is None
+
+
+def test_table_rows_name_the_matched_rubric():
+    table = _table("fear of being alone", PHATAK, "Phatak")
+    assert "| Fear of being alone (FEAR, Alone, of being) |" in table.to_markdown()
@@ -0,0 +1,136 @@
+"""
+Tests for continuing a stream that breaks part-way through.
+
+RemedyChain streams against a local fake provider (an httpx transport
+serving SSE) whose first stream drops mid-answer. The next key is asked
+to continue from the partial answer and may honour the prefill, restart
+the answer or repeat its last words.
+"""
+import json
+from typing import Dict, List
+
+import httpx
+import pytest
+
+from src.config import config
+from src.llm_chain import OpenRouterKeyManager, RemedyChain
+from src.llm_client import LLMClientPool
+from src.stream_continuation import ContinuationFilter
+
+ANSWER = (
+    "Aconite covers the sudden fear of death with restlessness. "
+    "Arsenicum follows for the midnight aggravation and anxious thirst. "
+    "Consider Aconite first, keeping the full totality in view."
+)
+DROP_AFTER = 7  # Chunks delivered before the first stream is cut
+
+
+def chunks(text: str, size: int = 9) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class DroppingProvider:
+    """
+    Fake chat completions API whose first stream drops mid-answer.
+
+    Later requests answer according to `continuation`:
+    "prefill" continues right after the partial answer, "restart" sends
+    the whole answer again and "overlap" repeats the last words of the
+    partial answer before continuing.
+    """
+
+    def __init__(self, continuation: str):
+        self.continuation = continuation
+        self.requests: List[Dict] = []
+
+    def _answer(self, messages: List[Dict[str, str]]) -> str:
+        if messages[-1]["role"] != "assistant":
+            return ANSWER
+        prefill = messages[-1]["content"]
+        assert ANSWER.startswith(prefill)
+        if self.continuation == "restart":
+            return ANSWER
+        if self.continuation == "overlap":
+            return ANSWER[len(prefill) - 25:]
+        return ANSWER[len(prefill):]
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        self.requests.append(payload)
+        text = self._answer(payload["messages"])
+        drop = len(self.requests) == 1
+
+        async def body():
+            for idx, chunk in enumerate(chunks(text)):
+                if drop and idx == DROP_AFTER:
+                    raise httpx.ReadError("connection dropped")
+                event = {"choices": [{"index": 0, "delta": {"content": chunk}}]}
+                yield f"data: {json.dumps(event)}\n\n".encode()
+            yield b"data: [DONE]\n\n"
+
+        return httpx.Response(200, headers={"Content-Type": "text/event-stream"}, content=body())
+
+
+@pytest.fixture
+def chain_for(monkeypatch):
+    monkeypatch.setenv("USE_OPENROUTER", "true")
+    monkeypatch.setenv("OPENROUTER_API_KEY", "key-a")
+    monkeypatch.setenv("OPENROUTER_API_KEYS", "key-a,key-b")
+    monkeypatch.delenv("OPENROUTER_FALLBACK_MODELS", raising=False)
+    monkeypatch.setattr(config, "LLM_HEDGE_ENABLED", False)
+    monkeypatch.setattr(config, "STREAM_GUARD_ENABLED", False)
+    chains = []
+
+    def build(provider: DroppingProvider) -> RemedyChain:
+        chain = RemedyChain(LLMClientPool(httpx.MockTransport(provider.handler)))
+        chains.append(chain)
+        return chain
+
+    yield build
+    for chain in chains:
+        chain.clients.close()
+
+
+@pytest.mark.parametrize("continuation", ["prefill", "restart", "overlap"])
+def test_dropped_stream_is_continued_without_repeating_text(chain_for, continuation):
+    provider = DroppingProvider(continuation)
+    chain = chain_for(provider)
+    usage: Dict = {}
+
+    streamed = list(chain.generate_response_streaming("fear of death", "FEAR, death, of: Acon.", usage=usage))
+
+    assert "".join(streamed) == ANSWER
+    assert len(provider.requests) == 2
+    partial = "".join(chunks(ANSWER)[:DROP_AFTER])
+    assert provider.requests[1]["messages"][-1] == {"role": "assistant", "content": partial.rstrip()}
+    assert usage["continuations"] == 1
+
+
+@pytest.mark.parametrize(
+    "partial, continuation, expected, repeated",
+    [
+        ("Fear of death. ", "Restless at night.", "Restless at night.", 0),
+        ("Fear of death. ", "Fear of death. Restless at night.", "Restless at night.", 15),
+        ("Fear of death, worse at night when alone ", "worse at night when alone, with thirst.", ", with thirst.", 25),
+        # Overlaps shorter than MIN_OVERLAP_CHARS may be a coincidence and are kept
+        ("Fear of death, worse at night ", "at night and alone.", "at night and alone.", 0),
+        ("Fear of death.", "Fear of death.", "", 14),
+    ],
+)
+def test_continuation_filter_trims_repeated_text(partial, continuation, expected, repeated):
+    echo = ContinuationFilter(partial)
+    out = "".join(echo.feed(chunk) for chunk in chunks(continuation, 4)) + echo.flush()
+    assert out == expected
+    assert echo.repeated_chars == repeated
+
+
+def test_usage_names_model_and_key_when_stream_is_closed_early(chain_for):
+    chain = chain_for(DroppingProvider("prefill"))
+    usage: Dict = {}
+
+    tokens = chain.generate_response_streaming("fear of death", "FEAR, death, of: Acon.", usage=usage)
+    next(tokens)
+    tokens.close()  # As the output guard or a disconnecting client does
+
+    assert usage["model"] == config.OPENROUTER_MODEL
+    assert usage["key"] in {OpenRouterKeyManager.redact("key-a"), OpenRouterKeyManager.redact("key-b")}
@@ -0,0 +1,41 @@
+"""
+Tests for packing context into a model's input token budget.
+"""
+from langchain_core.documents import Document
+
+from src.context_assembler import AssembledContext, ContextBlock
+from src.token_budget import TokenBudgetPlanner
+
+
+def block(book: str, text: str, rank: int) -> ContextBlock:
+    doc = Document(page_content=text, metadata={"book_name": book, "citation": book})
+    return ContextBlock(text, [doc], rank, 0.1 * rank)
+
+
+def test_pack_keeps_only_documents_of_packed_blocks():
+    small = block("Phatak", "Fear of death.", 0)
+    large = block("Fedrick", "Restlessness at night. " * 200, 1)
+    assembled = AssembledContext([small, large], small.documents + large.documents, {})
+    planner = TokenBudgetPlanner("{context}\n{question}", model_budgets={"m": 100}, max_output_tokens=10)
+
+    packed = planner.pack("fear", assembled, "m")
+
+    assert packed.blocks == [small]
+    assert packed.stats["budget"]["blocks_dropped"] == 1
+    assert packed.documents == small.documents
+
+
+def test_pack_counts_per_request_text_and_template_placeholders():
+    fear = block("Phatak", "Fear of death. " * 10, 0)
+    assembled = AssembledContext([fear], fear.documents, {})
+    planner = TokenBudgetPlanner("{context}\n{question}", model_budgets={"m": 100}, max_output_tokens=10)
+    template = "Analysis.\n{table}\n{rubrics}\n{context}"
+
+    assert planner.pack("fear", assembled, "m", static_prompt=template).blocks == [fear]
+
+    # The table leaves no room for context
+    packed = planner.pack("fear", assembled, "m", static_prompt=template, extra_text="| Fear | + |\n" * 40)
+    budget = packed.stats["budget"]
+    assert budget["static_prompt_tokens"] == planner.count_static("Analysis.\n\n\n", "m")
+    assert budget["extra_tokens"] > 100
+    assert packed.blocks == []